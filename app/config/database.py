@@ -1,12 +1,40 @@
+import importlib
+import os
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
+# Modules defining models, imported by load_models()
+MODEL_MODULES = ('app.models.user', 'app.models.device')
+
+def load_models():
+    """Import every model, so that all tables are created and relationships between models resolve"""
+    for module in MODEL_MODULES:
+        importlib.import_module(module)
+
 def init_db(app):
     """Initialize the database with the app"""
+    load_models()
     db.init_app(app)
     
     # Create tables if they don't exist
     with app.app_context():
-        db.create_all() 
\ No newline at end of file
+        # A partitioned readings table has to exist before create_all() would create a plain one
+        from app.services.partitions import reading_partitions
+        reading_partitions.create_parent()
+        db.create_all()
+        
+        # create_all() skips tables that already exist, so add indexes introduced since
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+
+def create_db_app(name):
+    """Create a Flask app with only the database configured, for processes that serve no requests"""
+    app = Flask(name)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///iot_controller.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_db(app)
+    return app
@@ -1,9 +1,19 @@
 import paho.mqtt.client as mqtt
-import json
 import os
+import socket
 from dotenv import load_dotenv
-from flask import current_app
-from flask_socketio import emit
+from app.services.archive import reading_archive
+from app.services.commands import command_tracker, MQTT_COMMAND_QOS
+from app.services.device_registry import device_registry
+from app.services.dispatcher import MessageDispatcher
+from app.services.ingestion import ingestor
+from app.services.realtime import emission_scheduler
+from app.services.recent_readings import RECENT_READINGS_ENABLED, recent_readings
+from app.services.retention import retention_purger
+from app.services.spool import ingest_spool
+from app.services.stats import dashboard_stats
+from app.services.status_buffer import status_buffer
+from app.utils import codec
 
 # Load environment variables
 load_dotenv()
@@ -15,32 +25,96 @@ MQTT_USERNAME = os.getenv('MQTT_USERNAME', '')
 MQTT_PASSWORD = os.getenv('MQTT_PASSWORD', '')
 MQTT_KEEPALIVE = int(os.getenv('MQTT_KEEPALIVE', 60))
 MQTT_CLIENT_ID = os.getenv('MQTT_CLIENT_ID', 'iot_controller_server')
+# Shared subscription group for status and telemetry; processes in the same group split the messages
+MQTT_SHARED_GROUP = os.getenv('MQTT_SHARED_GROUP', '')
+# Whether this process writes status and telemetry to the database
+MQTT_INGEST = os.getenv('MQTT_INGEST', 'true').lower() in ('1', 'true', 'yes')
+# Whether this process subscribes to status and telemetry at all (off when an ingest service emits UI events)
+MQTT_DEVICE_EVENTS = os.getenv('MQTT_DEVICE_EVENTS', 'true').lower() in ('1', 'true', 'yes')
 
-# Create MQTT client
-mqtt_client = mqtt.Client(client_id=MQTT_CLIENT_ID)
+# Flask app the MQTT callbacks run against, set by init_mqtt()
+_app = None
+# Whether handled messages are written to the database and emitted to Socket.IO clients
+_ingest = True
+_realtime = False
+# On-disk spool status and telemetry go through before the database, when enabled
+_spool = None
 
-# Set username and password if provided
-if MQTT_USERNAME and MQTT_PASSWORD:
-    mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+# MQTT client and its subscriptions, created by connect_mqtt()
+mqtt_client = None
+_topics = []
+
+def unique_client_id(prefix=MQTT_CLIENT_ID):
+    """Build a client ID no other process will use, so connections do not take each other over"""
+    return f"{prefix}-{socket.gethostname()}-{os.getpid()}"
+
+def subscription_topics(shared_group=MQTT_SHARED_GROUP, ingest=True, responses=True, device_events=True):
+    """Topics to subscribe to, optionally suffixed with the payload format (e.g. devices/x/telemetry/msgpack)
+
+    Status and telemetry go through the shared group when one is set, so the broker
+    delivers each message to one member. Responses are always subscribed directly
+    because only the process that sent a command can match its response.
+    """
+    topics = []
+    prefix = f"$share/{shared_group}/" if shared_group and ingest else ''
+    for message_type in ('status', 'telemetry') if device_events else ():
+        topics.append(f"{prefix}devices/+/{message_type}")
+        topics.append(f"{prefix}devices/+/{message_type}/+")
+    if responses:
+        topics.append("devices/+/response")
+        topics.append("devices/+/response/+")
+    return topics
 
 # MQTT callback functions
 def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the broker"""
     print(f"Connected to MQTT broker with result code {rc}")
     
-    # Subscribe to topics
-    client.subscribe("devices/+/status")
-    client.subscribe("devices/+/telemetry")
-    client.subscribe("devices/+/response")
+    for topic in _topics:
+        client.subscribe(topic)
 
 def on_message(client, userdata, msg):
     """Callback for when a message is received from the broker"""
-    try:
-        topic = msg.topic
-        payload = json.loads(msg.payload.decode())
-        handle_mqtt_message(topic, payload)
-    except Exception as e:
-        print(f"Error processing MQTT message: {e}")
+    # Hand off to the worker pool keyed by device so the network thread never blocks on handling
+    topic = msg.topic
+    if spool_message(topic, msg.payload):
+        return
+    
+    topic_parts = topic.split('/')
+    key = topic_parts[1] if len(topic_parts) >= 2 else topic
+    dispatcher.submit(key, topic, msg.payload)
+
+def spool_message(topic, raw_payload):
+    """Append status and telemetry to the on-disk spool when it is enabled, returning whether it was spooled"""
+    if _spool is None:
+        return False
+    topic_parts = topic.split('/')
+    if len(topic_parts) < 3 or topic_parts[2] not in ('status', 'telemetry'):
+        return False
+    # Status and telemetry are spooled to disk first so a slow database cannot lose them
+    _spool.append(topic, raw_payload)
+    return True
+
+def payload_format_for(topic):
+    """Resolve the wire format of a message from its topic suffix or the device's metadata"""
+    topic_parts = topic.split('/')
+    if len(topic_parts) >= 4 and topic_parts[3] in codec.PAYLOAD_FORMATS:
+        return topic_parts[3]
+    info = device_registry.get(topic_parts[1]) if len(topic_parts) >= 2 else None
+    if info is not None and info.payload_format in codec.PAYLOAD_FORMATS:
+        return info.payload_format
+    # Unknown devices are detected from the payload itself
+    return None
+
+def process_message(topic, raw_payload):
+    """Decode a raw MQTT payload and handle it, called on a dispatcher worker"""
+    payload = codec.decode_payload(raw_payload, payload_format_for(topic))
+    handle_mqtt_message(topic, payload)
+
+def commit_ingested():
+    """Write everything handled so far to the database, raising if it could not be written"""
+    ingestor.flush()
+    status_buffer.flush()
 
 def handle_mqtt_message(topic, payload):
     """Process incoming MQTT messages"""
@@ -50,47 +124,144 @@ def handle_mqtt_message(topic, payload):
         device_id = topic_parts[1]
         message_type = topic_parts[2]
         
-        # Update device status in database if it's a status message
-        if message_type == 'status':
-            from app.models.device import Device
-            from app.config.database import db
+        if _ingest:
+            # Buffer device status for the next batched write
+            if message_type == 'status' and device_registry.get(device_id) is not None:
+                status = payload.get('status', 'offline')
+                status_buffer.update(device_id, status, payload.get('timestamp') or payload.get('last_seen'))
+                dashboard_stats.set_status(device_id, status)
             
-            with current_app.app_context():
-                device = Device.query.filter_by(device_id=device_id).first()
-                if device:
-                    device.status = payload.get('status', 'offline')
-                    device.last_seen = payload.get('timestamp')
-                    db.session.commit()
+            # Queue telemetry readings for batched insertion
+            elif message_type == 'telemetry':
+                ingestor.submit(device_id, payload)
         
-        # Emit message to connected clients via WebSocket
-        if message_type in ['status', 'telemetry', 'response']:
-            socketio_event = f"device_{message_type}"
-            emit(socketio_event, {'device_id': device_id, 'data': payload}, namespace='/', broadcast=True)
+        # Emit message to the clients subscribed to this device or its owner.
+        # Command responses go out immediately, status and telemetry are coalesced.
+        if message_type == 'response':
+            command_tracker.resolve(device_id, payload)
+            emission_scheduler.emit_now('device_response', device_id, payload)
+        elif message_type in ['status', 'telemetry'] and _realtime:
+            emission_scheduler.schedule(f"device_{message_type}", device_id, payload)
 
-def publish_command(device_id, command, params=None):
-    """Publish a command to a device"""
+def publish_command(device_id, command, params=None, qos=MQTT_COMMAND_QOS):
+    """Publish a command to a device, returning its command ID or None if it could not be sent"""
     if params is None:
         params = {}
     
+    # Track the command so the device's response can be matched to it
+    pending = command_tracker.create(device_id, command, params)
+    
     topic = f"devices/{device_id}/command"
     payload = {
+        "command_id": pending.command_id,
         "command": command,
         "params": params
     }
     
-    mqtt_client.publish(topic, json.dumps(payload))
-    return True
+    # Encode the command in the format the device negotiated
+    info = device_registry.get(device_id)
+    payload_format = info.payload_format if info is not None else 'json'
+    
+    if mqtt_client is None:
+        command_tracker.fail(pending.command_id, 'MQTT client is not connected')
+        return None
+    
+    result = mqtt_client.publish(topic, codec.encode_payload(payload, payload_format), qos=qos)
+    if result.rc != mqtt.MQTT_ERR_SUCCESS:
+        command_tracker.fail(pending.command_id, mqtt.error_string(result.rc))
+        return None
+    return pending.command_id
+
+# Worker pool between paho's network thread and handle_mqtt_message
+dispatcher = MessageDispatcher(process_message)
+
+def create_client(client_id=None, topics=None):
+    """Create an MQTT client that subscribes to `topics` whenever it connects"""
+    global _topics
+    _topics = topics if topics is not None else subscription_topics()
+    
+    # A fixed client ID is only safe when one process connects; shared subscribers need their own
+    if client_id is None:
+        client_id = unique_client_id() if MQTT_SHARED_GROUP else MQTT_CLIENT_ID
+    client = mqtt.Client(client_id=client_id)
+    
+    # Set username and password if provided
+    if MQTT_USERNAME and MQTT_PASSWORD:
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+    
+    # Set up callbacks
+    client.on_connect = on_connect
+    client.on_message = on_message
+    return client
+
+def connect_mqtt(client_id=None, topics=None):
+    """Create the MQTT client, connect to the broker and start its network loop"""
+    global mqtt_client
+    mqtt_client = create_client(client_id, topics)
+    
+    # Try to connect to broker
+    try:
+        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
+        mqtt_client.loop_start()  # Start network loop in background thread
+    except Exception as e:
+        print(f"Failed to connect to MQTT broker: {e}")
+    return mqtt_client
+
+def init_ingestion(app, socketio=None, ingest=MQTT_INGEST):
+    """Bind message handling to the Flask app and start the write-behind buffers, spool, archiver and purger"""
+    global _app, _ingest, _realtime, _spool
+    _app = app
+    _ingest = ingest
+    _realtime = socketio is not None
+    device_registry.warm(app)
+    if ingest:
+        ingestor.init_app(app)
+        status_buffer.init_app(app)
+        if ingest_spool is not None:
+            ingest_spool.open()
+            ingest_spool.start(process_message, commit_ingested)
+            _spool = ingest_spool
+        # Old readings are archived and expired ones purged by the one ingesting process holding the maintenance lock
+        reading_archive.init_app(app)
+        retention_purger.init_app(app)
+    if socketio is not None:
+        emission_scheduler.init_app(socketio)
+
+def stop_ingestion():
+    """Write out everything received and stop the write-behind buffers"""
+    if _spool is not None:
+        _spool.stop()
+    if _ingest:
+        ingestor.stop()
+        status_buffer.stop()
+
+def init_mqtt(app, socketio=None, ingest=MQTT_INGEST, shared_group=MQTT_SHARED_GROUP, client_id=None,
+              responses=True, device_events=MQTT_DEVICE_EVENTS):
+    """Bind MQTT message handling to the Flask app, start the write-behind buffers and connect
 
-# Set up callbacks
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
+    With `ingest` off the process still receives every status and telemetry
+    message for its Socket.IO clients but leaves the database writes to
+    ingestion workers. With `device_events` off it only subscribes to command
+    responses, for when an ingestion service publishes the UI events.
+    """
+    init_ingestion(app, socketio, ingest)
+    # Recent readings can only be answered from memory by a process that writes all of them. Nothing
+    # here can tell whether other web workers also ingest or take readings over HTTP, so it is opt-in
+    if RECENT_READINGS_ENABLED:
+        if ingest and not shared_group:
+            recent_readings.enable()
+        else:
+            print("RECENT_READINGS_ENABLED is ignored by a process that does not ingest every message")
+    dispatcher.start()
+    connect_mqtt(client_id, subscription_topics(shared_group, ingest, responses, device_events))
 
-# Try to connect to broker
-try:
-    mqtt_client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
-    mqtt_client.loop_start()  # Start network loop in background thread
-except Exception as e:
-    print(f"Failed to connect to MQTT broker: {e}")
+def stop_mqtt():
+    """Disconnect from the broker and write out everything received"""
+    if mqtt_client is not None:
+        mqtt_client.disconnect()
+        mqtt_client.loop_stop()
+    dispatcher.stop()
+    stop_ingestion()
 
 def get_mqtt_client():
     """Return the MQTT client instance"""
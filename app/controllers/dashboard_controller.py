@@ -1,45 +1,60 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, redirect, url_for
 from flask_login import login_required, current_user
-from app.models.device import Device, Sensor, SensorReading
+from app.models.device import Device, Sensor, RetentionPolicy
 from app.config.database import db
+from app.config.mqtt_client import dispatcher
+from app.services.archive import reading_archive
+from app.services.downsampling import CHART_DOWNSAMPLING, DOWNSAMPLING_METHODS, chart_points, downsample
+from app.services.ingestion import ingestor
+from app.services.partitions import reading_partitions
+from app.services.realtime import emission_scheduler
+from app.services.recent_readings import recent_readings
+from app.services.retention import retention_purger, RETENTION_FIELDS
+from app.services.rollups import RESOLUTIONS, ROLLUP_MAX_POINTS, choose_resolutions, rollup_columns
+from app.services.spool import ingest_spool
+from app.services.stats import dashboard_stats
+from app.services.status_buffer import status_buffer
+from app.utils.pagination import DEVICE_PAGE_SIZE, decode_cursor, keyset_page
 from datetime import datetime, timedelta
-from sqlalchemy import func
+import numpy as np
 
 # Create blueprint
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
+# Chart arrays of a sensor with nothing in the requested range
+NO_DATA = (np.empty(0, np.int64),) + (np.empty(0, np.float64),) * 3
+
 @dashboard_bp.route('/')
 @login_required
 def index():
     """Main dashboard view"""
-    # Get device counts
+    # Device counts come from the in-memory dashboard counters
+    stats = dashboard_stats.get(None if current_user.is_admin else current_user.id)
+    
     if current_user.is_admin:
-        total_devices = Device.query.count()
-        online_devices = Device.query.filter_by(status='online').count()
-        offline_devices = Device.query.filter_by(status='offline').count()
         recent_devices = Device.query.order_by(Device.created_at.desc()).limit(5).all()
     else:
-        total_devices = Device.query.filter_by(user_id=current_user.id).count()
-        online_devices = Device.query.filter_by(user_id=current_user.id, status='online').count()
-        offline_devices = Device.query.filter_by(user_id=current_user.id, status='offline').count()
         recent_devices = Device.query.filter_by(user_id=current_user.id).order_by(Device.created_at.desc()).limit(5).all()
     
     return render_template('dashboard/index.html', 
-                           total_devices=total_devices,
-                           online_devices=online_devices,
-                           offline_devices=offline_devices,
+                           total_devices=stats['device_count']['total'],
+                           online_devices=stats['device_count']['online'],
+                           offline_devices=stats['device_count']['offline'],
                            recent_devices=recent_devices)
 
 @dashboard_bp.route('/devices')
 @login_required
 def devices():
-    """Dashboard devices view"""
-    if current_user.is_admin:
-        devices = Device.query.all()
-    else:
-        devices = Device.query.filter_by(user_id=current_user.id).all()
+    """Dashboard devices view, a page at a time"""
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return redirect(url_for('dashboard.devices'))
+    
+    query = Device.query if current_user.is_admin else Device.query.filter_by(user_id=current_user.id)
+    devices, next_cursor = keyset_page(query, Device.created_at, Device.id, cursor, DEVICE_PAGE_SIZE)
     
-    return render_template('dashboard/devices.html', devices=devices)
+    return render_template('dashboard/devices.html', devices=devices, next_cursor=next_cursor)
 
 @dashboard_bp.route('/analytics')
 @login_required
@@ -64,48 +79,9 @@ def alerts():
 @login_required
 def api_stats():
     """API endpoint to get dashboard statistics"""
-    # Prepare filter based on user role
-    if current_user.is_admin:
-        device_filter = {}
-    else:
-        device_filter = {'user_id': current_user.id}
-    
-    # Get device counts
-    total_devices = Device.query.filter_by(**device_filter).count()
-    online_devices = Device.query.filter_by(status='online', **device_filter).count()
-    offline_devices = Device.query.filter_by(status='offline', **device_filter).count()
-    
-    # Get sensor count
-    sensor_count = Sensor.query.join(Device).filter(Device.user_id == current_user.id if not current_user.is_admin else True).count()
-    
-    # Get reading count from last 24 hours
-    day_ago = datetime.utcnow() - timedelta(days=1)
-    reading_count = SensorReading.query.join(Sensor).join(Device).filter(
-        SensorReading.timestamp > day_ago,
-        Device.user_id == current_user.id if not current_user.is_admin else True
-    ).count()
-    
-    # Get device type distribution
-    device_types = db.session.query(
-        Device.device_type, 
-        func.count(Device.id)
-    ).filter_by(**device_filter).group_by(Device.device_type).all()
-    
-    device_type_data = {
-        'labels': [t[0] for t in device_types],
-        'data': [t[1] for t in device_types]
-    }
-    
-    return jsonify({
-        'device_count': {
-            'total': total_devices,
-            'online': online_devices,
-            'offline': offline_devices
-        },
-        'sensor_count': sensor_count,
-        'reading_count': reading_count,
-        'device_types': device_type_data
-    })
+    # Counters kept up to date by device routes, status messages and reading writes,
+    # so answering costs no queries however many devices and readings there are
+    return jsonify(dashboard_stats.get(None if current_user.is_admin else current_user.id))
 
 @dashboard_bp.route('/api/recent-activity')
 @login_required
@@ -123,13 +99,18 @@ def api_recent_activity():
     # Get recent device activity
     recent_devices = Device.query.filter(device_filter).order_by(Device.last_seen.desc()).limit(10).all()
     
-    return jsonify([{
-        'id': device.id,
-        'name': device.name,
-        'device_id': device.device_id,
-        'status': device.status,
-        'last_seen': device.last_seen.isoformat() if device.last_seen else None
-    } for device in recent_devices])
+    # Status updates not yet written by the status buffer are included without flushing it
+    activity = []
+    for device in recent_devices:
+        status, last_seen = device.current_status()
+        activity.append({
+            'id': device.id,
+            'name': device.name,
+            'device_id': device.device_id,
+            'status': status,
+            'last_seen': last_seen.isoformat() if last_seen else None
+        })
+    return jsonify(activity)
 
 @dashboard_bp.route('/api/sensor-data/<int:device_id>')
 @login_required
@@ -145,32 +126,145 @@ def api_sensor_data(device_id):
     hours = request.args.get('hours', 24, type=int)
     time_threshold = datetime.utcnow() - timedelta(hours=hours)
     
-    # Get sensors for this device
-    sensors = Sensor.query.filter_by(device_id=device.id).all()
+    # Points per chart, and the resolution to draw them at ('auto' picks one that fits)
+    max_points = request.args.get('max_points', ROLLUP_MAX_POINTS, type=int)
+    requested = request.args.get('resolution', 'auto')
+    if requested != 'auto' and requested != 'raw' and requested not in RESOLUTIONS:
+        return jsonify({'error': f'Invalid resolution: {requested}'}), 400
+    
+    # Series longer than max_points are downsampled, so the payload stays bounded however long the range
+    max_points = chart_points(max_points)
+    method = request.args.get('downsample', CHART_DOWNSAMPLING)
+    if method not in DOWNSAMPLING_METHODS:
+        return jsonify({'error': f'Invalid downsample: {method}'}), 400
+    
+    # Get sensors for this device, as plain tuples
+    sensors = db.session.query(Sensor.id, Sensor.name, Sensor.sensor_type, Sensor.unit).filter(
+        Sensor.device_id == device.id
+    ).order_by(Sensor.id).all()
+    sensor_ids = [sensor.id for sensor in sensors]
+    
+    # Pick each sensor's resolution, then read every resolution's data for all its sensors at once
+    if requested == 'auto':
+        resolutions = choose_resolutions(sensor_ids, time_threshold, max_points=max_points) if sensor_ids else {}
+    else:
+        resolutions = dict.fromkeys(sensor_ids, requested)
+    
+    columns = {}
+    for resolution in set(resolutions.values()):
+        resolution_ids = [sensor_id for sensor_id in sensor_ids if resolutions[sensor_id] == resolution]
+        if resolution == 'raw':
+            # Readings from memory, the database and the archive
+            columns[resolution] = recent_readings.columns(resolution_ids, time_threshold)
+        else:
+            # Bucket averages, with the range of each bucket alongside
+            columns[resolution] = rollup_columns(resolution_ids, resolution, time_threshold)
     
-    # Prepare data for each sensor
+    # Timestamps are epoch milliseconds, converted a whole array at a time
     sensor_data = []
     for sensor in sensors:
-        # Get readings for this sensor within time range
-        readings = SensorReading.query.filter(
-            SensorReading.sensor_id == sensor.id,
-            SensorReading.timestamp > time_threshold
-        ).order_by(SensorReading.timestamp.asc()).all()
+        resolution = resolutions[sensor.id]
+        arrays = columns[resolution].get(sensor.id, NO_DATA)
+        if len(arrays[0]) > max_points:
+            keep = downsample(arrays[0], arrays[1], max_points, method)
+            arrays = tuple(array[keep] for array in arrays)
+        data = {'timestamps': (arrays[0] // 1000).tolist(), 'values': arrays[1].tolist()}
+        if resolution != 'raw':
+            data['min'] = arrays[2].tolist()
+            data['max'] = arrays[3].tolist()
         
-        # Format data for chart
         sensor_data.append({
             'id': sensor.id,
             'name': sensor.name,
             'type': sensor.sensor_type,
             'unit': sensor.unit,
-            'data': {
-                'labels': [reading.timestamp.strftime('%Y-%m-%d %H:%M:%S') for reading in readings],
-                'values': [reading.value for reading in readings]
-            }
+            'resolution': resolution,
+            'data': data
         })
     
     return jsonify(sensor_data)
 
+@dashboard_bp.route('/api/ingestion')
+@login_required
+def api_ingestion_stats():
+    """API endpoint to get telemetry ingestion throughput"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    stats = ingestor.get_stats()
+    stats['status_updates'] = status_buffer.get_stats()
+    stats['dispatcher'] = dispatcher.get_stats()
+    stats['socketio'] = emission_scheduler.get_stats()
+    stats['spool'] = ingest_spool.get_stats() if ingest_spool is not None else None
+    stats['partitions'] = reading_partitions.get_stats()
+    stats['archive'] = reading_archive.get_stats() if reading_archive.enabled else None
+    stats['recent_readings'] = recent_readings.get_stats()
+    stats['dashboard_stats'] = dashboard_stats.get_stats()
+    return jsonify(stats)
+
+@dashboard_bp.route('/api/retention', methods=['GET'])
+@login_required
+def api_get_retention():
+    """API endpoint to get retention policies, defaults and purge statistics"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    policies = RetentionPolicy.query.order_by(RetentionPolicy.id).all()
+    return jsonify({
+        'defaults': {field: default for field, default in RETENTION_FIELDS.values()},
+        'policies': [policy.to_dict() for policy in policies],
+        'purge': retention_purger.get_stats()
+    })
+
+@dashboard_bp.route('/api/retention', methods=['POST'])
+@login_required
+def api_set_retention():
+    """API endpoint to create or replace a retention policy"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json() or {}
+    device_id = data.get('device_id')
+    sensor_type = data.get('sensor_type')
+    
+    # A policy has to say what it applies to; the defaults come from the environment
+    if device_id is None and not sensor_type:
+        return jsonify({'error': 'device_id or sensor_type is required'}), 400
+    if device_id is not None and db.session.get(Device, device_id) is None:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    days = {}
+    for field, _ in RETENTION_FIELDS.values():
+        value = data.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+            return jsonify({'error': f'{field} must be a non-negative integer'}), 400
+        days[field] = value
+    
+    # One policy per target, so posting again replaces it
+    policy = RetentionPolicy.query.filter_by(device_id=device_id, sensor_type=sensor_type).first()
+    created = policy is None
+    if created:
+        policy = RetentionPolicy(device_id=device_id, sensor_type=sensor_type)
+        db.session.add(policy)
+    for field, value in days.items():
+        setattr(policy, field, value)
+    db.session.commit()
+    
+    return jsonify(policy.to_dict()), 201 if created else 200
+
+@dashboard_bp.route('/api/retention/<int:policy_id>', methods=['DELETE'])
+@login_required
+def api_delete_retention(policy_id):
+    """API endpoint to delete a retention policy"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    policy = RetentionPolicy.query.get_or_404(policy_id)
+    db.session.delete(policy)
+    db.session.commit()
+    
+    return jsonify({'message': 'Retention policy deleted successfully'}), 200
+
 @dashboard_bp.route('/api/device-locations')
 @login_required
 def api_device_locations():
@@ -194,7 +288,7 @@ def api_device_locations():
                 'id': device.id,
                 'name': device.name,
                 'device_id': device.device_id,
-                'status': device.status,
+                'status': device.current_status()[0],
                 'lat': float(lat.strip()),
                 'lng': float(lng.strip())
             })
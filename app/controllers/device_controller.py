@@ -1,10 +1,26 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from app.models.device import Device, Sensor, SensorReading
+from app.models.device import Device, Sensor, SensorReading, SensorRollup, DeviceGroup
 from app.config.database import db
 from app.config.mqtt_client import publish_command
-from datetime import datetime
-import json
+from app.services.archive import reading_archive, reading_records
+from app.services.bulk_commands import run_bulk_command, BULK_COMMAND_RATE
+from app.services.commands import command_tracker
+from app.services.device_registry import device_registry
+from app.services.downsampling import CHART_DOWNSAMPLING, DOWNSAMPLING_METHODS, chart_points, downsample
+from app.services.export import EXPORT_FORMATS, export_stream
+from app.services.ingestion import READINGS_BATCH_MAX, parse_timestamp, reading_value
+from app.services.partitions import reading_partitions
+from app.services.recent_readings import recent_readings
+from app.services.rollups import (RESOLUTIONS, apply_rollups, choose_resolution, delete_rollups, rollup_columns,
+                                  rollup_query)
+from app.services.stats import dashboard_stats
+from app.utils import codec
+from app.utils.pagination import (DEVICE_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor,
+                                  keyset_page, page_size)
+from datetime import datetime, timedelta
+from sqlalchemy.orm import defer
+import math
 import uuid
 
 # Create blueprint
@@ -14,13 +30,16 @@ device_bp = Blueprint('device', __name__, url_prefix='/device')
 @device_bp.route('/')
 @login_required
 def index():
-    """Display list of user's devices"""
-    if current_user.is_admin:
-        devices = Device.query.all()
-    else:
-        devices = Device.query.filter_by(user_id=current_user.id).all()
+    """Display list of user's devices, a page at a time"""
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return redirect(url_for('device.index'))
     
-    return render_template('device/index.html', devices=devices)
+    query = Device.query if current_user.is_admin else Device.query.filter_by(user_id=current_user.id)
+    devices, next_cursor = keyset_page(query, Device.created_at, Device.id, cursor, DEVICE_PAGE_SIZE)
+    
+    return render_template('device/index.html', devices=devices, next_cursor=next_cursor)
 
 @device_bp.route('/<int:device_id>')
 @login_required
@@ -67,6 +86,8 @@ def add():
         
         db.session.add(new_device)
         db.session.commit()
+        device_registry.register(new_device)
+        dashboard_stats.track_device(new_device)
         
         flash('Device added successfully.', 'success')
         return redirect(url_for('device.view', device_id=new_device.id))
@@ -94,6 +115,8 @@ def edit(device_id):
         device.firmware_version = request.form.get('firmware_version')
         
         db.session.commit()
+        device_registry.register(device)
+        dashboard_stats.track_device(device)
         
         flash('Device updated successfully.', 'success')
         return redirect(url_for('device.view', device_id=device.id))
@@ -111,8 +134,16 @@ def delete(device_id):
         flash('You do not have permission to delete this device.', 'danger')
         return redirect(url_for('device.index'))
     
+    sensor_ids = [sensor.id for sensor in device.sensors]
+    readings = dashboard_stats.sensor_readings(sensor_ids)
+    reading_partitions.delete_sensors(sensor_ids)
+    delete_rollups(sensor_ids)
     db.session.delete(device)
     db.session.commit()
+    reading_archive.delete_sensors(sensor_ids)
+    recent_readings.discard(sensor_ids)
+    device_registry.unregister(device.device_id)
+    dashboard_stats.forget_device(device.id, readings)
     
     flash('Device deleted successfully.', 'success')
     return redirect(url_for('device.index'))
@@ -154,13 +185,34 @@ def control(device_id):
 @device_bp.route('/api/devices', methods=['GET'])
 @login_required
 def api_get_devices():
-    """API endpoint to get all devices for the user"""
-    if current_user.is_admin:
-        devices = Device.query.all()
-    else:
-        devices = Device.query.filter_by(user_id=current_user.id).all()
-    
-    return jsonify([device.to_dict() for device in devices])
+    """API endpoint to get the user's devices, a page at a time"""
+    limit = page_size(request.args.get('limit', type=int), DEVICE_PAGE_SIZE)
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    fields = None
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in Device.FIELDS]
+        if unknown:
+            return jsonify({'error': f"Invalid fields: {', '.join(unknown)}"}), 400
+    
+    # Oldest first; each page continues after the last device of the previous one
+    query = Device.query if current_user.is_admin else Device.query.filter_by(user_id=current_user.id)
+    if fields is not None:
+        # Leave the JSON columns out of the SELECT unless they were asked for
+        query = query.options(*[
+            defer(column) for field, column in (('config', Device.config), ('metadata', Device.device_metadata))
+            if field not in fields
+        ])
+    devices, next_cursor = keyset_page(query, Device.created_at, Device.id, cursor, limit)
+    
+    response = jsonify([device.to_dict(fields) for device in devices])
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
 
 @device_bp.route('/api/devices/<int:device_id>', methods=['GET'])
 @login_required
@@ -210,6 +262,8 @@ def api_add_device():
     
     db.session.add(new_device)
     db.session.commit()
+    device_registry.register(new_device)
+    dashboard_stats.track_device(new_device)
     
     return jsonify(new_device.to_dict()), 201
 
@@ -250,6 +304,8 @@ def api_update_device(device_id):
         device.set_metadata(data['metadata'])
     
     db.session.commit()
+    device_registry.register(device)
+    dashboard_stats.track_device(device)
     
     return jsonify(device.to_dict())
 
@@ -263,8 +319,16 @@ def api_delete_device(device_id):
     if not current_user.is_admin and device.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    sensor_ids = [sensor.id for sensor in device.sensors]
+    readings = dashboard_stats.sensor_readings(sensor_ids)
+    reading_partitions.delete_sensors(sensor_ids)
+    delete_rollups(sensor_ids)
     db.session.delete(device)
     db.session.commit()
+    reading_archive.delete_sensors(sensor_ids)
+    recent_readings.discard(sensor_ids)
+    device_registry.unregister(device.device_id)
+    dashboard_stats.forget_device(device.id, readings)
     
     return jsonify({'message': 'Device deleted successfully'}), 200
 
@@ -272,7 +336,7 @@ def api_delete_device(device_id):
 @login_required
 def api_device_control(device_id):
     """API endpoint to send control commands to a device"""
-    device = Device.query.get_or_404(device_id)
+    device = device_registry.get_by_id(device_id) or Device.query.get_or_404(device_id)
     
     # Check if user has access to this device
     if not current_user.is_admin and device.user_id != current_user.id:
@@ -287,12 +351,181 @@ def api_device_control(device_id):
     params = data.get('params', {})
     
     # Send command via MQTT
-    success = publish_command(device.device_id, command, params)
+    command_id = publish_command(device.device_id, command, params)
     
-    if success:
-        return jsonify({'message': f'Command {command} sent successfully'}), 200
-    else:
+    if not command_id:
         return jsonify({'error': 'Failed to send command'}), 500
+    
+    # Sync mode waits for the device to acknowledge, otherwise the caller polls
+    wait = data.get('wait', request.args.get('wait', 'false'))
+    if str(wait).lower() in ('1', 'true', 'yes'):
+        try:
+            timeout = float(data.get('timeout', request.args.get('timeout', command_tracker.timeout)))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid timeout'}), 400
+        pending = command_tracker.wait(command_id, timeout)
+        result = pending.to_dict()
+        if pending.status == 'acknowledged':
+            return jsonify(result), 200
+        if pending.status == 'failed':
+            return jsonify(result), 502
+        return jsonify(result), 504 if pending.status == 'timeout' else 202
+    
+    return jsonify({
+        'message': f'Command {command} sent successfully',
+        'command_id': command_id,
+        'status_url': url_for('device.api_command_status', command_id=command_id)
+    }), 202
+
+@device_bp.route('/api/commands/<command_id>', methods=['GET'])
+@login_required
+def api_command_status(command_id):
+    """API endpoint to poll the status of a command"""
+    pending = command_tracker.get(command_id)
+    if pending is None:
+        return jsonify({'error': 'Command not found'}), 404
+    
+    # Check if user has access to the device the command was sent to
+    device = device_registry.get(pending.device_id)
+    if not current_user.is_admin and (device is None or device.user_id != current_user.id):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(pending.to_dict())
+
+@device_bp.route('/api/commands/latency', methods=['GET'])
+@login_required
+def api_command_latency():
+    """API endpoint to get command round-trip latency percentiles"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(command_tracker.get_stats())
+
+@device_bp.route('/api/devices/<int:device_id>/commands/latency', methods=['GET'])
+@login_required
+def api_device_command_latency(device_id):
+    """API endpoint to get command round-trip latency percentiles for a device"""
+    device = device_registry.get_by_id(device_id) or Device.query.get_or_404(device_id)
+    
+    # Check if user has access to this device
+    if not current_user.is_admin and device.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(command_tracker.device_latency(device.device_id))
+
+def filter_devices(query, filters):
+    """Apply a device filter (device_type, location, ids) to a Device query"""
+    if filters.get('device_type'):
+        query = query.filter(Device.device_type == filters['device_type'])
+    if filters.get('location'):
+        query = query.filter(Device.location == filters['location'])
+    if filters.get('ids'):
+        query = query.filter(Device.id.in_([int(id) for id in filters['ids']]))
+    return query
+
+@device_bp.route('/api/devices/bulk-control', methods=['POST'])
+@login_required
+def api_bulk_control():
+    """API endpoint to send one command to many devices, streaming per-device results"""
+    data = request.get_json()
+    
+    if not isinstance(data, dict) or 'command' not in data:
+        return jsonify({'error': 'Missing required field: command'}), 400
+    
+    # Resolve the filter from a saved group or the request body
+    if 'group_id' in data:
+        group = DeviceGroup.query.get_or_404(data['group_id'])
+        if not current_user.is_admin and group.user_id != current_user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
+        filters = group.get_filters()
+    else:
+        filters = data.get('filter', {})
+        if not isinstance(filters, dict):
+            return jsonify({'error': 'filter must be an object'}), 400
+    
+    if not any(filters.get(key) for key in ('device_type', 'location', 'ids')):
+        return jsonify({'error': 'A filter or group_id is required'}), 400
+    
+    # Resolve the whole target set in one query
+    query = db.session.query(Device.id, Device.device_id)
+    if not current_user.is_admin:
+        query = query.filter(Device.user_id == current_user.id)
+    try:
+        targets = filter_devices(query, filters).order_by(Device.id).all()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid device ids'}), 400
+    
+    command = data['command']
+    params = data.get('params', {})
+    wait = str(data.get('wait', 'false')).lower() in ('1', 'true', 'yes')
+    try:
+        rate = float(data.get('rate', BULK_COMMAND_RATE))
+        timeout = float(data.get('timeout', command_tracker.timeout))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid rate or timeout'}), 400
+    if not rate > 0 or not math.isfinite(timeout) or timeout < 0:
+        return jsonify({'error': 'Invalid rate or timeout'}), 400
+    # BULK_COMMAND_RATE is a ceiling a request can lower but not raise
+    rate = min(rate, BULK_COMMAND_RATE)
+    
+    def generate():
+        for record in run_bulk_command(targets, command, params, publish_command,
+                                       rate=rate, wait=wait, timeout=timeout):
+            yield codec.dumps(record) + b'\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@device_bp.route('/api/groups', methods=['GET'])
+@login_required
+def api_get_groups():
+    """API endpoint to get the user's device groups"""
+    if current_user.is_admin:
+        groups = DeviceGroup.query.all()
+    else:
+        groups = DeviceGroup.query.filter_by(user_id=current_user.id).all()
+    
+    return jsonify([group.to_dict() for group in groups])
+
+@device_bp.route('/api/groups', methods=['POST'])
+@login_required
+def api_add_group():
+    """API endpoint to save a device group"""
+    data = request.get_json()
+    
+    required_fields = ['name', 'filters']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({'error': f'Missing required field: {field}'}), 400
+    
+    filters = {key: data['filters'][key] for key in ('device_type', 'location', 'ids') if key in data['filters']}
+    if not filters:
+        return jsonify({'error': 'filters must contain device_type, location or ids'}), 400
+    
+    new_group = DeviceGroup(
+        name=data['name'],
+        user_id=current_user.id,
+        filters=filters,
+        description=data.get('description')
+    )
+    
+    db.session.add(new_group)
+    db.session.commit()
+    
+    return jsonify(new_group.to_dict()), 201
+
+@device_bp.route('/api/groups/<int:group_id>', methods=['DELETE'])
+@login_required
+def api_delete_group(group_id):
+    """API endpoint to delete a device group"""
+    group = DeviceGroup.query.get_or_404(group_id)
+    
+    if not current_user.is_admin and group.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    db.session.delete(group)
+    db.session.commit()
+    
+    return jsonify({'message': 'Group deleted successfully'}), 200
 
 # API routes for sensors
 @device_bp.route('/api/devices/<int:device_id>/sensors', methods=['GET'])
@@ -340,6 +573,8 @@ def api_add_sensor(device_id):
     
     db.session.add(new_sensor)
     db.session.commit()
+    device_registry.add_sensor(device.device_id, new_sensor.sensor_type, new_sensor.id)
+    dashboard_stats.track_sensor(new_sensor.id, device.id)
     
     return jsonify(new_sensor.to_dict()), 201
 
@@ -357,21 +592,116 @@ def api_get_sensor_readings(sensor_id):
     # Get optional query parameters
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
-    limit = request.args.get('limit', 100, type=int)
+    limit = page_size(request.args.get('limit', type=int), 100)
+    resolution = request.args.get('resolution', 'raw')
+    max_points = request.args.get('max_points', type=int)
+    method = request.args.get('downsample', CHART_DOWNSAMPLING)
+    if max_points is not None:
+        max_points = chart_points(max_points)
+    
+    if resolution != 'auto' and resolution != 'raw' and resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Invalid resolution: {resolution}'}), 400
+    if method not in DOWNSAMPLING_METHODS:
+        return jsonify({'error': f'Invalid downsample: {method}'}), 400
+    
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Pick raw readings or the finest rollup that covers the range within `limit` (or `max_points`) points
+    if resolution == 'auto':
+        if not start_time:
+            return jsonify({'error': 'start_time is required with resolution=auto'}), 400
+        start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+        if start is None or (end_time and end is None):
+            return jsonify({'error': 'Invalid start_time or end_time'}), 400
+        resolution = choose_resolution(sensor.id, start, end, max_points=max_points or limit)
+    
+    if max_points is not None:
+        start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+        if (start_time and start is None) or (end_time and end is None):
+            return jsonify({'error': 'Invalid start_time or end_time'}), 400
+        return jsonify(downsampled_readings(sensor.id, resolution, start, end, max_points, method))
+    
+    if resolution != 'raw':
+        rollups = rollup_query(sensor.id, resolution, parse_timestamp(start_time), parse_timestamp(end_time))
+        if cursor is not None:
+            # A sensor has one bucket per start time, so the bucket alone is the key
+            rollups = rollups.filter(SensorRollup.bucket < cursor[0])
+        rollups = rollups.order_by(SensorRollup.bucket.desc()).limit(limit + 1).all()
+        response = jsonify([rollup.to_dict() for rollup in rollups[:limit]])
+        if len(rollups) > limit:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rollups[limit - 1].bucket, sensor.id)
+        return response
+    
+    start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+    if (start_time and start is None) or (end_time and end is None):
+        return jsonify({'error': 'Invalid start_time or end_time'}), 400
+    
+    # Newest readings first, from memory, the database and the archive, continuing after the cursor
+    readings = recent_readings.readings(sensor.id, start, end, limit=limit + 1, before=cursor)
+    
+    response = jsonify([reading.to_dict() for reading in readings[:limit]])
+    if len(readings) > limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(readings[limit - 1].timestamp, readings[limit - 1].id)
+    return response
+
+def downsampled_readings(sensor_id, resolution, start, end, max_points, method):
+    """A sensor's readings or rollups over the whole range, downsampled to at most `max_points`, newest first"""
+    if resolution == 'raw':
+        columns = recent_readings.columns([sensor_id], start, end).get(sensor_id)
+        if columns is None:
+            return []
+        timestamps, values, ids = columns
+        keep = downsample(timestamps, values, max_points, method)[::-1]
+        return [record.to_dict() for record in reading_records(sensor_id, timestamps[keep], values[keep], ids[keep])]
+    
+    # Downsample the bucket averages, then load only the buckets kept
+    columns = rollup_columns([sensor_id], resolution, start, end).get(sensor_id)
+    if columns is None:
+        return []
+    buckets, averages = columns[:2]
+    keep = downsample(buckets, averages, max_points, method)
+    kept = buckets[keep].astype('datetime64[us]').astype(object).tolist()
+    rollups = rollup_query(sensor_id, resolution).filter(SensorRollup.bucket.in_(kept)).order_by(
+        SensorRollup.bucket.desc()
+    ).all()
+    return [rollup.to_dict() for rollup in rollups]
+
+@device_bp.route('/api/sensors/<int:sensor_id>/readings/export', methods=['GET'])
+@login_required
+def api_export_sensor_readings(sensor_id):
+    """API endpoint to stream all of a sensor's readings in a range as NDJSON or CSV"""
+    sensor = Sensor.query.get_or_404(sensor_id)
+    device = Device.query.get(sensor.device_id)
     
-    # Build query
-    query = SensorReading.query.filter_by(sensor_id=sensor.id)
+    # Check if user has access to this device
+    if not current_user.is_admin and device.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    if start_time:
-        query = query.filter(SensorReading.timestamp >= start_time)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Invalid format: {fmt}'}), 400
     
-    if end_time:
-        query = query.filter(SensorReading.timestamp <= end_time)
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+    start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+    if (start_time and start is None) or (end_time and end is None):
+        return jsonify({'error': 'Invalid start_time or end_time'}), 400
     
-    # Order by timestamp descending and limit results
-    readings = query.order_by(SensorReading.timestamp.desc()).limit(limit).all()
+    # Compress when the client accepts gzip, in the same pass that encodes the rows
+    compress = request.accept_encodings.best_match(['gzip', 'identity']) == 'gzip'
     
-    return jsonify([reading.to_dict() for reading in readings])
+    response = Response(
+        stream_with_context(export_stream(sensor.id, start, end, fmt=fmt, compress=compress)),
+        mimetype=EXPORT_FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=sensor-{sensor.id}-readings.{fmt}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 @device_bp.route('/api/sensors/<int:sensor_id>/readings', methods=['POST'])
 @login_required
@@ -384,21 +714,118 @@ def api_add_sensor_reading(sensor_id):
     if not current_user.is_admin and device.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    data = request.get_json()
+    data = request.get_json(silent=True)
     
-    if 'value' not in data:
+    if not isinstance(data, dict) or 'value' not in data:
         return jsonify({'error': 'Missing required field: value'}), 400
     
-    timestamp = data.get('timestamp', datetime.utcnow())
+    value = reading_value(data['value'])
+    if value is None:
+        return jsonify({'error': 'Invalid value'}), 400
+    
+    timestamp = datetime.utcnow()
+    if data.get('timestamp') is not None:
+        try:
+            timestamp = parse_timestamp(data['timestamp'])
+        except (OverflowError, OSError, ValueError):
+            timestamp = None
+        if timestamp is None:
+            return jsonify({'error': 'Invalid timestamp'}), 400
     
     # Create new reading
     new_reading = SensorReading(
-        value=data['value'],
+        value=value,
         sensor_id=sensor.id,
         timestamp=timestamp
     )
     
-    db.session.add(new_reading)
+    reading_partitions.add(new_reading)
+    apply_rollups([(sensor.id, value, timestamp)])
     db.session.commit()
+    reading = {
+        'id': new_reading.id,
+        'sensor_id': sensor.id,
+        'value': value,
+        'timestamp': timestamp
+    }
+    recent_readings.extend([reading])
+    dashboard_stats.add_readings([reading])
+    
+    return jsonify(new_reading.to_dict()), 201
+
+@device_bp.route('/api/readings/batch', methods=['POST'])
+@login_required
+def api_add_sensor_readings_batch():
+    """API endpoint to add many readings across sensors, rejecting invalid items individually"""
+    data = request.get_json(silent=True)
+    items = data.get('readings') if isinstance(data, dict) else data
+    
+    if not isinstance(items, list):
+        return jsonify({'error': 'Missing required field: readings'}), 400
+    if len(items) > READINGS_BATCH_MAX:
+        return jsonify({'error': f'A batch holds at most {READINGS_BATCH_MAX} readings'}), 413
+    
+    now = datetime.utcnow()
+    errors = []
+    parsed = []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or 'sensor_id' not in item or 'value' not in item:
+            errors.append({'index': position, 'error': 'Missing required field: sensor_id or value'})
+            continue
+        sensor_id = item['sensor_id']
+        if not isinstance(sensor_id, int) or isinstance(sensor_id, bool):
+            errors.append({'index': position, 'error': 'Invalid sensor_id'})
+            continue
+        value = reading_value(item['value'])
+        if value is None:
+            errors.append({'index': position, 'error': 'Invalid value'})
+            continue
+        # Readings without a timestamp keep their order in the batch, a microsecond apart
+        timestamp = now + timedelta(microseconds=position)
+        if item.get('timestamp') is not None:
+            try:
+                timestamp = parse_timestamp(item['timestamp'])
+            except (OverflowError, OSError, ValueError):
+                timestamp = None
+            if timestamp is None:
+                errors.append({'index': position, 'error': 'Invalid timestamp'})
+                continue
+        parsed.append((position, sensor_id, value, timestamp))
+    
+    # Authorize every referenced sensor with one query instead of one per reading
+    owners = {}
+    sensor_ids = {sensor_id for _, sensor_id, _, _ in parsed}
+    if sensor_ids:
+        owners = dict(
+            db.session.query(Sensor.id, Device.user_id)
+            .join(Device, Sensor.device_id == Device.id)
+            .filter(Sensor.id.in_(sensor_ids))
+            .all()
+        )
     
-    return jsonify(new_reading.to_dict()), 201 
\ No newline at end of file
+    rows = []
+    for position, sensor_id, value, timestamp in parsed:
+        if sensor_id not in owners:
+            errors.append({'index': position, 'error': 'Sensor not found'})
+        elif not current_user.is_admin and owners[sensor_id] != current_user.id:
+            errors.append({'index': position, 'error': 'Unauthorized'})
+        else:
+            rows.append({'sensor_id': sensor_id, 'value': value, 'timestamp': timestamp})
+    
+    if rows:
+        try:
+            inserted = reading_partitions.insert(rows, returning=recent_readings.enabled)
+            apply_rollups((row['sensor_id'], row['value'], row['timestamp']) for row in rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        recent_readings.extend(inserted)
+        dashboard_stats.add_readings(rows)
+    
+    errors.sort(key=lambda error: error['index'])
+    return jsonify({
+        'accepted': len(rows),
+        'rejected': len(errors),
+        'errors': errors
+    }), 201 if rows else 400
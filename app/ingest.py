@@ -0,0 +1,278 @@
+"""
+Standalone asyncio ingestion service.
+
+Holds the broker connection on an asyncio event loop and routes messages on
+asyncio tasks, which hand them to a thread pool to be decoded and handled, so
+nothing that blocks runs on the loop. Database writes are left to the
+ingestor's and status buffer's writer threads. UI events are published to the web tier
+through the Socket.IO message queue (SOCKETIO_MESSAGE_QUEUE), so the web app
+and ingestion can be scaled and tuned independently.
+
+Usage:
+    python -m app.ingest [--group ingest]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv
+from flask_socketio import SocketIO
+
+# Load environment variables
+load_dotenv()
+
+# The application modules read their configuration from the environment on import
+# pylint: disable=wrong-import-position
+from app.config.database import create_db_app
+from app.config import mqtt_client
+from app.services.device_registry import device_registry
+from app.services.dispatcher import MQTT_WORKERS, MQTT_QUEUE_SIZE
+from app.services.ingestion import ingestor, INGEST_STATS_INTERVAL
+from app.services.metrics import LatencyTracker
+from app.services.realtime import SOCKETIO_MESSAGE_QUEUE
+# pylint: enable=wrong-import-position
+
+logger = logging.getLogger(__name__)
+
+# Service Configuration
+DEVICE_REGISTRY_REFRESH_SECONDS = int(os.getenv('DEVICE_REGISTRY_REFRESH_SECONDS', '30'))
+MQTT_RECONNECT_MAX_SECONDS = int(os.getenv('MQTT_RECONNECT_MAX_SECONDS', '30'))
+
+# Most messages a router task hands to its thread at once
+ROUTER_BATCH = 100
+
+
+class AsyncRouter:  # pylint: disable=too-many-instance-attributes
+    """Routes messages on asyncio tasks to a thread pool that decodes and handles them.
+
+    Like the threaded dispatcher, each task owns a bounded queue and messages
+    are assigned by device. A task hands what is queued to the pool in one
+    batch and waits for it before taking the next, so one device's messages
+    are handled in order while the event loop keeps reading the socket. When
+    a queue is full its oldest message is dropped.
+    """
+
+    def __init__(self, handler, workers=MQTT_WORKERS, queue_size=MQTT_QUEUE_SIZE):
+        self.handler = handler
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._executor = ThreadPoolExecutor(max_workers=len(self._queues), thread_name_prefix='ingest-router')
+        self._tasks = []
+
+        self.submitted = 0
+        self.handled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.queue_latency = LatencyTracker()
+
+    def start(self):
+        """Start one routing task per queue"""
+        self._tasks = [asyncio.create_task(self._work(work_queue)) for work_queue in self._queues]
+
+    async def stop(self):
+        """Wait for the queues to drain, then stop the tasks"""
+        for work_queue in self._queues:
+            await work_queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown()
+
+    def submit(self, key, topic, payload):
+        """Queue a raw message on the task owning `key`"""
+        work_queue = self._queues[zlib.crc32(key.encode()) % len(self._queues)]
+        self.submitted += 1
+        if work_queue.full():
+            work_queue.get_nowait()
+            work_queue.task_done()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Ingest router queue full, %d messages dropped so far", self.dropped)
+        work_queue.put_nowait((time.monotonic(), topic, payload))
+
+    async def _work(self, work_queue):
+        """Routing task loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await work_queue.get()]
+            while len(batch) < ROUTER_BATCH and not work_queue.empty():
+                batch.append(work_queue.get_nowait())
+            now = time.monotonic()
+            for queued_at, _, _ in batch:
+                self.queue_latency.record(now - queued_at)
+            try:
+                failed = await loop.run_in_executor(self._executor, self._handle, batch)
+            finally:
+                for _ in batch:
+                    work_queue.task_done()
+            self.handled += len(batch) - failed
+            self.failed += failed
+
+    def _handle(self, batch):
+        """Handle a batch of messages in order on a pool thread, returning how many failed"""
+        failed = 0
+        for _, topic, payload in batch:
+            try:
+                self.handler(topic, payload)
+            # A failing message must not stop the rest of the batch, whatever the handler raised
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                failed += 1
+                logger.error("Error processing MQTT message: %s", e)
+        return failed
+
+    def get_stats(self):
+        """Return queue depth, counters and queue latency percentiles"""
+        return {
+            'workers': len(self._queues),
+            'queue_depth': sum(work_queue.qsize() for work_queue in self._queues),
+            'submitted': self.submitted,
+            'handled': self.handled,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'queue_latency': self.queue_latency.to_dict()
+        }
+
+
+class AsyncioMQTT:
+    """Runs a paho client's network I/O on an asyncio event loop through its socket callbacks.
+
+    The blocking connect() runs on the loop's default executor, and the socket
+    callbacks it triggers there are passed back to the loop thread.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self._misc = None
+        self._closing = asyncio.Event()
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    async def run(self, host, port, keepalive):
+        """Connect, and reconnect with backoff whenever the connection drops"""
+        delay = 1
+        while not self._closing.is_set():
+            try:
+                # Opening the socket registers it with the loop through _on_socket_open
+                await self.loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+                delay = 1
+                self._misc = self.loop.create_task(self._misc_loop())
+                await asyncio.gather(self._misc, return_exceptions=True)
+            except OSError as e:
+                logger.error("Failed to connect to MQTT broker: %s", e)
+            try:
+                await asyncio.wait_for(self._closing.wait(), delay)
+            except asyncio.TimeoutError:
+                delay = min(delay * 2, MQTT_RECONNECT_MAX_SECONDS)
+
+    def close(self):
+        """Disconnect from the broker and stop reconnecting"""
+        self._closing.set()
+        self.client.disconnect()
+
+    def _on_loop(self, func, *args):
+        """Call func on the loop thread, directly or from the executor thread running connect()"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def _on_socket_open(self, client, _userdata, sock):
+        self._on_loop(self.loop.add_reader, sock, client.loop_read)
+
+    def _on_socket_close(self, _client, _userdata, sock):
+        self._on_loop(self.loop.remove_reader, sock)
+
+    def _on_socket_register_write(self, client, _userdata, sock):
+        self._on_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, _client, _userdata, sock):
+        self._on_loop(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self):
+        """Keepalive and retry handling paho normally does on its own thread"""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+async def serve(group, refresh_interval):
+    """Run the ingestion service until SIGINT or SIGTERM"""
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    app = create_db_app(__name__)
+
+    # UI events reach the web app's Socket.IO clients through the shared message queue
+    socketio = None
+    if SOCKETIO_MESSAGE_QUEUE:
+        socketio = SocketIO(message_queue=SOCKETIO_MESSAGE_QUEUE, async_mode='threading')
+    else:
+        logger.info("SOCKETIO_MESSAGE_QUEUE is not set, device events will not be sent to the web app")
+
+    mqtt_client.init_ingestion(app, socketio, ingest=True)
+    device_registry.start_refresh(app, refresh_interval)
+
+    router = AsyncRouter(mqtt_client.process_message)
+    router.start()
+
+    def on_message(_client, _userdata, msg):
+        if mqtt_client.spool_message(msg.topic, msg.payload):
+            return
+        topic_parts = msg.topic.split('/')
+        router.submit(topic_parts[1] if len(topic_parts) >= 2 else msg.topic, msg.topic, msg.payload)
+
+    client_id = mqtt_client.unique_client_id()
+    client = mqtt_client.create_client(client_id, mqtt_client.subscription_topics(group, ingest=True, responses=False))
+    client.on_message = on_message
+    connection = AsyncioMQTT(loop, client)
+    connection_task = asyncio.create_task(
+        connection.run(mqtt_client.MQTT_BROKER, mqtt_client.MQTT_PORT, mqtt_client.MQTT_KEEPALIVE)
+    )
+    logger.info("Ingestion service %s started%s", client_id, f" in shared group '{group}'" if group else '')
+
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), INGEST_STATS_INTERVAL or None)
+        except asyncio.TimeoutError:
+            stats = router.get_stats()
+            logger.info(
+                "Ingest router: %d handled, %d dropped, queue depth %d, p99 queue latency %s ms",
+                stats['handled'], stats['dropped'], stats['queue_depth'], stats['queue_latency']['p99_ms']
+            )
+
+    connection.close()
+    await connection_task
+    await router.stop()
+    # Writer threads flush what is buffered before they exit
+    await loop.run_in_executor(None, mqtt_client.stop_ingestion)
+    logger.info("Ingestion service stopped after %d readings", ingestor.stats.written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Asyncio MQTT ingestion service')
+    parser.add_argument('--group', default=mqtt_client.MQTT_SHARED_GROUP,
+                        help='Shared subscription group, to run several services side by side (default: MQTT_SHARED_GROUP)')
+    parser.add_argument('--refresh', type=int, default=DEVICE_REGISTRY_REFRESH_SECONDS,
+                        help='Seconds between device registry reloads (0 disables them)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [ingest] %(levelname)s %(message)s')
+    asyncio.run(serve(args.group, args.refresh))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,19 @@
 from app.config.database import db
+from app.services.status_buffer import status_buffer
 from datetime import datetime
+from sqlalchemy.dialects.postgresql import JSONB
 import json
 
+# Native JSON column: jsonb on PostgreSQL, JSON on MySQL, JSON text on SQLite
+JSONColumn = db.JSON().with_variant(JSONB(), 'postgresql')
+
 class Device(db.Model):
     __tablename__ = 'devices'
+    # Device lists are paged in (created_at, id) order, for everyone or for one user
+    __table_args__ = (
+        db.Index('ix_devices_created_at_id', 'created_at', 'id'),
+        db.Index('ix_devices_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String(50), unique=True, nullable=False)
@@ -19,15 +29,21 @@ class Device(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Configuration and metadata stored as JSON
-    config = db.Column(db.Text)
-    metadata = db.Column(db.Text)
+    # Configuration and metadata stored as JSON. `metadata` is reserved on declarative models
+    config = db.Column(JSONColumn)
+    device_metadata = db.Column('metadata', JSONColumn)
     
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     
+    # Fields of to_dict(), for selecting a subset of them
+    FIELDS = ('id', 'device_id', 'name', 'device_type', 'description', 'status', 'location', 'ip_address',
+              'mac_address', 'firmware_version', 'last_seen', 'created_at', 'updated_at', 'config', 'metadata',
+              'user_id')
+    
     # Relationships
     sensors = db.relationship('Sensor', backref='device', lazy=True, cascade='all, delete-orphan')
+    retention_policies = db.relationship('RetentionPolicy', backref='device', lazy=True, cascade='all, delete-orphan')
     
     def __init__(self, device_id, name, device_type, user_id=None, description=None, 
                  location=None, ip_address=None, mac_address=None, firmware_version=None,
@@ -42,31 +58,51 @@ class Device(db.Model):
         self.mac_address = mac_address
         self.firmware_version = firmware_version
         
-        # Store configuration and metadata as JSON strings
-        self.config = json.dumps(config) if config else '{}'
-        self.metadata = json.dumps(metadata) if metadata else '{}'
+        # Store configuration and metadata as JSON
+        self.config = config or {}
+        self.device_metadata = metadata or {}
+    
+    def _json_field(self, name):
+        """Get a JSON column as dictionary, parsing it at most once per stored value.
+        
+        The database returns parsed JSON, except for a column still declared as
+        text, whose string is parsed on first use and cached on the instance.
+        """
+        value = getattr(self, name)
+        if isinstance(value, dict):
+            return value
+        if not isinstance(value, str):
+            return {}
+        cache = self.__dict__.setdefault('_parsed_json', {})
+        cached = cache.get(name)
+        if cached is None or cached[0] is not value:
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                parsed = {}
+            cached = cache[name] = (value, parsed if isinstance(parsed, dict) else {})
+        return cached[1]
+    
+    def _set_json_field(self, name, value):
+        """Set a JSON column, dropping any cached parse of the old value"""
+        self.__dict__.get('_parsed_json', {}).pop(name, None)
+        setattr(self, name, value)
     
     def get_config(self):
         """Get device configuration as dictionary"""
-        try:
-            return json.loads(self.config)
-        except:
-            return {}
+        return self._json_field('config')
     
     def set_config(self, config):
         """Set device configuration from dictionary"""
-        self.config = json.dumps(config)
+        self._set_json_field('config', config)
     
     def get_metadata(self):
         """Get device metadata as dictionary"""
-        try:
-            return json.loads(self.metadata)
-        except:
-            return {}
+        return self._json_field('device_metadata')
     
     def set_metadata(self, metadata):
         """Set device metadata from dictionary"""
-        self.metadata = json.dumps(metadata)
+        self._set_json_field('device_metadata', metadata)
     
     def update_status(self, status, timestamp=None):
         """Update device status and last seen time"""
@@ -76,26 +112,40 @@ class Device(db.Model):
         else:
             self.last_seen = datetime.utcnow()
     
-    def to_dict(self):
-        """Convert device to dictionary"""
-        return {
+    def current_status(self):
+        """Get (status, last_seen), including updates not yet written to the database"""
+        buffered = status_buffer.get(self.device_id)
+        if buffered:
+            return buffered
+        return self.status, self.last_seen
+    
+    def to_dict(self, fields=None):
+        """Convert device to dictionary, with only `fields` when given"""
+        status, last_seen = self.current_status()
+        data = {
             'id': self.id,
             'device_id': self.device_id,
             'name': self.name,
             'device_type': self.device_type,
             'description': self.description,
-            'status': self.status,
+            'status': status,
             'location': self.location,
             'ip_address': self.ip_address,
             'mac_address': self.mac_address,
             'firmware_version': self.firmware_version,
-            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'last_seen': last_seen.isoformat() if last_seen else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'config': self.get_config(),
-            'metadata': self.get_metadata(),
             'user_id': self.user_id
         }
+        # The JSON columns are only read when asked for, so a query can defer them
+        if fields is None or 'config' in fields:
+            data['config'] = self.get_config()
+        if fields is None or 'metadata' in fields:
+            data['metadata'] = self.get_metadata()
+        if fields is None:
+            return data
+        return {field: data[field] for field in fields if field in data}
     
     def __repr__(self):
         return f'<Device {self.name} ({self.device_id})>'
@@ -119,6 +169,9 @@ class Sensor(db.Model):
     
     # Relationships
     readings = db.relationship('SensorReading', backref='sensor', lazy=True, cascade='all, delete-orphan')
+    # Rollups are bulk-deleted with delete_rollups(), or by the database, instead of loaded to be deleted one by one
+    rollups = db.relationship('SensorRollup', backref='sensor', lazy=True, cascade='all, delete-orphan',
+                              passive_deletes=True)
     
     def __init__(self, sensor_id, name, sensor_type, device_id, unit=None, 
                  min_value=None, max_value=None, description=None):
@@ -152,6 +205,12 @@ class Sensor(db.Model):
 
 class SensorReading(db.Model):
     __tablename__ = 'sensor_readings'
+    # Range scans and retention purges walk one sensor's readings in time order.
+    # Ids are never reused on SQLite either, since archived readings are told apart by id.
+    __table_args__ = (
+        db.Index('ix_sensor_readings_sensor_id_timestamp', 'sensor_id', 'timestamp'),
+        {'sqlite_autoincrement': True}
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.Float, nullable=False)
@@ -175,4 +234,113 @@ class SensorReading(db.Model):
         }
     
     def __repr__(self):
-        return f'<SensorReading {self.value} at {self.timestamp}>' 
\ No newline at end of file
+        return f'<SensorReading {self.value} at {self.timestamp}>' 
+
+
+class SensorRollup(db.Model):
+    __tablename__ = 'sensor_rollups'
+    
+    # One row per sensor, resolution ('1m', '1h' or '1d') and bucket start time
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id', ondelete='CASCADE'), primary_key=True)
+    resolution = db.Column(db.String(2), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    
+    # Aggregates of the readings in the bucket
+    count = db.Column(db.Integer, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    sum_value = db.Column(db.Float, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    
+    def to_dict(self):
+        """Convert rollup to dictionary"""
+        return {
+            'sensor_id': self.sensor_id,
+            'resolution': self.resolution,
+            'timestamp': self.bucket.isoformat() if self.bucket else None,
+            'count': self.count,
+            'min': self.min_value,
+            'max': self.max_value,
+            'avg': self.sum_value / self.count if self.count else None,
+            'sum': self.sum_value,
+            'last': self.last_value
+        }
+    
+    def __repr__(self):
+        return f'<SensorRollup {self.sensor_id} {self.resolution} {self.bucket}>'
+
+class DeviceGroup(db.Model):
+    __tablename__ = 'device_groups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Device filter stored as JSON: device_type, location and/or ids
+    filters = db.Column(db.Text)
+    
+    # Foreign keys
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    
+    def __init__(self, name, user_id, filters=None, description=None):
+        self.name = name
+        self.user_id = user_id
+        self.description = description
+        self.filters = json.dumps(filters) if filters else '{}'
+    
+    def get_filters(self):
+        """Get group filter as dictionary"""
+        try:
+            return json.loads(self.filters)
+        except:
+            return {}
+    
+    def to_dict(self):
+        """Convert group to dictionary"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'filters': self.get_filters(),
+            'user_id': self.user_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<DeviceGroup {self.name}>'
+
+
+class RetentionPolicy(db.Model):
+    __tablename__ = 'retention_policies'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # What the policy applies to: a device, a sensor type, or one sensor type on one device
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'))
+    sensor_type = db.Column(db.String(50))
+    
+    # Days to keep each kind of data; None falls back to the default, 0 keeps it forever
+    raw_days = db.Column(db.Integer)
+    rollup_1m_days = db.Column(db.Integer)
+    rollup_1h_days = db.Column(db.Integer)
+    rollup_1d_days = db.Column(db.Integer)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert policy to dictionary"""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'sensor_type': self.sensor_type,
+            'raw_days': self.raw_days,
+            'rollup_1m_days': self.rollup_1m_days,
+            'rollup_1h_days': self.rollup_1h_days,
+            'rollup_1d_days': self.rollup_1d_days,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<RetentionPolicy device={self.device_id} type={self.sensor_type}>'
@@ -0,0 +1,48 @@
+"""
+Move readings older than READINGS_ARCHIVE_AFTER_DAYS into the columnar archive.
+
+One ingestion process, the holder of MAINTENANCE_LOCK_FILE, archives every
+READINGS_ARCHIVE_INTERVAL_SECONDS when READINGS_ARCHIVE_DIR is set; this runs
+the archive stage once, and refuses to while that process holds the lock.
+Each sensor's month is written to its segment before its rows are deleted,
+so the command can be interrupted and re-run.
+
+Usage:
+    python -m app.scripts.archive_readings [--after-days 30]
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.config.database import create_db_app
+from app.services.archive import ReadingArchive, READINGS_ARCHIVE_DIR, READINGS_ARCHIVE_AFTER_DAYS
+from app.services.maintenance import MAINTENANCE_LOCK_FILE, maintenance_lock
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old sensor readings into the columnar archive')
+    parser.add_argument('--directory', default=READINGS_ARCHIVE_DIR, help='Archive directory (default: READINGS_ARCHIVE_DIR)')
+    parser.add_argument('--after-days', type=int, default=READINGS_ARCHIVE_AFTER_DAYS,
+                        help='Archive whole months of readings older than this many days')
+    args = parser.parse_args()
+
+    if not args.directory:
+        parser.error('set READINGS_ARCHIVE_DIR or pass --directory')
+    if not maintenance_lock.acquire():
+        parser.exit(1, f"Another process holds the maintenance lock {MAINTENANCE_LOCK_FILE}\n")
+
+    archive = ReadingArchive(directory=args.directory, after_days=args.after_days, interval=0)
+    archive.init_app(create_db_app(__name__))
+    result = archive.run_once()
+
+    print(
+        f"Archived {result['archived']} readings before {result['boundary']} into "
+        f"{result['segments']} segments in {result['duration_ms'] / 1000.0:.2f}s"
+    )
+
+
+if __name__ == '__main__':
+    main()
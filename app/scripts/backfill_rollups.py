@@ -0,0 +1,60 @@
+"""
+Rebuild sensor rollups from raw readings.
+
+Rollups are maintained as readings are ingested; this fills them in for
+readings stored before rollups existed, or repairs a range after readings
+were imported or deleted by hand. Each day is rebuilt in its own
+transaction, so the command can be interrupted and re-run. Rollups from
+before a sensor's oldest stored reading are kept, since retention may have
+purged the readings they were built from. The command takes the maintenance
+lock, so that no purge or archive run moves readings while it reads them.
+
+Usage:
+    python -m app.scripts.backfill_rollups --since 2024-01-01 [--until 2024-02-01] [--sensor 12]
+"""
+import argparse
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.config.database import create_db_app
+from app.services.ingestion import parse_timestamp
+from app.services.maintenance import MAINTENANCE_LOCK_FILE, maintenance_lock
+from app.services.rollups import backfill_window, day_windows, retained_since
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild sensor rollups from raw readings')
+    parser.add_argument('--since', help='First day to rebuild (default: the oldest stored reading)')
+    parser.add_argument('--until', help='Rebuild up to this time (default: now)')
+    parser.add_argument('--sensor', type=int, action='append', help='Only rebuild this sensor (repeatable)')
+    args = parser.parse_args()
+    if not maintenance_lock.acquire():
+        parser.exit(1, f"Another process holds the maintenance lock {MAINTENANCE_LOCK_FILE}\n")
+
+    app = create_db_app(__name__)
+    with app.app_context():
+        retained = retained_since(args.sensor)
+        since = parse_timestamp(args.since) if args.since else min(retained.values(), default=None)
+        until = parse_timestamp(args.until) if args.until else datetime.utcnow()
+        if since is None:
+            print("No readings to roll up")
+            return
+
+        total = 0
+        started = time.perf_counter()
+        for start, end in day_windows(since, until):
+            window_started = time.perf_counter()
+            rows = backfill_window(start, end, args.sensor, retained)
+            total += rows
+            print(f"{start.date()}: {rows} readings in {time.perf_counter() - window_started:.2f}s")
+
+        print(f"Rolled up {total} readings in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Delete sensor readings and rollups that are past their retention period.
+
+One ingestion process, the holder of MAINTENANCE_LOCK_FILE, runs the purge
+every RETENTION_INTERVAL_SECONDS; this runs it once, for example from cron
+when RETENTION_INTERVAL_SECONDS is 0 or after a retention policy is
+shortened, and refuses to while that process holds the lock. Rows are deleted in chunks of
+RETENTION_CHUNK_SIZE, each in its own transaction, so the command can be
+interrupted and re-run.
+
+Usage:
+    python -m app.scripts.purge_readings [--chunk-size 5000]
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.config.database import create_db_app
+from app.services.maintenance import MAINTENANCE_LOCK_FILE, maintenance_lock
+from app.services.retention import RetentionPurger, RETENTION_CHUNK_SIZE, RETENTION_CHUNK_PAUSE_MS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete expired sensor readings and rollups')
+    parser.add_argument('--chunk-size', type=int, default=RETENTION_CHUNK_SIZE, help='Rows deleted per transaction')
+    parser.add_argument('--pause-ms', type=int, default=RETENTION_CHUNK_PAUSE_MS, help='Pause between chunks')
+    args = parser.parse_args()
+    if not maintenance_lock.acquire():
+        parser.exit(1, f"Another process holds the maintenance lock {MAINTENANCE_LOCK_FILE}\n")
+
+    purger = RetentionPurger(interval=0, chunk_size=args.chunk_size, chunk_pause_ms=args.pause_ms)
+    purger.init_app(create_db_app(__name__))
+    result = purger.run_once()
+
+    purged = result['purged']
+    print(
+        f"Purged {purged['raw']} readings and {purged['1m']}/{purged['1h']}/{purged['1d']} "
+        f"1m/1h/1d rollups from {result['sensors']} sensors in {result['duration_ms'] / 1000.0:.2f}s"
+    )
+    for name in result['partitions_dropped']:
+        print(f"Dropped partition {name}")
+
+
+if __name__ == '__main__':
+    main()
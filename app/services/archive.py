@@ -0,0 +1,478 @@
+import logging
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.config.database import db
+from app.services.maintenance import MAINTENANCE_ENABLED, maintenance_process
+from app.utils.arrays import TIMESTAMP, raw_timestamp, rows_to_arrays
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Archive Configuration
+READINGS_ARCHIVE_DIR = os.getenv('READINGS_ARCHIVE_DIR', '')
+READINGS_ARCHIVE_AFTER_DAYS = int(os.getenv('READINGS_ARCHIVE_AFTER_DAYS', 30))
+READINGS_ARCHIVE_INTERVAL_SECONDS = int(os.getenv('READINGS_ARCHIVE_INTERVAL_SECONDS', 86400))
+READINGS_ARCHIVE_DELETE_CHUNK = int(os.getenv('READINGS_ARCHIVE_DELETE_CHUNK', 5000))
+
+# Segment file layout: header, block index, then the timestamp, value and id columns.
+# Timestamps are int64 microseconds since the epoch (UTC), sorted ascending.
+SEGMENT_MAGIC = b'IRC1'
+SEGMENT_HEADER = struct.Struct('<4sHHIQQqq20x')
+SEGMENT_SUFFIX = '.readings'
+SEGMENT_NAME = re.compile(r'^(\d{6})\.readings$')
+
+# Every BLOCK_SIZE-th timestamp goes in the header index, so a range lookup
+# touches the index and one block instead of binary searching the whole column
+BLOCK_SIZE = 4096
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def month_start(timestamp):
+    """Return the first instant of the month containing `timestamp`"""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    """Return the first instant of the month after `start`"""
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def to_micros(timestamp):
+    """Convert a naive UTC datetime to microseconds since the epoch"""
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class ReadingRecord:
+    """A reading served from the archive or from memory, with the same fields as SensorReading"""
+
+    __slots__ = ('id', 'value', 'timestamp', 'sensor_id')
+
+    def __init__(self, reading_id, value, timestamp, sensor_id):
+        self.id = reading_id
+        self.value = value
+        self.timestamp = timestamp
+        self.sensor_id = sensor_id
+
+    def to_dict(self):
+        """Convert reading to dictionary"""
+        return {
+            'id': self.id,
+            'value': self.value,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'sensor_id': self.sensor_id
+        }
+
+
+def reading_records(sensor_id, timestamps, values, ids):
+    """Build ReadingRecords from int64 microsecond timestamp, value and id columns"""
+    return [
+        ReadingRecord(reading_id, value, timestamp, sensor_id)
+        for reading_id, value, timestamp in zip(
+            ids.tolist(), values.tolist(), timestamps.astype('datetime64[us]').astype(object)
+        )
+    ]
+
+
+class ArchiveSegment:
+    """One sensor's archived readings for one month, memory-mapped"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(SEGMENT_HEADER.size)
+        magic, version, _, self.block_size, self.count, index_length, self.first, self.last = SEGMENT_HEADER.unpack(header)
+        if magic != SEGMENT_MAGIC or version != 1:
+            raise ValueError(f"{path} is not a readings archive segment")
+
+        offset = SEGMENT_HEADER.size
+        self.index = self._column(np.int64, offset, index_length)
+        offset += index_length * 8
+        self.timestamps = self._column(np.int64, offset, self.count)
+        self.values = self._column(np.float64, offset + self.count * 8, self.count)
+        self.ids = self._column(np.int64, offset + self.count * 16, self.count)
+
+    def _column(self, dtype, offset, length):
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=(length,))
+
+    def bounds(self, start=None, end=None):
+        """Return the [low, high) row positions of readings with start <= timestamp <= end"""
+        low, high = 0, self.count
+        if start is not None:
+            low = self._search(to_micros(start), 'left')
+        if end is not None:
+            high = self._search(to_micros(end), 'right')
+        return low, max(low, high)
+
+    def _search(self, micros, side):
+        """Find a timestamp's row position through the block index"""
+        block = max(0, int(np.searchsorted(self.index, micros, side)) - 1)
+        low = block * self.block_size
+        high = min(self.count, low + 2 * self.block_size)
+        return low + int(np.searchsorted(self.timestamps[low:high], micros, side))
+
+    @staticmethod
+    def write(path, timestamps, values, ids):
+        """Write sorted columns to a new segment, replacing any segment at `path` atomically"""
+        index = timestamps[::BLOCK_SIZE]
+        header = SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC, 1, 0, BLOCK_SIZE, len(timestamps), len(index),
+            int(timestamps[0]) if len(timestamps) else 0,
+            int(timestamps[-1]) if len(timestamps) else 0
+        )
+        # A temporary file of its own, so a concurrent writer never replaces the segment with a partial file
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                for column, dtype in ((index, '<i8'), (timestamps, '<i8'), (values, '<f8'), (ids, '<i8')):
+                    f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+
+class ReadingArchive:
+    """Moves old readings out of the database into per-sensor, per-month columnar files.
+
+    Readings older than `after_days` are copied, one sensor and month at a
+    time, into a segment under `<directory>/<sensor id>/<YYYYMM>.readings`,
+    then deleted from the database in chunks. Readings that arrive late for
+    an archived month are merged into its segment on the next run. Range reads
+    merge the archive with the readings still in the database.
+    """
+
+    def __init__(self, directory=READINGS_ARCHIVE_DIR, after_days=READINGS_ARCHIVE_AFTER_DAYS,
+                 interval=READINGS_ARCHIVE_INTERVAL_SECONDS, delete_chunk=READINGS_ARCHIVE_DELETE_CHUNK):
+        self.directory = directory
+        self.after_days = after_days
+        self.interval = interval
+        self.delete_chunk = delete_chunk
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.archived = 0
+        self.segments_written = 0
+        self.last_run = None
+
+    @property
+    def enabled(self):
+        """Whether readings are archived"""
+        return bool(self.directory)
+
+    def init_app(self, app):
+        """Bind the archive to the Flask app and start the background thread"""
+        self.app = app
+        if (self.enabled and self.after_days > 0 and self._thread is None and self.interval > 0
+                and MAINTENANCE_ENABLED):
+            self._thread = threading.Thread(target=self._run, name='reading-archiver', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Archive thread loop, running only in the process holding the maintenance lock"""
+        while True:
+            time.sleep(self.interval)
+            if not maintenance_process():
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error archiving sensor readings: {e}")
+
+    # Files
+
+    def _sensor_directory(self, sensor_id):
+        return os.path.join(self.directory, str(sensor_id))
+
+    def _segment_path(self, sensor_id, start):
+        return os.path.join(self._sensor_directory(sensor_id), f'{start:%Y%m}{SEGMENT_SUFFIX}')
+
+    def segments(self, sensor_id, start=None, end=None):
+        """Return the sensor's segments for months overlapping [start, end], oldest first"""
+        if not self.enabled:
+            return []
+        try:
+            names = os.listdir(self._sensor_directory(sensor_id))
+        except FileNotFoundError:
+            return []
+
+        segments = []
+        for name in sorted(names):
+            match = SEGMENT_NAME.match(name)
+            if not match:
+                continue
+            month = datetime.strptime(match.group(1), '%Y%m')
+            if (end is None or month <= end) and (start is None or next_month(month) > start):
+                segments.append(ArchiveSegment(os.path.join(self._sensor_directory(sensor_id), name)))
+        return segments
+
+    # Reads
+
+    def read(self, sensor_id, start=None, end=None):
+        """Return (timestamps, values, ids) arrays of a sensor's archived readings in [start, end]"""
+        parts = []
+        for segment in self.segments(sensor_id, start, end):
+            low, high = segment.bounds(start, end)
+            if high > low:
+                parts.append((segment.timestamps[low:high], segment.values[low:high], segment.ids[low:high]))
+        if not parts:
+            return np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.int64)
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def count(self, sensor_id, start=None, end=None):
+        """Count a sensor's archived readings in [start, end] from the segment indexes"""
+        total = 0
+        for segment in self.segments(sensor_id, start, end):
+            low, high = segment.bounds(start, end)
+            total += high - low
+        return total
+
+    def oldest(self, sensor_id):
+        """Return the timestamp of a sensor's oldest archived reading, or None"""
+        for segment in self.segments(sensor_id):
+            if segment.count:
+                return EPOCH + timedelta(microseconds=int(segment.first))
+        return None
+
+    def rows(self, sensor_ids, start, end):
+        """Yield (sensor_id, value, timestamp) for archived readings in [start, end)"""
+        for sensor_id in sensor_ids:
+            timestamps, values, _ = self.read(sensor_id, start, end)
+            for micros, value in zip(timestamps.tolist(), values.tolist()):
+                timestamp = EPOCH + timedelta(microseconds=micros)
+                if timestamp < end:
+                    yield sensor_id, value, timestamp
+
+    def stream(self, sensor_id, start=None, end=None, chunk_rows=BLOCK_SIZE):
+        """Yield (id, timestamp, value) for a sensor's archived readings in [start, end], oldest first.
+
+        Rows are converted from the memory-mapped columns `chunk_rows` at a
+        time, so only one chunk is ever held in memory.
+        """
+        for segment in self.segments(sensor_id, start, end):
+            low, high = segment.bounds(start, end)
+            for offset in range(low, high, chunk_rows):
+                stop = min(high, offset + chunk_rows)
+                yield from zip(
+                    segment.ids[offset:stop].tolist(),
+                    segment.timestamps[offset:stop].astype('datetime64[us]').astype(object),
+                    segment.values[offset:stop].tolist()
+                )
+
+    def sensor_ids(self):
+        """Return the ids of sensors with archived readings"""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name) for name in os.listdir(self.directory) if name.isdigit())
+
+    def readings(self, sensor_id, start=None, end=None, limit=None, descending=True, before=None):
+        """Return a sensor's readings in [start, end] from the database and the archive.
+
+        Live readings are SensorReading rows and archived ones are
+        ReadingRecords, merged in (timestamp, id) order. A reading present
+        in both, left by an interrupted archive run, is returned once.
+        `before` is a (timestamp, id) keyset cursor; only readings ordered
+        before it are returned.
+        """
+        from app.services.partitions import reading_partitions
+
+        if before is not None:
+            end = before[0] if end is None or end > before[0] else end
+
+        live = reading_partitions.fetch(sensor_id, start, end, limit=limit, descending=descending, before=before)
+
+        timestamps, values, ids = self.read(sensor_id, start, end)
+        if before is not None and len(ids):
+            keep = (timestamps < to_micros(before[0])) | (ids < before[1])
+            timestamps, values, ids = timestamps[keep], values[keep], ids[keep]
+        if not len(ids):
+            return live
+        if limit:
+            # Only the newest (or oldest) `limit` archived readings can make the cut
+            timestamps, values, ids = (column[-limit:] if descending else column[:limit]
+                                       for column in (timestamps, values, ids))
+
+        seen = {reading.id for reading in live}
+        merged = list(live)
+        merged.extend(
+            record for record in reading_records(sensor_id, timestamps, values, ids) if record.id not in seen
+        )
+        merged.sort(key=lambda reading: (reading.timestamp, reading.id), reverse=descending)
+        return merged[:limit] if limit else merged
+
+    def columns(self, sensor_ids, start=None, end=None):
+        """Return {sensor_id: (timestamps, values, ids)} arrays of several sensors' readings in [start, end].
+
+        The database is read for all the sensors together and merged with each
+        sensor's archived readings in (timestamp, id) order. A reading present
+        in both is returned once. Sensors without readings are left out.
+        """
+        from app.services.partitions import reading_partitions
+
+        columns = reading_partitions.columns(sensor_ids, start, end)
+        for sensor_id in sensor_ids:
+            archived = self.read(sensor_id, start, end)
+            if not len(archived[2]):
+                continue
+            live = columns.get(sensor_id)
+            if live is not None:
+                keep = ~np.isin(archived[2], live[2])
+                merged = [np.concatenate((old[keep], new)) for old, new in zip(archived, live)]
+                order = np.lexsort((merged[2], merged[0]))
+                archived = tuple(column[order] for column in merged)
+            columns[sensor_id] = archived
+        return columns
+
+    # Archiving
+
+    def run_once(self, now=None):
+        """Archive every full month of readings older than `after_days`"""
+        from app.services.partitions import reading_partitions
+
+        with self._lock:
+            now = now or datetime.utcnow()
+            started = time.perf_counter()
+            # Only whole months are archived, so a segment never needs splitting
+            boundary = month_start(now - timedelta(days=self.after_days))
+            archived = 0
+            segments = 0
+
+            with self.app.app_context():
+                Reading = reading_partitions.readings(None, boundary)
+                pending = db.session.query(Reading.sensor_id, db.func.min(Reading.timestamp)).filter(
+                    Reading.timestamp < boundary
+                ).group_by(Reading.sensor_id).all()
+                db.session.commit()
+
+                for sensor_id, oldest in pending:
+                    month = month_start(oldest)
+                    while month < boundary:
+                        rows = self.archive_month(sensor_id, month)
+                        if rows:
+                            archived += rows
+                            segments += 1
+                        month = next_month(month)
+
+            elapsed = time.perf_counter() - started
+            self.runs += 1
+            self.archived += archived
+            self.segments_written += segments
+            self.last_run = {
+                'finished_at': datetime.utcnow().isoformat(),
+                'duration_ms': round(elapsed * 1000.0, 3),
+                'boundary': boundary.isoformat(),
+                'archived': archived,
+                'segments': segments
+            }
+
+        if archived:
+            logger.info(f"Archived {archived} readings into {segments} segments in {elapsed:.2f}s")
+        return self.last_run
+
+    def archive_month(self, sensor_id, start):
+        """Move one sensor's readings for the month starting at `start` into its segment"""
+        from app.services.partitions import reading_partitions
+
+        end = next_month(start)
+        Reading = reading_partitions.readings(start, end)
+        statement = db.select(Reading.id, Reading.value, raw_timestamp(Reading.timestamp)).where(
+            Reading.sensor_id == sensor_id,
+            Reading.timestamp >= start,
+            Reading.timestamp < end
+        )
+        # Rows are fetched a chunk at a time straight into arrays, so a month never sits in memory as row tuples
+        parts = [
+            rows_to_arrays(rows, (np.int64, np.float64, TIMESTAMP))
+            for rows in db.session.execute(statement.execution_options(yield_per=self.delete_chunk)).partitions()
+        ]
+        db.session.commit()
+        if not parts:
+            return 0
+
+        ids, values, timestamps = (np.concatenate(column) for column in zip(*parts))
+        archived_ids = ids
+
+        # Merge with what an earlier run archived for this month
+        path = self._segment_path(sensor_id, start)
+        if os.path.exists(path):
+            segment = ArchiveSegment(path)
+            ids = np.concatenate([np.array(segment.ids), ids])
+            values = np.concatenate([np.array(segment.values), values])
+            timestamps = np.concatenate([np.array(segment.timestamps), timestamps])
+            del segment
+            _, first = np.unique(ids, return_index=True)
+            ids, values, timestamps = ids[first], values[first], timestamps[first]
+
+        order = np.lexsort((ids, timestamps))
+        os.makedirs(self._sensor_directory(sensor_id), exist_ok=True)
+        ArchiveSegment.write(path, timestamps[order], values[order], ids[order])
+
+        # The segment is durable, so the rows can go; a crash in between only leaves duplicates that reads skip
+        tables = reading_partitions.tables(start, end)
+        for offset in range(0, len(archived_ids), self.delete_chunk):
+            chunk = archived_ids[offset:offset + self.delete_chunk].tolist()
+            try:
+                for table in tables:
+                    db.session.execute(table.delete().where(
+                        table.c.sensor_id == sensor_id,
+                        table.c.timestamp >= start,
+                        table.c.timestamp < end,
+                        table.c.id.in_(chunk)
+                    ))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        return len(archived_ids)
+
+    # Retention
+
+    def purge(self, sensor_id, cutoff):
+        """Delete a sensor's segments for months that ended on or before `cutoff`, returning their row count"""
+        purged = 0
+        for segment in self.segments(sensor_id, None, cutoff):
+            month = datetime.strptime(SEGMENT_NAME.match(os.path.basename(segment.path)).group(1), '%Y%m')
+            if next_month(month) <= cutoff:
+                purged += segment.count
+                os.remove(segment.path)
+        return purged
+
+    def delete_sensors(self, sensor_ids):
+        """Delete every segment of the given sensors"""
+        for sensor_id in sensor_ids:
+            for segment in self.segments(sensor_id):
+                os.remove(segment.path)
+
+    def get_stats(self):
+        """Return archive totals and the outcome of the last run"""
+        return {
+            'directory': self.directory or None,
+            'after_days': self.after_days,
+            'runs': self.runs,
+            'archived': self.archived,
+            'segments_written': self.segments_written,
+            'last_run': self.last_run
+        }
+
+
+# Process-wide archive, enabled when READINGS_ARCHIVE_DIR is set
+reading_archive = ReadingArchive()
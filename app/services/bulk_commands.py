@@ -0,0 +1,114 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from app.services.commands import command_tracker
+from app.services.metrics import LatencyTracker
+
+# Load environment variables
+load_dotenv()
+
+# Bulk command Configuration
+BULK_COMMAND_RATE = float(os.getenv('BULK_COMMAND_RATE', 1000))
+BULK_COMMAND_BURST = int(os.getenv('BULK_COMMAND_BURST', 100))
+BULK_PROGRESS_EVERY = int(os.getenv('BULK_PROGRESS_EVERY', 500))
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` operations per second with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        """Block until one operation may proceed"""
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+def run_bulk_command(targets, command, params, publish, rate=BULK_COMMAND_RATE, wait=False,
+                     timeout=None, progress_every=BULK_PROGRESS_EVERY):
+    """Send one command to many devices, yielding result and progress records as it runs.
+
+    `targets` is a list of (id, device_id) tuples and `publish` is called as
+    publish(device_id, command, params) returning a command ID or None. Commands
+    are published back to back through a token bucket; with `wait` the run then
+    collects acknowledgements until `timeout` and reports each as it arrives.
+    """
+    total = len(targets)
+    limiter = TokenBucket(rate, BULK_COMMAND_BURST)
+    latency = LatencyTracker()
+    counts = {'sent': 0, 'failed': 0, 'acknowledged': 0, 'timeout': 0}
+    started = time.monotonic()
+
+    yield {'type': 'start', 'command': command, 'total': total}
+
+    # Publish every command without waiting for acknowledgements in between
+    outstanding = {}
+    for index, (id, device_id) in enumerate(targets, start=1):
+        limiter.acquire()
+        command_id = publish(device_id, command, params)
+        if command_id:
+            counts['sent'] += 1
+            outstanding[command_id] = (id, device_id)
+            if not wait:
+                yield {'type': 'result', 'id': id, 'device_id': device_id,
+                       'command_id': command_id, 'status': 'sent'}
+        else:
+            counts['failed'] += 1
+            yield {'type': 'result', 'id': id, 'device_id': device_id,
+                   'command_id': None, 'status': 'failed', 'error': 'Failed to send command'}
+
+        if progress_every and index % progress_every == 0:
+            yield {'type': 'progress', 'published': index, 'total': total, **counts}
+
+    # Collect acknowledgements as they arrive, reporting progress about once a second
+    if wait:
+        deadline = time.monotonic() + (timeout if timeout is not None else command_tracker.timeout)
+        last_progress = time.monotonic()
+        while outstanding:
+            expired = time.monotonic() >= deadline
+            for command_id in list(outstanding):
+                pending = command_tracker.get(command_id)
+                status = pending.status if pending is not None else 'timeout'
+                if status == 'pending':
+                    if not expired:
+                        continue
+                    status = 'timeout'
+
+                id, device_id = outstanding.pop(command_id)
+                counts[status if status in counts else 'failed'] += 1
+                latency_ms = None
+                if pending is not None and pending.latency is not None:
+                    latency.record(pending.latency)
+                    latency_ms = round(pending.latency * 1000.0, 3)
+                yield {'type': 'result', 'id': id, 'device_id': device_id, 'command_id': command_id,
+                       'status': status, 'latency_ms': latency_ms}
+
+            if outstanding:
+                if time.monotonic() - last_progress >= 1.0:
+                    last_progress = time.monotonic()
+                    yield {'type': 'progress', 'published': total, 'total': total,
+                           'outstanding': len(outstanding), **counts,
+                           'ack_latency': latency.to_dict()}
+                time.sleep(0.05)
+
+    yield {
+        'type': 'summary',
+        'total': total,
+        **counts,
+        'elapsed_ms': round((time.monotonic() - started) * 1000.0, 3),
+        'ack_latency': latency.to_dict()
+    }
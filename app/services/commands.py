@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from app.services.metrics import LatencyTracker
+
+# Load environment variables
+load_dotenv()
+
+# Command Configuration
+MQTT_COMMAND_QOS = int(os.getenv('MQTT_COMMAND_QOS', 1))
+COMMAND_TIMEOUT_SECONDS = float(os.getenv('COMMAND_TIMEOUT_SECONDS', 10))
+COMMAND_RESULT_TTL_SECONDS = float(os.getenv('COMMAND_RESULT_TTL_SECONDS', 300))
+COMMAND_LATENCY_WINDOW = int(os.getenv('COMMAND_LATENCY_WINDOW', 256))
+# Command names given their own latency entry; commands seen after that are counted under 'other'
+COMMAND_LATENCY_TYPES = int(os.getenv('COMMAND_LATENCY_TYPES', 64))
+
+
+class PendingCommand:
+    """A command sent to a device and the state of its acknowledgement"""
+
+    __slots__ = ('command_id', 'device_id', 'command', 'params', 'status', 'response', 'error',
+                 'created_at', 'sent_at', 'deadline', 'completed_at', 'latency', '_event')
+
+    def __init__(self, device_id, command, params, timeout):
+        self.command_id = uuid.uuid4().hex
+        self.device_id = device_id
+        self.command = command
+        self.params = params
+        self.status = 'pending'
+        self.response = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.sent_at = time.monotonic()
+        self.deadline = self.sent_at + timeout
+        self.completed_at = None
+        self.latency = None
+        self._event = threading.Event()
+
+    def complete(self, status, response=None, error=None):
+        """Mark the command as finished and wake anyone waiting for it"""
+        self.status = status
+        self.response = response
+        self.error = error
+        self.completed_at = time.monotonic()
+        self._event.set()
+
+    def wait(self, timeout):
+        """Block until the command completes or `timeout` seconds pass"""
+        return self._event.wait(timeout)
+
+    def to_dict(self):
+        """Convert command state to dictionary"""
+        return {
+            'command_id': self.command_id,
+            'device_id': self.device_id,
+            'command': self.command,
+            'params': self.params,
+            'status': self.status,
+            'response': self.response,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'latency_ms': round(self.latency * 1000.0, 3) if self.latency is not None else None
+        }
+
+
+class CommandTracker:
+    """In-memory table of commands awaiting a device response.
+
+    Commands are matched to `devices/<id>/response` messages by the `command_id`
+    the device echoes back. Commands that get no response before their deadline
+    are marked `timeout`, and finished commands stay available for polling for
+    `result_ttl` seconds. Round-trip latency is tracked per device and per
+    command type, for at most `latency_types` command names since clients
+    choose them.
+    """
+
+    def __init__(self, timeout=COMMAND_TIMEOUT_SECONDS, result_ttl=COMMAND_RESULT_TTL_SECONDS,
+                 latency_window=COMMAND_LATENCY_WINDOW, latency_types=COMMAND_LATENCY_TYPES):
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.latency_window = latency_window
+        self.latency_types = latency_types
+
+        # command_id -> PendingCommand, oldest first
+        self._commands = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+        self.latency = LatencyTracker()
+        self._device_latency = {}
+        self._command_latency = {}
+        self.sent = 0
+        self.acknowledged = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def create(self, device_id, command, params=None, timeout=None):
+        """Register a new command and return it"""
+        pending = PendingCommand(device_id, command, params or {}, timeout or self.timeout)
+        with self._lock:
+            self._commands[pending.command_id] = pending
+            self.sent += 1
+        self._sweep()
+        return pending
+
+    def get(self, command_id):
+        """Return a tracked command by id, or None"""
+        self._sweep()
+        return self._commands.get(command_id)
+
+    def fail(self, command_id, error):
+        """Mark a command as failed before it reached the device"""
+        pending = self._commands.get(command_id)
+        if pending is not None and pending.status == 'pending':
+            pending.complete('failed', error=error)
+            with self._lock:
+                self.failed += 1
+
+    def resolve(self, device_id, payload):
+        """Match a device response to its command, returning the command or None"""
+        command_id = payload.get('command_id') if isinstance(payload, dict) else None
+        pending = self._commands.get(command_id) if command_id else None
+        if pending is None or pending.device_id != device_id or pending.status != 'pending':
+            return None
+
+        latency = time.monotonic() - pending.sent_at
+        pending.latency = latency
+        success = payload.get('success', True)
+        pending.complete('acknowledged' if success else 'failed', response=payload,
+                         error=None if success else payload.get('message'))
+
+        with self._lock:
+            if success:
+                self.acknowledged += 1
+            else:
+                self.failed += 1
+            device_latency = self._device_latency.get(device_id)
+            if device_latency is None:
+                device_latency = self._device_latency[device_id] = LatencyTracker(self.latency_window)
+            command = str(pending.command)
+            if command not in self._command_latency and len(self._command_latency) >= self.latency_types:
+                command = 'other'
+            command_latency = self._command_latency.get(command)
+            if command_latency is None:
+                command_latency = self._command_latency[command] = LatencyTracker()
+
+        self.latency.record(latency)
+        device_latency.record(latency)
+        command_latency.record(latency)
+        return pending
+
+    def wait(self, command_id, timeout):
+        """Wait up to `timeout` seconds (and no longer than the command's deadline) for a response"""
+        pending = self._commands.get(command_id)
+        if pending is None:
+            return None
+        remaining = min(timeout, pending.deadline - time.monotonic())
+        if remaining > 0:
+            pending.wait(remaining)
+        self._sweep(force=True)
+        return pending
+
+    def _sweep(self, force=False):
+        """Expire overdue commands and forget finished ones past their TTL"""
+        now = time.monotonic()
+        if not force and now - self._last_sweep < 1.0:
+            return
+        self._last_sweep = now
+
+        with self._lock:
+            expired = []
+            for command_id, pending in self._commands.items():
+                if pending.status == 'pending' and now >= pending.deadline:
+                    pending.complete('timeout', error='No response from device')
+                    self.timed_out += 1
+                finished_at = pending.completed_at
+                if finished_at is not None and now - finished_at >= self.result_ttl:
+                    expired.append(command_id)
+                elif pending.status == 'pending':
+                    # Commands are ordered by send time, later ones cannot be overdue yet
+                    break
+            for command_id in expired:
+                del self._commands[command_id]
+
+    def device_latency(self, device_id):
+        """Return round-trip latency percentiles for one device"""
+        tracker = self._device_latency.get(device_id)
+        return tracker.to_dict() if tracker is not None else LatencyTracker().to_dict()
+
+    def get_stats(self):
+        """Return counters and round-trip latency percentiles overall and per command type"""
+        with self._lock:
+            pending = sum(1 for command in self._commands.values() if command.status == 'pending')
+            by_command = dict(self._command_latency)
+        return {
+            'sent': self.sent,
+            'acknowledged': self.acknowledged,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'pending': pending,
+            'latency': self.latency.to_dict(),
+            'by_command': {command: tracker.to_dict() for command, tracker in by_command.items()}
+        }
+
+
+# Process-wide tracker used by publish_command and the MQTT response handler
+command_tracker = CommandTracker()
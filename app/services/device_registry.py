@@ -0,0 +1,144 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceInfo:
+    """What the MQTT path needs to know about a device"""
+
+    __slots__ = ('id', 'device_id', 'user_id', 'device_type', 'sensors', 'payload_format')
+
+    def __init__(self, id, device_id, user_id, device_type, sensors=None, payload_format='json'):
+        self.id = id
+        self.device_id = device_id
+        self.user_id = user_id
+        self.device_type = device_type
+        # sensor_type -> Sensor.id
+        self.sensors = sensors if sensors is not None else {}
+        # Wire format negotiated through the device's metadata
+        self.payload_format = payload_format or 'json'
+
+    def __repr__(self):
+        return f'<DeviceInfo {self.device_id} ({self.id})>'
+
+
+def payload_format_from_metadata(metadata):
+    """Read the negotiated payload format from device metadata"""
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return 'json'
+    if isinstance(metadata, dict):
+        return metadata.get('payload_format', 'json')
+    return 'json'
+
+
+class DeviceRegistry:
+    """Process-wide map from MQTT device_id to device identity and sensor ids.
+
+    Warmed from the database at startup and kept current by the device routes,
+    so resolving an inbound message never needs a query.
+    """
+
+    def __init__(self):
+        self._by_device_id = {}
+        self._by_id = {}
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def warm(self, app):
+        """Load every device and sensor from the database"""
+        from app.config.database import db
+        from app.models.device import Device, Sensor
+
+        with app.app_context():
+            columns = Device.__table__.c
+            devices = db.session.query(
+                columns.id, columns.device_id, columns.user_id, columns.device_type, columns.metadata
+            ).all()
+            sensors = db.session.query(Sensor.id, Sensor.device_id, Sensor.sensor_type).all()
+
+        by_id = {
+            id: DeviceInfo(id, device_id, user_id, device_type,
+                           payload_format=payload_format_from_metadata(metadata))
+            for id, device_id, user_id, device_type, metadata in devices
+        }
+        for sensor_id, device_pk, sensor_type in sensors:
+            info = by_id.get(device_pk)
+            if info is not None:
+                info.sensors.setdefault(sensor_type, sensor_id)
+
+        with self._lock:
+            self._by_id = by_id
+            self._by_device_id = {info.device_id: info for info in by_id.values()}
+
+        logger.info(f"Device registry loaded {len(by_id)} devices and {len(sensors)} sensors")
+
+    def start_refresh(self, app, interval):
+        """Reload the registry every `interval` seconds in a background thread.
+
+        Processes that do not serve the device routes (ingestion workers) use
+        this to pick up devices added or changed through the web app.
+        """
+        if interval <= 0 or self._refresh_thread is not None:
+            return
+
+        def refresh():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.warm(app)
+                except Exception as e:
+                    logger.error(f"Error refreshing device registry: {e}")
+
+        self._refresh_thread = threading.Thread(target=refresh, name='device-registry-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def get(self, device_id):
+        """Return the DeviceInfo for an MQTT device_id, or None"""
+        return self._by_device_id.get(device_id)
+
+    def get_by_id(self, id):
+        """Return the DeviceInfo for a Device primary key, or None"""
+        return self._by_id.get(id)
+
+    def register(self, device):
+        """Add or refresh a device from its model instance"""
+        with self._lock:
+            previous = self._by_id.get(device.id)
+            sensors = dict(previous.sensors) if previous else {}
+            if previous is None:
+                for sensor in device.sensors:
+                    sensors.setdefault(sensor.sensor_type, sensor.id)
+            elif previous.device_id != device.device_id:
+                self._by_device_id.pop(previous.device_id, None)
+
+            info = DeviceInfo(device.id, device.device_id, device.user_id, device.device_type, sensors,
+                              payload_format_from_metadata(device.get_metadata()))
+            self._by_id[info.id] = info
+            self._by_device_id[info.device_id] = info
+        return info
+
+    def unregister(self, device_id):
+        """Remove a device by its MQTT device_id"""
+        with self._lock:
+            info = self._by_device_id.pop(device_id, None)
+            if info is not None:
+                self._by_id.pop(info.id, None)
+
+    def add_sensor(self, device_id, sensor_type, sensor_id):
+        """Record the Sensor.id that readings of `sensor_type` go to"""
+        info = self._by_device_id.get(device_id)
+        if info is not None:
+            info.sensors.setdefault(sensor_type, sensor_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+# Process-wide registry used by the MQTT client and device routes
+device_registry = DeviceRegistry()
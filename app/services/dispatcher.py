@@ -0,0 +1,156 @@
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+from app.services.metrics import LatencyTracker
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Dispatcher Configuration
+MQTT_WORKERS = int(os.getenv('MQTT_WORKERS', 4))
+MQTT_QUEUE_SIZE = int(os.getenv('MQTT_QUEUE_SIZE', 10000))
+MQTT_OVERFLOW_POLICY = os.getenv('MQTT_OVERFLOW_POLICY', 'drop_oldest')
+MQTT_BLOCK_TIMEOUT_MS = int(os.getenv('MQTT_BLOCK_TIMEOUT_MS', 100))
+
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+
+class MessageDispatcher:
+    """Hands messages from the network thread to a bounded pool of handler workers.
+
+    Each worker owns its own bounded queue and messages are routed to a worker by
+    hashing their key, so messages sharing a key (a device) are handled in order.
+    When a queue is full the overflow policy decides what happens:
+
+    - ``block``: wait up to ``block_timeout_ms`` for room, then drop the new message
+    - ``drop_newest``: drop the new message immediately
+    - ``drop_oldest``: evict the oldest queued message to make room
+    """
+
+    def __init__(self, handler, workers=MQTT_WORKERS, queue_size=MQTT_QUEUE_SIZE,
+                 overflow_policy=MQTT_OVERFLOW_POLICY, block_timeout_ms=MQTT_BLOCK_TIMEOUT_MS):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.handler = handler
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout_ms / 1000.0
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._threads = []
+
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.handled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.queue_latency = LatencyTracker()
+        self.handler_latency = LatencyTracker()
+
+    def start(self):
+        """Start the worker threads"""
+        if self._threads:
+            return
+        for index, work_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._work, args=(work_queue,), name=f'mqtt-worker-{index}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the workers once their queues are drained"""
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, key, *args):
+        """Queue `handler(*args)` on the worker owning `key`, returning False if dropped"""
+        work_queue = self._queues[zlib.crc32(key.encode()) % len(self._queues)]
+        item = (time.monotonic(), args)
+
+        with self._lock:
+            self.submitted += 1
+
+        try:
+            if self.overflow_policy == 'block':
+                work_queue.put(item, timeout=self.block_timeout)
+            else:
+                work_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        if self.overflow_policy == 'drop_oldest':
+            try:
+                work_queue.get_nowait()
+                work_queue.task_done()
+                self._count_drop()
+                work_queue.put_nowait(item)
+                return True
+            except (queue.Empty, queue.Full):
+                pass
+
+        self._count_drop()
+        return False
+
+    def _count_drop(self):
+        """Count a dropped message"""
+        with self._lock:
+            self.dropped += 1
+            dropped = self.dropped
+        if dropped == 1 or dropped % 1000 == 0:
+            logger.warning(f"MQTT dispatcher queue full, {dropped} messages dropped so far")
+
+    def _work(self, work_queue):
+        """Worker thread loop"""
+        while True:
+            item = work_queue.get()
+            if item is None:
+                work_queue.task_done()
+                break
+
+            queued_at, args = item
+            started = time.monotonic()
+            self.queue_latency.record(started - queued_at)
+            try:
+                self.handler(*args)
+                with self._lock:
+                    self.handled += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"Error processing MQTT message: {e}")
+            finally:
+                self.handler_latency.record(time.monotonic() - started)
+                work_queue.task_done()
+
+    def depth(self):
+        """Return the number of messages waiting across all queues"""
+        return sum(work_queue.qsize() for work_queue in self._queues)
+
+    def get_stats(self):
+        """Return queue depth, counters and latency percentiles"""
+        depths = [work_queue.qsize() for work_queue in self._queues]
+        return {
+            'workers': len(self._queues),
+            'overflow_policy': self.overflow_policy,
+            'queue_depth': sum(depths),
+            'queue_depths': depths,
+            'queue_capacity': self._queues[0].maxsize * len(self._queues),
+            'submitted': self.submitted,
+            'handled': self.handled,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'queue_latency': self.queue_latency.to_dict(),
+            'handler_latency': self.handler_latency.to_dict()
+        }
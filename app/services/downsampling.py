@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Chart Downsampling Configuration ('lttb' or 'minmax')
+CHART_DOWNSAMPLING = os.getenv('CHART_DOWNSAMPLING', 'lttb')
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 10000))
+
+DOWNSAMPLING_METHODS = ('lttb', 'minmax')
+
+
+def _evenly_spaced(count, max_points):
+    """Indices of `max_points` points spread evenly over a series, keeping the first and last"""
+    if max_points <= 1:
+        return np.zeros(min(count, max(max_points, 0)), dtype=np.int64)
+    return np.unique(np.linspace(0, count - 1, max_points).round().astype(np.int64))
+
+
+def lttb(timestamps, values, max_points):
+    """Return the indices of the points Largest-Triangle-Three-Buckets keeps out of a series.
+
+    The first and last points are kept, and the points between them are
+    split into `max_points - 2` buckets. Each bucket keeps the point forming
+    the largest triangle with the point kept before it and the average of
+    the next bucket. Each kept point depends on the one before, so buckets
+    are visited in order, but the work within a bucket and the bucket
+    averages are done with numpy.
+    """
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    if max_points < 3:
+        return _evenly_spaced(count, max_points)
+
+    # Relative times keep the products below small enough for float64
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    y = values.astype(np.float64)
+
+    # Bucket i holds the points in [edges[i], edges[i + 1]); there are more points than buckets, so none is empty
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    averages_x = np.add.reduceat(x[:count - 1], edges[:-1]) / sizes
+    averages_y = np.add.reduceat(y[:count - 1], edges[:-1]) / sizes
+    # The point after each bucket's candidates: the next bucket's average, then the last point
+    next_x = np.append(averages_x[1:], x[-1])
+    next_y = np.append(averages_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        previous_x, previous_y = x[previous], y[previous]
+        # Twice the triangle area, which ranks the candidates the same way
+        areas = np.abs(
+            (previous_x - next_x[bucket]) * (y[low:high] - previous_y)
+            - (previous_x - x[low:high]) * (next_y[bucket] - previous_y)
+        )
+        previous = low + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _first_per_bucket(positions, buckets):
+    """Of `positions` sorted ascending, keep the first in each bucket"""
+    _, first = np.unique(buckets[positions], return_index=True)
+    return positions[first]
+
+
+def minmax(timestamps, values, max_points):
+    """Return the indices of each time bucket's lowest and highest points, at most `max_points` of them.
+
+    The range is cut into `max_points // 2` buckets of equal duration, like
+    the pixel columns of a chart, and every non-empty bucket keeps its
+    minimum and maximum, so no peak or dip is lost. Fully vectorised.
+    """
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    columns = max_points // 2
+    if columns < 1:
+        return _evenly_spaced(count, max_points)
+
+    span = int(timestamps[-1] - timestamps[0]) + 1
+    buckets = ((timestamps - timestamps[0]) * columns // span).astype(np.int64)
+
+    # The readings are in time order, so each bucket is one contiguous run
+    starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+    lowest = np.minimum.reduceat(values, starts)
+    highest = np.maximum.reduceat(values, starts)
+    run = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, count)))
+    minimums = _first_per_bucket(np.flatnonzero(values == lowest[run]), run)
+    maximums = _first_per_bucket(np.flatnonzero(values == highest[run]), run)
+    return np.union1d(minimums, maximums)
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb,
+    'minmax': minmax
+}
+
+
+def chart_points(value):
+    """Clamp a requested max_points to 1..CHART_MAX_POINTS"""
+    return max(1, min(value, CHART_MAX_POINTS))
+
+
+def downsample(timestamps, values, max_points, method=CHART_DOWNSAMPLING):
+    """Return the indices of at most `max_points` points representing a series, in time order.
+
+    `timestamps` are int64 microseconds in ascending order. Series that
+    already fit are returned whole.
+    """
+    if len(values) <= max_points:
+        return np.arange(len(values))
+    return DOWNSAMPLERS[method](timestamps, values, max_points)
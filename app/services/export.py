@@ -0,0 +1,115 @@
+import heapq
+import os
+import zlib
+from itertools import chain, islice
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from app.config.database import db
+from app.utils import codec
+
+# Load environment variables
+load_dotenv()
+
+# Export Configuration
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 5000))
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', 6))
+
+# Media type of each export format
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+CSV_HEADER = b'id,sensor_id,timestamp,value\n'
+
+
+def _table_rows(table, sensor_id, start, end, chunk_rows):
+    """Yield (id, timestamp, value) for a sensor's readings in one table, fetched through a streaming cursor"""
+    statement = select(table.c.id, table.c.timestamp, table.c.value).where(table.c.sensor_id == sensor_id)
+    if start is not None:
+        statement = statement.where(table.c.timestamp >= start)
+    if end is not None:
+        statement = statement.where(table.c.timestamp <= end)
+    statement = statement.order_by(table.c.timestamp, table.c.id).execution_options(yield_per=chunk_rows)
+    for reading_id, timestamp, value in db.session.execute(statement):
+        yield reading_id, timestamp, value
+
+
+def export_rows(sensor_id, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield (id, timestamp, value) for a sensor's readings in [start, end], oldest first.
+
+    The archive, the readings table and the partitions are each read in
+    timestamp order and merged lazily, so memory use does not depend on the
+    size of the range. Partitions cover disjoint periods and are read one
+    after the other; a reading found both in the archive and the database,
+    left by an interrupted archive run, is yielded once.
+    """
+    from app.models.device import SensorReading
+    from app.services.archive import reading_archive
+    from app.services.partitions import reading_partitions
+
+    tables = reading_partitions.tables(start, end)
+    streams = [reading_archive.stream(sensor_id, start, end, chunk_rows)]
+    if tables[0] is SensorReading.__table__:
+        streams.append(_table_rows(tables[0], sensor_id, start, end, chunk_rows))
+        tables = tables[1:]
+    if tables:
+        streams.append(chain.from_iterable(
+            _table_rows(table, sensor_id, start, end, chunk_rows) for table in tables
+        ))
+
+    previous = None
+    for row in heapq.merge(*streams, key=lambda row: (row[1], row[0])):
+        if row[0] != previous:
+            previous = row[0]
+            yield row
+
+
+def _encode_ndjson(sensor_id, rows):
+    return b''.join(
+        codec.dumps({'id': reading_id, 'sensor_id': sensor_id, 'timestamp': timestamp, 'value': value}) + b'\n'
+        for reading_id, timestamp, value in rows
+    )
+
+
+def _encode_csv(sensor_id, rows):
+    return ''.join(
+        f'{reading_id},{sensor_id},{timestamp.isoformat()},{value!r}\n'
+        for reading_id, timestamp, value in rows
+    ).encode()
+
+
+ENCODERS = {
+    'ndjson': _encode_ndjson,
+    'csv': _encode_csv
+}
+
+
+def export_stream(sensor_id, start=None, end=None, fmt='ndjson', compress=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield a sensor's readings encoded as NDJSON or CSV, `chunk_rows` readings per chunk.
+
+    With `compress`, the output is a gzip stream. Each chunk is flushed
+    through the compressor, so the client receives data as it is read
+    rather than when the export ends.
+    """
+    encode = ENCODERS[fmt]
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+
+    def output(data, final=False):
+        if compressor is None:
+            return data
+        data = compressor.compress(data)
+        return data + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    if fmt == 'csv':
+        yield output(CSV_HEADER)
+    rows = export_rows(sensor_id, start, end, chunk_rows)
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            break
+        yield output(encode(sensor_id, chunk))
+    if compressor is not None:
+        yield output(b'', final=True)
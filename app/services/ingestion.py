@@ -0,0 +1,350 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+
+from app.services.device_registry import device_registry
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Ingestion Configuration
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 5000))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv('INGEST_FLUSH_INTERVAL_MS', 250))
+INGEST_MAX_PENDING = int(os.getenv('INGEST_MAX_PENDING', 500000))
+INGEST_STATS_INTERVAL = int(os.getenv('INGEST_STATS_INTERVAL', 60))
+READINGS_BATCH_MAX = int(os.getenv('READINGS_BATCH_MAX', 10000))
+
+# Telemetry values that are not numbers but still map onto a reading
+STATE_VALUES = {'on': 1.0, 'off': 0.0, 'true': 1.0, 'false': 0.0}
+
+
+def parse_timestamp(value):
+    """Convert an ISO string or epoch number from a device into a naive UTC datetime"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, (int, float)):
+        # Compact payloads carry epoch milliseconds, anything this large is not seconds
+        if value > 1e11:
+            value = value / 1000.0
+        return datetime.utcfromtimestamp(value)
+    else:
+        try:
+            value = str(value)
+            if value.endswith('Z'):
+                value = value[:-1]
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    # Readings are stored in naive UTC, so shift timestamps that carry an offset
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def reading_value(value):
+    """Convert a telemetry value to a float, or None if it cannot be stored"""
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        try:
+            value = float(value)
+        except OverflowError:
+            # An integer too large for a float
+            return None
+        # NaN and infinity cannot be stored in the NOT NULL value column
+        return value if math.isfinite(value) else None
+    if isinstance(value, str):
+        return STATE_VALUES.get(value.lower())
+    return None
+
+
+class IngestStats:
+    """Counters describing the throughput of the ingestion pipeline"""
+
+    def __init__(self):
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_rows = 0
+        self.last_flush_ms = 0.0
+        self.started_at = time.monotonic()
+        self._window_start = self.started_at
+        self._window_written = 0
+        self.rows_per_second = 0.0
+
+    def record_flush(self, rows, elapsed):
+        """Record a successful flush of `rows` rows that took `elapsed` seconds"""
+        self.written += rows
+        self.flushes += 1
+        self.last_flush_rows = rows
+        self.last_flush_ms = elapsed * 1000.0
+
+        now = time.monotonic()
+        self._window_written += rows
+        window = now - self._window_start
+        if window >= 1.0:
+            self.rows_per_second = self._window_written / window
+            self._window_start = now
+            self._window_written = 0
+
+    def to_dict(self):
+        """Convert ingestion counters to dictionary"""
+        uptime = time.monotonic() - self.started_at
+        return {
+            'received': self.received,
+            'written': self.written,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_rows': self.last_flush_rows,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'average_rows_per_second': round(self.written / uptime, 1) if uptime else 0.0
+        }
+
+
+class TelemetryIngestor:
+    """Buffers telemetry readings and writes them as SensorReading rows in bulk.
+
+    The MQTT thread only appends to an in-memory buffer. A writer thread flushes
+    the buffer with a single executemany INSERT whenever it holds `batch_size`
+    readings or `flush_interval_ms` has elapsed, whichever comes first.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, flush_interval_ms=INGEST_FLUSH_INTERVAL_MS,
+                 max_pending=INGEST_MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max_pending
+        self.app = None
+        self.stats = IngestStats()
+
+        # Pending readings as (device_id, key, value, timestamp) tuples
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def init_app(self, app):
+        """Bind the ingestor to the Flask app and start the writer thread"""
+        self.app = app
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='telemetry-ingestor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread after flushing what is buffered"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, device_id, payload):
+        """Queue the readings of a telemetry payload for writing"""
+        readings = payload.get('readings')
+        if not isinstance(readings, dict) or device_registry.get(device_id) is None:
+            return 0
+
+        timestamp = parse_timestamp(payload.get('timestamp')) or datetime.utcnow()
+        rows = []
+        for key, raw_value in readings.items():
+            value = reading_value(raw_value)
+            if value is not None:
+                rows.append((device_id, key, value, timestamp))
+
+        with self._lock:
+            self.stats.received += len(rows)
+            overflow = len(self._pending) + len(rows) - self.max_pending
+            if overflow > 0:
+                # Shed the oldest readings rather than grow without bound
+                del self._pending[:overflow]
+                self.stats.dropped += overflow
+            self._pending.extend(rows)
+            pending = len(self._pending)
+
+        if pending >= self.batch_size:
+            self._wakeup.set()
+        return len(rows)
+
+    def pending(self):
+        """Return the number of readings waiting to be written"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write all buffered readings to the database and return the row count"""
+        if self.app is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    written = self._write_accepted(batch)
+            except Exception:
+                self.stats.failed_flushes += 1
+                with self._lock:
+                    # Put the batch back in front of anything received meanwhile
+                    self._pending[:0] = batch
+                    overflow = len(self._pending) - self.max_pending
+                    if overflow > 0:
+                        del self._pending[:overflow]
+                        self.stats.dropped += overflow
+                raise
+
+            self.stats.record_flush(written, time.perf_counter() - started)
+            return written
+
+    def _write_accepted(self, batch):
+        """Write a batch, splitting it to find and drop the readings the database rejects.
+
+        Retrying a batch that violates a constraint would fail the same way on
+        every flush, so only connection and lock errors put readings back in the
+        buffer.
+        """
+        try:
+            return self._write(batch)
+        except IntegrityError as e:
+            if len(batch) == 1:
+                self.stats.rejected += 1
+                logger.warning(f"Dropping reading rejected by the database {batch[0]}: {e.orig}")
+                return 0
+            middle = len(batch) // 2
+            return self._write_accepted(batch[:middle]) + self._write_accepted(batch[middle:])
+
+    def _write(self, batch):
+        """Resolve sensors for a batch and insert its readings"""
+        from app.config.database import db
+        from app.services.partitions import reading_partitions
+        from app.services.recent_readings import recent_readings
+        from app.services.rollups import apply_rollups
+        from app.services.stats import dashboard_stats
+
+        self._create_missing_sensors(batch)
+
+        rows = []
+        for device_id, key, value, timestamp in batch:
+            info = device_registry.get(device_id)
+            sensor_id = info.sensors.get(key) if info is not None else None
+            if sensor_id is not None:
+                rows.append({'sensor_id': sensor_id, 'value': value, 'timestamp': timestamp})
+
+        if rows:
+            try:
+                inserted = reading_partitions.insert(rows, returning=recent_readings.enabled)
+                # Keep the rollups in step with the readings, in the same transaction
+                apply_rollups((row['sensor_id'], row['value'], row['timestamp']) for row in rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            recent_readings.extend(inserted)
+            dashboard_stats.add_readings(rows)
+        return len(rows)
+
+    def _create_missing_sensors(self, batch):
+        """Create a sensor named after each reading key the device has no sensor for"""
+        from app.config.database import db
+        from app.models.device import Sensor
+        from app.services.stats import dashboard_stats
+
+        missing = {}
+        for device_id, key, _, _ in batch:
+            info = device_registry.get(device_id)
+            if info is not None and key not in info.sensors:
+                missing[f"{device_id}:{key}"] = (info, key)
+        if not missing:
+            return
+
+        # Another process may have created some of them already
+        existing = Sensor.query.filter(Sensor.sensor_id.in_(list(missing))).all()
+        for sensor in existing:
+            info, key = missing.pop(sensor.sensor_id)
+            device_registry.add_sensor(info.device_id, key, sensor.id)
+
+        created = []
+        for sensor_id, (info, key) in missing.items():
+            sensor = Sensor(
+                sensor_id=sensor_id,
+                name=key.replace('_', ' ').capitalize(),
+                sensor_type=key,
+                device_id=info.id
+            )
+            db.session.add(sensor)
+            created.append((info, key, sensor))
+
+        if created:
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another ingestion worker created the same sensors in the meantime
+                db.session.rollback()
+                created = [
+                    (missing[sensor.sensor_id][0], missing[sensor.sensor_id][1], sensor)
+                    for sensor in Sensor.query.filter(Sensor.sensor_id.in_(list(missing))).all()
+                ]
+            except Exception:
+                db.session.rollback()
+                raise
+            for info, key, sensor in created:
+                device_registry.add_sensor(info.device_id, key, sensor.id)
+                dashboard_stats.track_sensor(sensor.id, info.id)
+
+    def _run(self):
+        """Writer thread loop"""
+        last_report = time.monotonic()
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing telemetry batch: {e}")
+
+            now = time.monotonic()
+            if INGEST_STATS_INTERVAL and now - last_report >= INGEST_STATS_INTERVAL:
+                last_report = now
+                stats = self.stats.to_dict()
+                logger.info(
+                    f"Telemetry ingestion: {stats['rows_per_second']} rows/s, "
+                    f"{stats['written']} written, {stats['dropped']} dropped, "
+                    f"last flush {stats['last_flush_rows']} rows in {stats['last_flush_ms']} ms"
+                )
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error writing final telemetry batch: {e}")
+
+    def get_stats(self):
+        """Return throughput counters along with the current buffer depth"""
+        stats = self.stats.to_dict()
+        stats['pending'] = self.pending()
+        return stats
+
+
+# Process-wide ingestor used by the MQTT client
+ingestor = TelemetryIngestor()
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+from app.utils.locks import FileLock
+
+# Load environment variables
+load_dotenv()
+
+# Maintenance Configuration
+MAINTENANCE_ENABLED = os.getenv('MAINTENANCE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MAINTENANCE_LOCK_FILE = os.getenv(
+    'MAINTENANCE_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'iot-controller-maintenance.lock')
+)
+
+# Held by the one process that archives and purges readings; every ingestion
+# process tries to take it before each run, so another takes over if it exits
+maintenance_lock = FileLock(MAINTENANCE_LOCK_FILE)
+
+
+def maintenance_process():
+    """Whether this process runs the background archive and retention jobs"""
+    return MAINTENANCE_ENABLED and maintenance_lock.acquire()
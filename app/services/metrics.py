@@ -0,0 +1,41 @@
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Keeps the most recent latency samples and reports percentiles over them"""
+
+    def __init__(self, window=10000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Record one latency sample in seconds"""
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentiles(self, points=(50, 90, 99)):
+        """Return {'p50': ms, ...} over the recent samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {f'p{p}': None for p in points}
+        last = len(samples) - 1
+        return {f'p{p}': round(samples[min(last, int(round(p / 100.0 * last)))] * 1000.0, 3) for p in points}
+
+    def to_dict(self):
+        """Convert latency summary to dictionary, in milliseconds"""
+        summary = {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000.0, 3) if self.count else None,
+            'max_ms': round(self.max * 1000.0, 3)
+        }
+        summary.update({f'{name}_ms': value for name, value in self.percentiles().items()})
+        return summary
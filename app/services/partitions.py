@@ -0,0 +1,521 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, Table, inspect, or_, select, text, union_all
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased
+
+from app.config.database import db
+from app.utils.arrays import TIMESTAMP, raw_timestamp, rows_to_arrays, split_by_key
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Partition Configuration ('day', 'week' or 'month'; empty keeps one readings table)
+READINGS_PARTITION_INTERVAL = os.getenv('READINGS_PARTITION_INTERVAL', '')
+# Seconds between re-reading which partitions exist, as other processes create and drop them
+READINGS_PARTITION_REFRESH_SECONDS = int(os.getenv('READINGS_PARTITION_REFRESH_SECONDS', 60))
+
+PARTITION_INTERVALS = ('day', 'week', 'month')
+
+# Partitions are named after the first day of their period
+PARTITION_PREFIX = 'sensor_readings_p'
+PARTITION_NAME = re.compile(r'^sensor_readings_p(\d{8})$')
+EPOCH = datetime(1970, 1, 1)
+
+# Partitioned parent table on PostgreSQL. The partition key has to be part of the primary key
+POSTGRESQL_PARENT = """
+CREATE TABLE sensor_readings (
+    id SERIAL,
+    value DOUBLE PRECISION NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    sensor_id INTEGER REFERENCES sensors (id),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+
+class ReadingPartitions:
+    """Stores sensor readings in one partition per day, week or month.
+
+    On PostgreSQL `sensor_readings` is a natively partitioned table, so writes
+    are routed and range queries pruned by the database. On SQLite each period
+    gets its own table next to `sensor_readings`, which keeps the readings
+    stored before partitioning was enabled; range queries read a UNION ALL of
+    only the tables overlapping the range. Either way, deleting a period's
+    readings is dropping its partition.
+    """
+
+    def __init__(self, interval=READINGS_PARTITION_INTERVAL, refresh=READINGS_PARTITION_REFRESH_SECONDS):
+        if interval and interval not in PARTITION_INTERVALS:
+            raise ValueError(f"READINGS_PARTITION_INTERVAL must be one of {', '.join(PARTITION_INTERVALS)}")
+        self.interval = interval or None
+        self.refresh = refresh
+        self._lock = threading.RLock()
+        self._metadata = MetaData()
+
+        # Detected on first use: None (one table), 'native' (PostgreSQL) or 'tables' (SQLite)
+        self._loaded = False
+        self._mode = None
+        self._partitions = {}
+        self._listed_at = None
+        self._legacy_end = None
+
+    # Periods
+
+    def period_start(self, timestamp):
+        """Return the start of the partition period containing `timestamp`"""
+        day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.interval == 'week':
+            return day - timedelta(days=day.weekday())
+        if self.interval == 'month':
+            return day.replace(day=1)
+        return day
+
+    def period_end(self, start):
+        """Return the start of the period after the one starting at `start`"""
+        if self.interval == 'week':
+            return start + timedelta(days=7)
+        if self.interval == 'month':
+            return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start + timedelta(days=1)
+
+    # Setup
+
+    def create_parent(self):
+        """Create `sensor_readings` as a partitioned table on a new PostgreSQL database.
+
+        Must run before create_all(), which would otherwise create a plain table.
+        """
+        if self.interval is None or db.engine.dialect.name != 'postgresql':
+            return
+        if inspect(db.engine).has_table('sensor_readings'):
+            return
+        db.metadata.create_all(
+            bind=db.engine,
+            tables=[table for table in db.metadata.sorted_tables if table.name != 'sensor_readings']
+        )
+        with db.engine.begin() as connection:
+            connection.execute(text(POSTGRESQL_PARENT))
+
+    def load(self):
+        """Detect how readings are stored, and find the existing partitions if the list is out of date"""
+        with self._lock:
+            if not self._loaded:
+                self._detect()
+                self._loaded = True
+            if self._mode is not None and (
+                self._listed_at is None or time.monotonic() - self._listed_at >= self.refresh
+            ):
+                self._list()
+
+    def _detect(self):
+        """Detect whether readings are kept in one table, native partitions or partition tables"""
+        self._mode = None
+        if self.interval is not None:
+            dialect = db.engine.dialect.name
+            if dialect == 'postgresql':
+                with db.engine.connect() as connection:
+                    relkind = connection.execute(
+                        text("SELECT relkind FROM pg_class WHERE relname = 'sensor_readings'")
+                    ).scalar()
+                if relkind == 'p':
+                    self._mode = 'native'
+                else:
+                    logger.warning(
+                        "sensor_readings is not a partitioned table, so READINGS_PARTITION_INTERVAL is ignored; "
+                        "see the deployment guide to migrate it"
+                    )
+            elif dialect == 'sqlite':
+                self._mode = 'tables'
+            else:
+                logger.warning(f"Partitioned readings are not supported on {dialect}, using one table")
+
+        if self._mode == 'tables':
+            # Readings written before partitioning stay in the original table, which gets no new rows
+            from app.models.device import SensorReading
+            with db.engine.connect() as connection:
+                self._legacy_end = connection.execute(select(db.func.max(SensorReading.timestamp))).scalar()
+
+    def _list(self):
+        """Read which partitions exist; other processes create and drop them"""
+        partitions = {}
+        for name in inspect(db.engine).get_table_names():
+            match = PARTITION_NAME.match(name)
+            if match:
+                partitions[datetime.strptime(match.group(1), '%Y%m%d')] = name
+        for name in set(self._partitions.values()) - set(partitions.values()):
+            self._forget(name)
+        self._partitions = partitions
+        self._listed_at = time.monotonic()
+
+    def _forget(self, name):
+        """Drop the Table object of a partition that no longer exists"""
+        table = self._metadata.tables.get(name)
+        if table is not None:
+            self._metadata.remove(table)
+
+    def reset(self):
+        """Re-read the partitions on next use, after partitions were created or dropped elsewhere"""
+        with self._lock:
+            self._listed_at = None
+
+    def _dropped(self, error):
+        """Whether `error` came from a partition table another process dropped, in which case the list is reset"""
+        if self._mode != 'tables' or 'no such table' not in str(error.orig):
+            return False
+        logger.info(f"Re-reading readings partitions: {error.orig}")
+        self.reset()
+        return True
+
+    @property
+    def enabled(self):
+        """Whether readings are stored in partitions"""
+        self.load()
+        return self._mode is not None
+
+    def _table(self, name):
+        """Table object for a SQLite partition"""
+        table = self._metadata.tables.get(name)
+        if table is None:
+            table = Table(
+                name, self._metadata,
+                Column('id', Integer, primary_key=True),
+                Column('value', Float, nullable=False),
+                Column('timestamp', DateTime, nullable=False),
+                Column('sensor_id', Integer),
+                Index(f'ix_{name}_sensor_id_timestamp', 'sensor_id', 'timestamp'),
+                sqlite_autoincrement=True
+            )
+        return table
+
+    def ensure(self, timestamps, connection=None):
+        """Create the partitions needed to store readings at `timestamps`, before the session writes anything"""
+        self.load()
+        if self._mode is None:
+            return
+        with self._lock:
+            for start in {self.period_start(timestamp) for timestamp in timestamps}:
+                if start not in self._partitions:
+                    self._create(start, connection)
+
+    def _create(self, start, connection=None):
+        """Create the partition for the period starting at `start`.
+
+        The partition is committed in its own transaction, before the caller's
+        session writes anything, so a rolled back batch never leaves a
+        partition this process believes exists but the database does not.
+        With `connection`, it is created in that connection's transaction
+        instead; if that is rolled back, the next write finds the partition
+        missing and creates it again.
+        """
+        name = f'{PARTITION_PREFIX}{start:%Y%m%d}'
+        end = self.period_end(start)
+        try:
+            if connection is None:
+                with db.engine.begin() as connection:
+                    self._create_table(connection, name, start, end)
+            else:
+                self._create_table(connection, name, start, end)
+        except Exception:
+            # Another process may have created it at the same moment
+            if not inspect(db.engine).has_table(name):
+                raise
+        self._partitions[start] = name
+        logger.info(f"Created readings partition {name} for {start.date()} to {end.date()}")
+
+    def _create_table(self, connection, name, start, end):
+        """Create a partition's table"""
+        if self._mode == 'native':
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF sensor_readings "
+                f"FOR VALUES FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+            ))
+            return
+        self._table(name).create(bind=connection, checkfirst=True)
+        # Start each partition's ids in their own range, so ids stay unique across partitions
+        connection.execute(
+            text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+            ),
+            {'name': name, 'seq': (start - EPOCH).days << 32}
+        )
+
+    # Reads and writes
+
+    def insert(self, rows, returning=False):
+        """Insert readings given as dicts with sensor_id, value and timestamp, leaving the commit to the caller.
+
+        With `returning`, returns the inserted rows with their ids, in no particular order.
+        """
+        from app.models.device import SensorReading
+
+        self.ensure(row['timestamp'] for row in rows)
+        if self._mode != 'tables':
+            return self._execute(SensorReading.__table__, rows, returning)
+
+        by_period = {}
+        for row in rows:
+            by_period.setdefault(self.period_start(row['timestamp']), []).append(row)
+        inserted = [] if returning else None
+        for start, period_rows in by_period.items():
+            result = self._retry(self._insert_period, start, period_rows, returning)
+            if returning:
+                inserted.extend(result)
+        return inserted
+
+    def _insert_period(self, start, rows, returning, connection=None):
+        """Insert one period's readings into its partition table"""
+        self.ensure([start], connection)
+        return self._execute(self._table(self._partitions[start]), rows, returning)
+
+    def _retry(self, func, *args):
+        """Call func, once more with the partitions re-read if it wrote to one another process dropped.
+
+        The failed statement leaves the session's SQLite transaction open and
+        holding a lock, so the retry recreates the partition on the session's
+        own connection rather than in a transaction of its own.
+        """
+        try:
+            return func(*args)
+        except OperationalError as e:
+            if not self._dropped(e):
+                raise
+            return func(*args, db.session.connection())
+
+    def _execute(self, table, rows, returning):
+        """Bulk insert rows into one table"""
+        if not returning:
+            db.session.execute(table.insert(), rows)
+            return None
+        # Unordered RETURNING keeps the insert batched; each returned row carries everything it describes
+        statement = table.insert().returning(table.c.id, table.c.sensor_id, table.c.value, table.c.timestamp)
+        return db.session.execute(statement, rows).mappings().all()
+
+    def add(self, reading):
+        """Insert one SensorReading and fill in its id, leaving the commit to the caller"""
+        self.ensure([reading.timestamp])
+        if self._mode != 'tables':
+            db.session.add(reading)
+            db.session.flush()
+            return reading
+
+        reading.id = self._retry(self._add_to_partition, reading)
+        return reading
+
+    def _add_to_partition(self, reading, connection=None):
+        """Insert one reading into its partition table, returning its id"""
+        start = self.period_start(reading.timestamp)
+        self.ensure([start], connection)
+        result = db.session.execute(self._table(self._partitions[start]).insert().values(
+            value=reading.value,
+            timestamp=reading.timestamp,
+            sensor_id=reading.sensor_id
+        ))
+        return result.inserted_primary_key[0]
+
+    def tables(self, start=None, end=None):
+        """Return the tables that may hold readings between `start` and `end`"""
+        from app.models.device import SensorReading
+
+        self.load()
+        if self._mode != 'tables':
+            # PostgreSQL prunes the partitions of the parent table itself
+            return [SensorReading.__table__]
+
+        # A range reaching past the newest known period may need a partition created since the last listing
+        latest = datetime.utcnow() if end is None else end
+        with self._lock:
+            if not self._partitions or self.period_end(max(self._partitions)) <= latest:
+                self._list()
+
+        tables = []
+        if self._legacy_end is not None and (start is None or start <= self._legacy_end):
+            tables.append(SensorReading.__table__)
+        for period_start, name in sorted(self._partitions.items()):
+            if (end is None or period_start <= end) and (start is None or self.period_end(period_start) > start):
+                tables.append(self._table(name))
+        return tables or [SensorReading.__table__]
+
+    def readings(self, start=None, end=None):
+        """Return an entity to query readings between `start` and `end` with.
+
+        This is SensorReading itself unless readings are spread over several
+        SQLite tables, in which case it is SensorReading mapped onto a UNION
+        ALL of the tables overlapping the range. Callers still filter on the
+        entity's timestamp for the exact range.
+        """
+        from app.models.device import SensorReading
+
+        tables = self.tables(start, end)
+        if len(tables) == 1 and tables[0] is SensorReading.__table__:
+            return SensorReading
+
+        selects = []
+        for table in tables:
+            statement = select(table.c.id, table.c.value, table.c.timestamp, table.c.sensor_id)
+            if start is not None:
+                statement = statement.where(table.c.timestamp >= start)
+            if end is not None:
+                statement = statement.where(table.c.timestamp <= end)
+            selects.append(statement)
+        return aliased(SensorReading, union_all(*selects).subquery('sensor_readings'), adapt_on_names=True)
+
+    def fetch(self, sensor_id, start=None, end=None, limit=None, descending=True, before=None):
+        """Return a sensor's readings in [start, end] in (timestamp, id) order, up to `limit` of them.
+
+        Partition tables cover disjoint periods, so with a limit they are read
+        one at a time from the end the results start at, each through its
+        index, until the limit is reached; a page costs the same however much
+        history lies beyond it. `before` is a (timestamp, id) keyset cursor.
+        """
+        from app.models.device import SensorReading
+
+        tables = self.tables(start, end)
+        legacy = tables[0] if tables[0] is SensorReading.__table__ else None
+        partitions = tables[1:] if legacy is not None else tables
+        if descending:
+            partitions = partitions[::-1]
+
+        readings = []
+        if legacy is not None:
+            readings.extend(self._fetch(SensorReading, sensor_id, start, end, limit, descending, before))
+        found = 0
+        for table in partitions:
+            entity = aliased(SensorReading, table, adapt_on_names=True)
+            try:
+                rows = self._fetch(entity, sensor_id, start, end, limit - found if limit else None, descending, before)
+            except OperationalError as e:
+                # A partition dropped since the listing held only expired readings
+                if not self._dropped(e):
+                    raise
+                continue
+            readings.extend(rows)
+            found += len(rows)
+            if limit and found >= limit:
+                break
+
+        if len(tables) > 1:
+            # The original table can overlap the partitions
+            readings.sort(key=lambda reading: (reading.timestamp, reading.id), reverse=descending)
+        return readings[:limit] if limit else readings
+
+    def _fetch(self, Reading, sensor_id, start, end, limit, descending, before):
+        """Query one table's readings for fetch()"""
+        query = db.session.query(Reading).filter(Reading.sensor_id == sensor_id)
+        if start:
+            query = query.filter(Reading.timestamp >= start)
+        if end:
+            query = query.filter(Reading.timestamp <= end)
+        if before is not None:
+            query = query.filter(or_(Reading.timestamp < before[0], Reading.id < before[1]))
+        if descending:
+            query = query.order_by(Reading.timestamp.desc(), Reading.id.desc())
+        else:
+            query = query.order_by(Reading.timestamp.asc(), Reading.id.asc())
+        return query.limit(limit).all() if limit else query.all()
+
+    def columns(self, sensor_ids, start=None, end=None):
+        """Return {sensor_id: (timestamps, values, ids)} arrays of several sensors' readings in [start, end].
+
+        Each table is read with one query for all the sensors, returning plain
+        tuples, and timestamps are converted to int64 microseconds since the
+        epoch a column at a time. Arrays are in (timestamp, id) order; sensors
+        without readings are left out.
+        """
+        parts = []
+        for table in self.tables(start, end):
+            statement = select(
+                table.c.sensor_id, raw_timestamp(table.c.timestamp), table.c.value, table.c.id
+            ).where(table.c.sensor_id.in_(sensor_ids))
+            if start is not None:
+                statement = statement.where(table.c.timestamp >= start)
+            if end is not None:
+                statement = statement.where(table.c.timestamp <= end)
+            try:
+                rows = db.session.execute(statement.order_by(table.c.sensor_id, table.c.timestamp, table.c.id)).all()
+            except OperationalError as e:
+                if not self._dropped(e):
+                    raise
+                continue
+            if rows:
+                parts.append(rows_to_arrays(rows, (np.int64, TIMESTAMP, np.float64, np.int64)))
+
+        if not parts:
+            return {}
+        sensors, timestamps, values, ids = (np.concatenate(column) for column in zip(*parts))
+        if len(parts) > 1:
+            # The original table can overlap the partitions
+            order = np.lexsort((ids, timestamps, sensors))
+            sensors, timestamps, values, ids = sensors[order], timestamps[order], values[order], ids[order]
+        return split_by_key(sensors, timestamps, values, ids)
+
+    def delete_sensors(self, sensor_ids):
+        """Delete the readings of sensors from the partition tables, leaving the commit to the caller.
+
+        Readings in `sensor_readings` itself are deleted with their sensor by
+        the ORM cascade.
+        """
+        from app.models.device import SensorReading
+
+        if not sensor_ids or not self.enabled or self._mode != 'tables':
+            return
+        for table in self.tables():
+            if table is not SensorReading.__table__:
+                try:
+                    db.session.execute(table.delete().where(table.c.sensor_id.in_(sensor_ids)))
+                except OperationalError as e:
+                    if not self._dropped(e):
+                        raise
+
+    # Retention
+
+    def drop_before(self, cutoff):
+        """Drop every partition whose period ends on or before `cutoff`, returning their names"""
+        if not self.enabled:
+            return []
+        with self._lock:
+            self._list()
+
+        dropped = []
+        for start, name in sorted(self._partitions.items()):
+            if self.period_end(start) > cutoff:
+                break
+            try:
+                db.session.execute(text(f'DROP TABLE IF EXISTS {name}'))
+                if self._mode == 'tables':
+                    db.session.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {'name': name})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            del self._partitions[start]
+            self._forget(name)
+            dropped.append(name)
+            logger.info(f"Dropped readings partition {name}")
+        return dropped
+
+    def get_stats(self):
+        """Return the storage mode and the range of partitions"""
+        self.load()
+        starts = sorted(self._partitions)
+        return {
+            'mode': self._mode or 'single_table',
+            'interval': self.interval,
+            'partitions': len(starts),
+            'oldest': starts[0].isoformat() if starts else None,
+            'newest': starts[-1].isoformat() if starts else None
+        }
+
+
+# Process-wide partition manager
+reading_partitions = ReadingPartitions()
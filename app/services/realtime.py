@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+from flask import session
+from flask_socketio import join_room, leave_room, rooms
+
+from app.services.device_registry import device_registry
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Emission Configuration
+SOCKETIO_MAX_FPS = float(os.getenv('SOCKETIO_MAX_FPS', 4))
+SOCKETIO_TELEMETRY_BATCH = int(os.getenv('SOCKETIO_TELEMETRY_BATCH', 1))
+# Message queue shared by the web app and the ingestion service, e.g. redis://localhost:6379/0
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+
+# Events coalesced by the scheduler, in the order they are delivered within a frame
+COALESCED_EVENTS = ('device_status', 'device_telemetry')
+
+# Room holding every client that may see all devices (admins)
+ALL_DEVICES_ROOM = 'devices:all'
+
+
+def device_room(device_id):
+    """Room for clients watching a single device, by MQTT device_id"""
+    return f'device:{device_id}'
+
+
+def user_room(user_id):
+    """Room for clients watching every device owned by a user"""
+    return f'user:{user_id}'
+
+
+def rooms_for_device(device_id):
+    """Every room that should receive events for a device"""
+    rooms = [device_room(device_id), ALL_DEVICES_ROOM]
+    info = device_registry.get(device_id)
+    if info is not None and info.user_id is not None:
+        rooms.append(user_room(info.user_id))
+    return rooms
+
+
+def devices_room(user):
+    """Room for clients watching every device a user may see"""
+    return ALL_DEVICES_ROOM if user.is_admin else user_room(user.id)
+
+
+def subscribe_device(user, device_id):
+    """Add a device to the calling client's subscriptions.
+
+    Frames are emitted per room, so a client is kept in only one room for each
+    device: while it is in its devices room the device's own room is not joined.
+    """
+    subscribed = session.setdefault('subscribed_devices', [])
+    if device_id not in subscribed:
+        subscribed.append(device_id)
+    if devices_room(user) not in rooms():
+        join_room(device_room(device_id))
+
+
+def unsubscribe_device(device_id):
+    """Remove a device from the calling client's subscriptions"""
+    subscribed = session.get('subscribed_devices', [])
+    if device_id in subscribed:
+        subscribed.remove(device_id)
+    leave_room(device_room(device_id))
+
+
+def subscribe_devices(user):
+    """Move the calling client into its devices room, out of the device rooms it covers"""
+    join_room(devices_room(user))
+    for device_id in session.get('subscribed_devices', []):
+        leave_room(device_room(device_id))
+
+
+def unsubscribe_devices(user):
+    """Move the calling client out of its devices room, back into the rooms of devices it subscribed to"""
+    leave_room(devices_room(user))
+    for device_id in session.get('subscribed_devices', []):
+        join_room(device_room(device_id))
+
+
+def can_access_device(user, device_id):
+    """Check whether a user may receive events for a device"""
+    info = device_registry.get(device_id)
+    if info is None:
+        return False
+    return user.is_admin or info.user_id == user.id
+
+
+class EmissionScheduler:
+    """Coalesces high-frequency device events into at most `max_fps` frames per room.
+
+    Status updates replace any earlier status still waiting for the same device.
+    Telemetry keeps the latest `telemetry_batch` messages per device. Every tick,
+    each room receives one frame with everything pending for its devices: the
+    plain event when there is a single update, otherwise a `device_batch` event
+    listing them. Command responses bypass the scheduler.
+    """
+
+    def __init__(self, max_fps=SOCKETIO_MAX_FPS, telemetry_batch=SOCKETIO_TELEMETRY_BATCH):
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0
+        self.telemetry_batch = max(1, telemetry_batch)
+        self.socketio = None
+
+        # device_id -> {'device_status': payload, 'device_telemetry': deque of payloads}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+        self.scheduled = 0
+        self.superseded = 0
+        self.frames = 0
+
+    def init_app(self, socketio):
+        """Bind to the Socket.IO server and start the emission loop"""
+        self.socketio = socketio
+        if self._task is None and self.interval:
+            self._task = socketio.start_background_task(self._run)
+
+    def emit_now(self, event, device_id, data):
+        """Emit an event to the device's rooms immediately"""
+        if self.socketio is not None:
+            self.socketio.emit(event, {'device_id': device_id, 'data': data},
+                               namespace='/', to=rooms_for_device(device_id))
+
+    def schedule(self, event, device_id, data):
+        """Queue a status or telemetry event for the next frame"""
+        if not self.interval:
+            self.emit_now(event, device_id, data)
+            return
+
+        with self._lock:
+            self.scheduled += 1
+            pending = self._pending.setdefault(device_id, {})
+            if event == 'device_telemetry':
+                telemetry = pending.get(event)
+                if telemetry is None:
+                    telemetry = pending[event] = deque(maxlen=self.telemetry_batch)
+                elif len(telemetry) == self.telemetry_batch:
+                    self.superseded += 1
+                telemetry.append(data)
+            else:
+                if event in pending:
+                    self.superseded += 1
+                pending[event] = data
+
+    def flush(self):
+        """Emit one frame per room holding everything queued since the last flush"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.socketio is None:
+            return 0
+
+        frames = {}
+        for device_id, events in pending.items():
+            updates = []
+            for event in COALESCED_EVENTS:
+                if event not in events:
+                    continue
+                payloads = events[event] if event == 'device_telemetry' else (events[event],)
+                updates.extend({'event': event, 'device_id': device_id, 'data': data} for data in payloads)
+            for room in rooms_for_device(device_id):
+                frames.setdefault(room, []).extend(updates)
+
+        for room, updates in frames.items():
+            if len(updates) == 1:
+                update = updates[0]
+                self.socketio.emit(update['event'], {'device_id': update['device_id'], 'data': update['data']},
+                                   namespace='/', to=room)
+            else:
+                self.socketio.emit('device_batch', {'events': updates}, namespace='/', to=room)
+
+        self.frames += len(frames)
+        return len(frames)
+
+    def _run(self):
+        """Emission loop"""
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error emitting device events: {e}")
+
+    def get_stats(self):
+        """Return counters describing how much the scheduler coalesced"""
+        return {
+            'scheduled': self.scheduled,
+            'superseded': self.superseded,
+            'frames': self.frames,
+            'max_fps': round(1.0 / self.interval, 2) if self.interval else None
+        }
+
+
+# Process-wide scheduler used by the MQTT client
+emission_scheduler = EmissionScheduler()
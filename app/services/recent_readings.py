@@ -0,0 +1,301 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Recent Readings Configuration
+# Only correct when one process writes every reading, which the deployment has to vouch for
+RECENT_READINGS_ENABLED = os.getenv('RECENT_READINGS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RECENT_READINGS_PER_SENSOR = int(os.getenv('RECENT_READINGS_PER_SENSOR', 3600))
+RECENT_READINGS_MAX_MB = int(os.getenv('RECENT_READINGS_MAX_MB', 64))
+
+# Bytes per buffered reading: int64 timestamp, float64 value and int64 id
+READING_BYTES = 24
+
+
+def to_micros(timestamps):
+    """Convert datetimes to int64 microseconds since the epoch"""
+    return np.array(timestamps, dtype='datetime64[us]').astype(np.int64)
+
+
+class SensorRing:
+    """A fixed-size ring of one sensor's most recent readings in timestamp order.
+
+    The ring holds every reading of the sensor written by this process with a
+    timestamp after `floor`. The floor moves up to each reading pushed out of
+    the ring, so anything at or before it has to be read from the database.
+    """
+
+    __slots__ = ('timestamps', 'values', 'ids', 'head', 'size', 'floor')
+
+    def __init__(self, capacity, floor):
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.head = 0
+        self.size = 0
+        self.floor = floor
+
+    def _positions(self):
+        """Array positions of the readings, oldest first"""
+        return (self.head + np.arange(self.size)) % len(self.timestamps)
+
+    def extend(self, timestamps, values, ids):
+        """Add readings sorted by timestamp"""
+        capacity = len(self.timestamps)
+        if self.size and timestamps[0] < self.timestamps[(self.head + self.size - 1) % capacity]:
+            self._merge(timestamps, values, ids)
+            return
+
+        count = len(timestamps)
+        overflow = self.size + count - capacity
+        if overflow > 0:
+            # The readings about to be overwritten, or skipped, raise the floor
+            if overflow <= self.size:
+                self.floor = max(self.floor, int(self.timestamps[(self.head + overflow - 1) % capacity]))
+            else:
+                self.floor = max(self.floor, int(timestamps[overflow - self.size - 1]))
+                timestamps, values, ids = timestamps[-capacity:], values[-capacity:], ids[-capacity:]
+                count, overflow = capacity, self.size
+
+        positions = (self.head + self.size + np.arange(count)) % capacity
+        self.timestamps[positions] = timestamps
+        self.values[positions] = values
+        self.ids[positions] = ids
+        if overflow > 0:
+            self.head = (self.head + overflow) % capacity
+            self.size = capacity
+        else:
+            self.size += count
+
+    def _merge(self, timestamps, values, ids):
+        """Add readings older than the newest buffered one, rebuilding the ring in order"""
+        positions = self._positions()
+        keep = timestamps > self.floor
+        merged_timestamps = np.concatenate([self.timestamps[positions], timestamps[keep]])
+        merged_values = np.concatenate([self.values[positions], values[keep]])
+        merged_ids = np.concatenate([self.ids[positions], ids[keep]])
+        order = np.lexsort((merged_ids, merged_timestamps))
+
+        capacity = len(self.timestamps)
+        if len(order) > capacity:
+            self.floor = max(self.floor, int(merged_timestamps[order[-capacity - 1]]))
+            order = order[-capacity:]
+        self.size = len(order)
+        self.head = 0
+        self.timestamps[:self.size] = merged_timestamps[order]
+        self.values[:self.size] = merged_values[order]
+        self.ids[:self.size] = merged_ids[order]
+
+    def window(self, start=None, end=None):
+        """Return (timestamps, values, ids) copies of the readings with start < timestamp <= end"""
+        positions = self._positions()
+        timestamps = self.timestamps[positions]
+        low = 0 if start is None else int(np.searchsorted(timestamps, start, 'right'))
+        high = self.size if end is None else int(np.searchsorted(timestamps, end, 'right'))
+        positions = positions[low:max(low, high)]
+        return self.timestamps[positions], self.values[positions], self.ids[positions]
+
+
+class RecentReadings:
+    """Serves recent sensor readings from memory.
+
+    Readings are added by the process that writes them, after they are
+    committed. A query is answered from a sensor's ring for the part of its
+    range after the ring's floor, and from the database and archive for the
+    rest. Rings are dropped least recently written first once the memory
+    budget is used up.
+    """
+
+    def __init__(self, per_sensor=RECENT_READINGS_PER_SENSOR, max_mb=RECENT_READINGS_MAX_MB):
+        self.per_sensor = per_sensor
+        self.max_sensors = (max_mb * 1024 * 1024) // (per_sensor * READING_BYTES) if per_sensor > 0 else 0
+        self.enabled = False
+        self._rings = OrderedDict()
+        # Newest timestamp written per sensor, kept when its ring is dropped
+        self._newest = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def enable(self):
+        """Start buffering readings; only valid when this process writes every reading"""
+        self.enabled = self.max_sensors > 0
+        if self.enabled:
+            logger.info(
+                f"Buffering the last {self.per_sensor} readings of up to {self.max_sensors} sensors in memory"
+            )
+
+    def extend(self, rows):
+        """Buffer committed readings given as dicts with id, sensor_id, value and timestamp"""
+        if not self.enabled or not rows:
+            return
+
+        by_sensor = {}
+        for row in rows:
+            by_sensor.setdefault(row['sensor_id'], []).append(row)
+
+        with self._lock:
+            for sensor_id, sensor_rows in by_sensor.items():
+                timestamps = to_micros([row['timestamp'] for row in sensor_rows])
+                values = np.fromiter((row['value'] for row in sensor_rows), dtype=np.float64, count=len(sensor_rows))
+                ids = np.fromiter((row['id'] for row in sensor_rows), dtype=np.int64, count=len(sensor_rows))
+                # Order by (timestamp, id), which keyset pages rely on for readings sharing a timestamp
+                if len(timestamps) > 1 and np.any(timestamps[1:] <= timestamps[:-1]):
+                    order = np.lexsort((ids, timestamps))
+                    timestamps, values, ids = timestamps[order], values[order], ids[order]
+
+                newest = self._newest.get(sensor_id)
+                ring = self._rings.get(sensor_id)
+                if ring is None:
+                    # Readings up to the newest one already written may be in the database but not in
+                    # the ring; for a sensor not written before, only what comes after this batch is covered
+                    floor = newest if newest is not None else int(timestamps[-1])
+                    ring = self._rings[sensor_id] = SensorRing(self.per_sensor, floor)
+                    if len(self._rings) > self.max_sensors:
+                        self._rings.popitem(last=False)
+                        self.evicted += 1
+                else:
+                    self._rings.move_to_end(sensor_id)
+                ring.extend(timestamps, values, ids)
+                self._newest[sensor_id] = int(timestamps[-1]) if newest is None else max(newest, int(timestamps[-1]))
+
+    def discard(self, sensor_ids):
+        """Forget the buffered readings of deleted sensors"""
+        with self._lock:
+            for sensor_id in sensor_ids:
+                self._rings.pop(sensor_id, None)
+                self._newest.pop(sensor_id, None)
+
+    def readings(self, sensor_id, start=None, end=None, limit=None, descending=True, before=None):
+        """Return a sensor's readings in [start, end], from memory where the ring covers the range.
+
+        Takes the same arguments and returns the same readings as the
+        archive's merged read, which answers whatever the ring does not cover.
+        """
+        from app.services.archive import reading_archive, reading_records
+
+        if before is not None:
+            end = before[0] if end is None or end > before[0] else end
+
+        ring = None
+        if self.enabled:
+            with self._lock:
+                ring = self._rings.get(sensor_id)
+                if ring is not None:
+                    floor = ring.floor
+                    start_micros = None if start is None else int(to_micros([start])[0]) - 1
+                    end_micros = None if end is None else int(to_micros([end])[0])
+                    low = floor if start_micros is None else max(floor, start_micros)
+                    timestamps, values, ids = ring.window(low, end_micros)
+
+        if ring is None:
+            self.misses += 1
+            return reading_archive.readings(sensor_id, start, end, limit=limit, descending=descending, before=before)
+
+        if before is not None:
+            keep = (timestamps < int(to_micros([before[0]])[0])) | (ids < before[1])
+            timestamps, values, ids = timestamps[keep], values[keep], ids[keep]
+
+        if descending:
+            timestamps, values, ids = timestamps[::-1], values[::-1], ids[::-1]
+
+        covered = start_micros is not None and start_micros >= floor
+        if covered or (descending and limit and len(ids) >= limit):
+            self.hits += 1
+            if limit:
+                timestamps, values, ids = timestamps[:limit], values[:limit], ids[:limit]
+            return reading_records(sensor_id, timestamps, values, ids)
+
+        # The range reaches back past the ring, so the rest comes from the database and archive
+        self.partial_hits += 1
+        floor_time = np.datetime64(floor, 'us').astype(object)
+        older_end = floor_time if end is None or end > floor_time else end
+        buffered = reading_records(sensor_id, timestamps, values, ids)
+        if descending:
+            remaining = limit - len(buffered) if limit else None
+            return buffered + reading_archive.readings(
+                sensor_id, start, older_end, limit=remaining, descending=True, before=before
+            )
+        older = reading_archive.readings(sensor_id, start, older_end, limit=limit, descending=False, before=before)
+        combined = older + buffered
+        return combined[:limit] if limit else combined
+
+    def columns(self, sensor_ids, start=None, end=None):
+        """Return {sensor_id: (timestamps, values, ids)} arrays of several sensors' readings in [start, end].
+
+        Timestamps are int64 microseconds since the epoch, oldest first.
+        Sensors whose ring covers the range are answered from memory; the
+        others are read from the database and archive together, with one query
+        per table, and joined to whatever their ring holds. Sensors without
+        readings are left out.
+        """
+        from app.services.archive import reading_archive
+
+        start_micros = None if start is None else int(to_micros([start])[0]) - 1
+        end_micros = None if end is None else int(to_micros([end])[0])
+
+        # Sensor id -> (ring floor, ring readings in range)
+        buffered = {}
+        if self.enabled:
+            with self._lock:
+                for sensor_id in sensor_ids:
+                    ring = self._rings.get(sensor_id)
+                    if ring is not None:
+                        low = ring.floor if start_micros is None else max(ring.floor, start_micros)
+                        buffered[sensor_id] = (ring.floor, ring.window(low, end_micros))
+
+        covered = {
+            sensor_id for sensor_id, (floor, _) in buffered.items()
+            if start_micros is not None and start_micros >= floor
+        }
+        remaining = [sensor_id for sensor_id in sensor_ids if sensor_id not in covered]
+        columns = reading_archive.columns(remaining, start, end) if remaining else {}
+        self.hits += len(covered)
+        self.partial_hits += len(buffered) - len(covered)
+        self.misses += len(sensor_ids) - len(buffered)
+
+        for sensor_id, (floor, window) in buffered.items():
+            older = columns.get(sensor_id)
+            if sensor_id not in covered and older is not None:
+                # The database and archive answer up to the floor, the ring after it
+                keep = older[0] <= floor
+                window = tuple(np.concatenate((column[keep], newer)) for column, newer in zip(older, window))
+            if len(window[0]):
+                columns[sensor_id] = window
+            else:
+                columns.pop(sensor_id, None)
+        return columns
+
+    def get_stats(self):
+        """Return buffer occupancy, memory use and how queries were answered"""
+        with self._lock:
+            sensors = len(self._rings)
+            buffered = sum(ring.size for ring in self._rings.values())
+        return {
+            'enabled': self.enabled,
+            'per_sensor': self.per_sensor,
+            'max_sensors': self.max_sensors,
+            'sensors': sensors,
+            'buffered': buffered,
+            'memory_bytes': sensors * self.per_sensor * READING_BYTES,
+            'hits': self.hits,
+            'partial_hits': self.partial_hits,
+            'misses': self.misses,
+            'evicted_sensors': self.evicted
+        }
+
+
+# Process-wide buffer, enabled by init_mqtt() when RECENT_READINGS_ENABLED is set
+recent_readings = RecentReadings()
@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from app.services.maintenance import MAINTENANCE_ENABLED, maintenance_process
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Retention Configuration (days, 0 keeps data forever)
+RETENTION_RAW_DAYS = int(os.getenv('RETENTION_RAW_DAYS', 0))
+RETENTION_1M_DAYS = int(os.getenv('RETENTION_1M_DAYS', 0))
+RETENTION_1H_DAYS = int(os.getenv('RETENTION_1H_DAYS', 0))
+RETENTION_1D_DAYS = int(os.getenv('RETENTION_1D_DAYS', 0))
+RETENTION_INTERVAL_SECONDS = int(os.getenv('RETENTION_INTERVAL_SECONDS', 3600))
+RETENTION_CHUNK_SIZE = int(os.getenv('RETENTION_CHUNK_SIZE', 5000))
+RETENTION_CHUNK_PAUSE_MS = int(os.getenv('RETENTION_CHUNK_PAUSE_MS', 50))
+
+# Policy field for each kind of data, with its default
+RETENTION_FIELDS = {
+    'raw': ('raw_days', RETENTION_RAW_DAYS),
+    '1m': ('rollup_1m_days', RETENTION_1M_DAYS),
+    '1h': ('rollup_1h_days', RETENTION_1H_DAYS),
+    '1d': ('rollup_1d_days', RETENTION_1D_DAYS),
+}
+
+
+def resolve_retention(policies, device_id, sensor_type):
+    """Return {kind: days} for a sensor from the most specific matching policy.
+
+    Precedence is device and sensor type, then device, then sensor type, then
+    the defaults. A policy field left empty falls back to the default.
+    """
+    for key in ((device_id, sensor_type), (device_id, None), (None, sensor_type)):
+        policy = policies.get(key)
+        if policy is not None:
+            break
+    retention = {}
+    for kind, (field, default) in RETENTION_FIELDS.items():
+        days = getattr(policy, field) if policy is not None else None
+        retention[kind] = default if days is None else days
+    return retention
+
+
+class RetentionPurger:
+    """Deletes readings and rollups that are past their retention period.
+
+    Each sensor's expired rows are deleted oldest first in chunks of at most
+    `chunk_size` rows, each in its own short transaction with a pause after it,
+    so the purge never holds a long write lock on the table. When readings are
+    partitioned, partitions that have expired for every sensor are dropped
+    first.
+    """
+
+    def __init__(self, interval=RETENTION_INTERVAL_SECONDS, chunk_size=RETENTION_CHUNK_SIZE,
+                 chunk_pause_ms=RETENTION_CHUNK_PAUSE_MS):
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause_ms / 1000.0
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.purged = {kind: 0 for kind in RETENTION_FIELDS}
+        self.chunks = 0
+        self.partitions_dropped = 0
+        self.last_run = None
+
+    def init_app(self, app):
+        """Bind the purger to the Flask app and start the background thread"""
+        self.app = app
+        if self._thread is None and self.interval > 0 and MAINTENANCE_ENABLED:
+            self._thread = threading.Thread(target=self._run, name='retention-purger', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Purge thread loop, running only in the process holding the maintenance lock"""
+        while True:
+            time.sleep(self.interval)
+            if not maintenance_process():
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error purging expired sensor data: {e}")
+
+    def run_once(self, now=None):
+        """Purge everything expired as of `now` and return what was deleted"""
+        from app.config.database import db
+        from app.models.device import Sensor, RetentionPolicy
+        from app.services.partitions import reading_partitions
+
+        with self._lock:
+            now = now or datetime.utcnow()
+            started = time.perf_counter()
+            purged = {kind: 0 for kind in RETENTION_FIELDS}
+
+            with self.app.app_context():
+                policies = {
+                    (policy.device_id, policy.sensor_type): policy for policy in RetentionPolicy.query.all()
+                }
+                sensors = db.session.query(Sensor.id, Sensor.device_id, Sensor.sensor_type).all()
+                db.session.commit()
+                retentions = [
+                    (sensor_id, resolve_retention(policies, device_id, sensor_type))
+                    for sensor_id, device_id, sensor_type in sensors
+                ]
+
+                # A partition can go once no sensor keeps raw readings that old
+                dropped = []
+                raw_days = [retention['raw'] for _, retention in retentions]
+                if raw_days and min(raw_days) > 0 and reading_partitions.enabled:
+                    dropped = reading_partitions.drop_before(now - timedelta(days=max(raw_days)))
+
+                for sensor_id, retention in retentions:
+                    for kind, days in retention.items():
+                        if days > 0:
+                            purged[kind] += self._purge(sensor_id, kind, now - timedelta(days=days))
+
+            elapsed = time.perf_counter() - started
+            self.runs += 1
+            for kind, rows in purged.items():
+                self.purged[kind] += rows
+            self.partitions_dropped += len(dropped)
+            self.last_run = {
+                'finished_at': datetime.utcnow().isoformat(),
+                'duration_ms': round(elapsed * 1000.0, 3),
+                'sensors': len(sensors),
+                'purged': purged,
+                'partitions_dropped': dropped
+            }
+
+        if any(purged.values()) or dropped:
+            logger.info(
+                f"Retention purge removed {purged['raw']} readings, {len(dropped)} partitions and "
+                f"{purged['1m'] + purged['1h'] + purged['1d']} rollups in {elapsed:.2f}s"
+            )
+        return self.last_run
+
+    def _purge(self, sensor_id, kind, cutoff):
+        """Delete one sensor's rows of one kind older than `cutoff`"""
+        from app.models.device import SensorRollup
+        from app.services.archive import reading_archive
+        from app.services.partitions import reading_partitions
+
+        if kind == 'raw':
+            # Archived months go a whole segment at a time, once the month has fully expired
+            return reading_archive.purge(sensor_id, cutoff) + sum(
+                self._purge_chunks(table, table.c.timestamp, table.c.id, table.c.sensor_id == sensor_id, cutoff)
+                for table in reading_partitions.tables(None, cutoff)
+            )
+        table = SensorRollup.__table__
+        condition = (table.c.sensor_id == sensor_id) & (table.c.resolution == kind)
+        return self._purge_chunks(table, table.c.bucket, table.c.bucket, condition, cutoff)
+
+    def _purge_chunks(self, table, column, key, condition, cutoff):
+        """Delete the rows of `table` matching `condition` older than `cutoff`, a chunk at a time.
+
+        `key` identifies a row among those matching `condition`, so each chunk
+        deletes exactly the `chunk_size` oldest rows however many share a time.
+        """
+        from app.config.database import db
+
+        total = 0
+        while True:
+            chunk = db.select(key).where(condition, column < cutoff).order_by(column, key).limit(self.chunk_size)
+            try:
+                deleted = db.session.execute(table.delete().where(condition, key.in_(chunk))).rowcount
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            if deleted == 0:
+                return total
+            total += deleted
+            self.chunks += 1
+            time.sleep(self.chunk_pause)
+
+    def get_stats(self):
+        """Return totals and the outcome of the last run"""
+        return {
+            'interval_seconds': self.interval,
+            'chunk_size': self.chunk_size,
+            'runs': self.runs,
+            'chunks': self.chunks,
+            'purged': dict(self.purged),
+            'partitions_dropped': self.partitions_dropped,
+            'last_run': self.last_run
+        }
+
+
+# Process-wide purger, started alongside ingestion
+retention_purger = RetentionPurger()
@@ -0,0 +1,362 @@
+import os
+from datetime import datetime, timedelta
+from itertools import chain
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import case, func, select
+
+from app.config.database import db
+from app.utils.arrays import TIMESTAMP, raw_timestamp, rows_to_arrays, split_by_key
+
+# Load environment variables
+load_dotenv()
+
+# Rollup Configuration
+ROLLUP_MAX_POINTS = int(os.getenv('ROLLUP_MAX_POINTS', 1000))
+ROLLUP_BACKFILL_BATCH = int(os.getenv('ROLLUP_BACKFILL_BATCH', 50000))
+
+# Rollup resolutions from finest to coarsest, with their bucket length in seconds
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# Truncate a timestamp to the start of its bucket
+TRUNCATE = {
+    '1m': lambda timestamp: timestamp.replace(second=0, microsecond=0),
+    '1h': lambda timestamp: timestamp.replace(minute=0, second=0, microsecond=0),
+    '1d': lambda timestamp: timestamp.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def aggregate(rows):
+    """Fold (sensor_id, value, timestamp) rows into rollup buckets.
+
+    Returns {(sensor_id, resolution, bucket): [count, min, max, sum, last, last_timestamp]}.
+    Minute buckets are built from the rows and coarser buckets from the minutes.
+    """
+    truncate = TRUNCATE['1m']
+    minutes = {}
+    for sensor_id, value, timestamp in rows:
+        key = (sensor_id, '1m', truncate(timestamp))
+        bucket = minutes.get(key)
+        if bucket is None:
+            minutes[key] = [1, value, value, value, value, timestamp]
+            continue
+        bucket[0] += 1
+        if value < bucket[1]:
+            bucket[1] = value
+        if value > bucket[2]:
+            bucket[2] = value
+        bucket[3] += value
+        if timestamp >= bucket[5]:
+            bucket[4] = value
+            bucket[5] = timestamp
+
+    buckets = dict(minutes)
+    for resolution in ('1h', '1d'):
+        truncate = TRUNCATE[resolution]
+        for (sensor_id, _, start), (count, low, high, total, last, last_timestamp) in minutes.items():
+            key = (sensor_id, resolution, truncate(start))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [count, low, high, total, last, last_timestamp]
+                continue
+            bucket[0] += count
+            bucket[1] = min(bucket[1], low)
+            bucket[2] = max(bucket[2], high)
+            bucket[3] += total
+            if last_timestamp >= bucket[5]:
+                bucket[4] = last
+                bucket[5] = last_timestamp
+    return buckets
+
+
+def apply_rollups(rows):
+    """Add (sensor_id, value, timestamp) readings to their rollups, leaving the commit to the caller"""
+    return upsert_buckets(aggregate(rows))
+
+
+def upsert_buckets(buckets):
+    """Merge aggregated buckets into the rollup table"""
+    if not buckets:
+        return 0
+
+    params = [
+        {
+            'sensor_id': sensor_id,
+            'resolution': resolution,
+            'bucket': bucket,
+            'count': count,
+            'min_value': low,
+            'max_value': high,
+            'sum_value': total,
+            'last_value': last,
+            'last_timestamp': last_timestamp
+        }
+        for (sensor_id, resolution, bucket), (count, low, high, total, last, last_timestamp) in buckets.items()
+    ]
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        least, greatest = func.min, func.max
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        least, greatest = func.least, func.greatest
+    else:
+        _merge_rollups(params)
+        return len(params)
+
+    from app.models.device import SensorRollup
+
+    columns = SensorRollup.__table__.c
+    statement = insert(SensorRollup.__table__)
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[columns.sensor_id, columns.resolution, columns.bucket],
+        set_={
+            'count': columns.count + excluded.count,
+            'min_value': least(columns.min_value, excluded.min_value),
+            'max_value': greatest(columns.max_value, excluded.max_value),
+            'sum_value': columns.sum_value + excluded.sum_value,
+            'last_value': case(
+                (excluded.last_timestamp >= columns.last_timestamp, excluded.last_value),
+                else_=columns.last_value
+            ),
+            'last_timestamp': greatest(columns.last_timestamp, excluded.last_timestamp)
+        }
+    )
+    db.session.execute(statement, params)
+    return len(params)
+
+
+def delete_rollups(sensor_ids):
+    """Delete every rollup of the given sensors with one statement, leaving the commit to the caller"""
+    from app.models.device import SensorRollup
+
+    if sensor_ids:
+        table = SensorRollup.__table__
+        db.session.execute(table.delete().where(table.c.sensor_id.in_(sensor_ids)))
+
+
+def _merge_rollups(params):
+    """Read-modify-write fallback for databases without INSERT ... ON CONFLICT"""
+    from app.models.device import SensorRollup
+
+    existing = {
+        (rollup.sensor_id, rollup.resolution, rollup.bucket): rollup
+        for rollup in SensorRollup.query.filter(
+            SensorRollup.sensor_id.in_({row['sensor_id'] for row in params}),
+            SensorRollup.bucket >= min(row['bucket'] for row in params),
+            SensorRollup.bucket <= max(row['bucket'] for row in params)
+        ).with_for_update()
+    }
+    for row in params:
+        rollup = existing.get((row['sensor_id'], row['resolution'], row['bucket']))
+        if rollup is None:
+            db.session.add(SensorRollup(**row))
+            continue
+        rollup.count += row['count']
+        rollup.min_value = min(rollup.min_value, row['min_value'])
+        rollup.max_value = max(rollup.max_value, row['max_value'])
+        rollup.sum_value += row['sum_value']
+        if row['last_timestamp'] >= rollup.last_timestamp:
+            rollup.last_value = row['last_value']
+            rollup.last_timestamp = row['last_timestamp']
+
+
+def choose_resolution(sensor_id, start, end=None, max_points=ROLLUP_MAX_POINTS):
+    """Pick the resolution to chart a sensor's range with at most `max_points` points.
+
+    Raw readings are used when the range holds no more than `max_points` of
+    them, which is found by counting at most `max_points + 1` rows. Otherwise
+    the finest rollup whose bucket count over the range fits the budget.
+    """
+    from app.services.archive import reading_archive
+    from app.services.partitions import reading_partitions
+
+    end = end or datetime.utcnow()
+    Reading = reading_partitions.readings(start, end)
+    raw = db.session.query(Reading.id).filter(
+        Reading.sensor_id == sensor_id,
+        Reading.timestamp > start,
+        Reading.timestamp <= end
+    ).limit(max_points + 1).count()
+    # Archived readings are counted from the segment indexes without reading them
+    raw += reading_archive.count(sensor_id, start, end)
+    if raw <= max_points:
+        return 'raw'
+    return rollup_resolution(start, end, max_points)
+
+
+def rollup_resolution(start, end, max_points=ROLLUP_MAX_POINTS):
+    """Pick the finest rollup with at most `max_points` buckets over [start, end]"""
+    span = (end - start).total_seconds()
+    for resolution, seconds in RESOLUTIONS.items():
+        if span / seconds <= max_points:
+            return resolution
+    return '1d'
+
+
+def choose_resolutions(sensor_ids, start, end=None, max_points=ROLLUP_MAX_POINTS):
+    """Pick the resolution to chart each of several sensors' ranges with, using one query.
+
+    Raw readings are counted from the 1h rollups overlapping the range.
+    Whole buckets can only overcount, so raw is picked only when the readings
+    are certain to fit within `max_points`.
+    """
+    from app.models.device import SensorRollup
+
+    end = end or datetime.utcnow()
+    counts = dict(db.session.query(SensorRollup.sensor_id, func.sum(SensorRollup.count)).filter(
+        SensorRollup.sensor_id.in_(sensor_ids),
+        SensorRollup.resolution == '1h',
+        SensorRollup.bucket >= TRUNCATE['1h'](start),
+        SensorRollup.bucket <= end
+    ).group_by(SensorRollup.sensor_id).all())
+
+    resolution = rollup_resolution(start, end, max_points)
+    return {
+        sensor_id: 'raw' if (counts.get(sensor_id) or 0) <= max_points else resolution
+        for sensor_id in sensor_ids
+    }
+
+
+def rollup_query(sensor_id, resolution, start=None, end=None):
+    """Query a sensor's rollups at one resolution, with buckets overlapping [start, end]"""
+    from app.models.device import SensorRollup
+
+    query = SensorRollup.query.filter_by(sensor_id=sensor_id, resolution=resolution)
+    if start:
+        query = query.filter(SensorRollup.bucket >= TRUNCATE[resolution](start))
+    if end:
+        query = query.filter(SensorRollup.bucket <= end)
+    return query
+
+
+def rollup_columns(sensor_ids, resolution, start=None, end=None):
+    """Return {sensor_id: (buckets, averages, minimums, maximums)} arrays of several sensors' rollups at one resolution.
+
+    All the sensors are read with one query returning plain tuples. Buckets
+    are int64 microseconds since the epoch, oldest first; sensors without
+    rollups are left out.
+    """
+    from app.models.device import SensorRollup
+
+    columns = SensorRollup.__table__.c
+    statement = select(
+        columns.sensor_id, raw_timestamp(columns.bucket), columns.count,
+        columns.sum_value, columns.min_value, columns.max_value
+    ).where(columns.sensor_id.in_(sensor_ids), columns.resolution == resolution)
+    if start:
+        statement = statement.where(columns.bucket >= TRUNCATE[resolution](start))
+    if end:
+        statement = statement.where(columns.bucket <= end)
+
+    rows = db.session.execute(statement.order_by(columns.sensor_id, columns.bucket)).all()
+    sensors, buckets, counts, sums, minimums, maximums = rows_to_arrays(
+        rows, (np.int64, TIMESTAMP, np.int64, np.float64, np.float64, np.float64)
+    )
+    return split_by_key(sensors, buckets, sums / counts, minimums, maximums)
+
+
+def retained_since(sensor_ids=None):
+    """Return {sensor_id: timestamp of its oldest reading still stored} over the readings tables and archive.
+
+    Retention deletes readings oldest first, so a sensor's rollups from before
+    this time may summarize readings that no longer exist.
+    """
+    from app.services.archive import reading_archive
+    from app.services.partitions import reading_partitions
+
+    Reading = reading_partitions.readings()
+    query = db.session.query(Reading.sensor_id, func.min(Reading.timestamp)).group_by(Reading.sensor_id)
+    if sensor_ids:
+        query = query.filter(Reading.sensor_id.in_(sensor_ids))
+    oldest = dict(query.all())
+    for sensor_id in sensor_ids or reading_archive.sensor_ids():
+        archived = reading_archive.oldest(sensor_id)
+        if archived is not None and (sensor_id not in oldest or archived < oldest[sensor_id]):
+            oldest[sensor_id] = archived
+    return oldest
+
+
+def backfill_window(start, end, sensor_ids=None, retained=None):
+    """Rebuild the rollups of every bucket starting in [start, end) from raw readings.
+
+    `start` and `end` should be day boundaries so that no bucket is only
+    partly rebuilt. Existing rollups in the window are replaced, which makes
+    the backfill safe to re-run. A sensor's buckets starting before its oldest
+    stored reading, whose readings retention may have purged, are never
+    replaced: the bucket holding that reading is only added if it is missing,
+    and sensors without stored readings keep their rollups. `retained` is
+    retained_since() for the sensors, looked up when not given. Returns the
+    number of readings aggregated.
+    """
+    from app.models.device import SensorRollup
+    from app.services.archive import reading_archive
+    from app.services.partitions import reading_partitions
+
+    if retained is None:
+        retained = retained_since(sensor_ids)
+    elif sensor_ids:
+        retained = {sensor_id: retained[sensor_id] for sensor_id in sensor_ids if sensor_id in retained}
+
+    Reading = reading_partitions.readings(start, end)
+    query = db.session.query(Reading.sensor_id, Reading.value, Reading.timestamp).filter(
+        Reading.timestamp >= start,
+        Reading.timestamp < end
+    )
+    if sensor_ids:
+        query = query.filter(Reading.sensor_id.in_(sensor_ids))
+
+    # Stream the readings so a busy day never has to fit in memory, then add the archived ones
+    archived = reading_archive.rows(sensor_ids or reading_archive.sensor_ids(), start, end)
+    buckets = aggregate(chain(query.yield_per(ROLLUP_BACKFILL_BATCH), archived))
+
+    # Buckets wholly after the sensor's oldest stored reading are rebuilt, earlier ones only filled in
+    replace, fill = {}, {}
+    for key, bucket in buckets.items():
+        oldest = retained.get(key[0])
+        if oldest is not None and key[2] >= oldest:
+            replace[key] = bucket
+        else:
+            fill[key] = bucket
+
+    table = SensorRollup.__table__
+    whole = [sensor_id for sensor_id, oldest in retained.items() if oldest <= start]
+    deletes = []
+    if whole:
+        deletes.append(table.delete().where(
+            table.c.sensor_id.in_(whole), table.c.bucket >= start, table.c.bucket < end
+        ))
+    for sensor_id, oldest in retained.items():
+        if start < oldest < end:
+            deletes.append(table.delete().where(
+                table.c.sensor_id == sensor_id, table.c.bucket >= oldest, table.c.bucket < end
+            ))
+
+    try:
+        for delete in deletes:
+            db.session.execute(delete)
+        if fill:
+            existing = db.session.query(table.c.sensor_id, table.c.resolution, table.c.bucket).filter(
+                table.c.sensor_id.in_({sensor_id for sensor_id, _, _ in fill}),
+                table.c.bucket >= start,
+                table.c.bucket < end
+            ).all()
+            for key in existing:
+                fill.pop(tuple(key), None)
+        upsert_buckets({**replace, **fill})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sum(bucket[0] for (_, resolution, _), bucket in buckets.items() if resolution == '1m')
+
+
+def day_windows(start, end):
+    """Yield consecutive (day start, next day start) pairs covering [start, end)"""
+    day = TRUNCATE['1d'](start)
+    while day < end:
+        yield day, day + timedelta(days=1)
+        day += timedelta(days=1)
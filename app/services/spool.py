@@ -0,0 +1,293 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+from app.services.metrics import LatencyTracker
+from app.utils.locks import FileLock
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Spool Configuration
+INGEST_SPOOL_DIR = os.getenv('INGEST_SPOOL_DIR', '')
+INGEST_SPOOL_SEGMENT_MB = int(os.getenv('INGEST_SPOOL_SEGMENT_MB', 64))
+INGEST_SPOOL_MAX_MB = int(os.getenv('INGEST_SPOOL_MAX_MB', 1024))
+INGEST_SPOOL_BATCH = int(os.getenv('INGEST_SPOOL_BATCH', 5000))
+INGEST_SPOOL_FLUSH_MS = int(os.getenv('INGEST_SPOOL_FLUSH_MS', 50))
+INGEST_SPOOL_FSYNC = os.getenv('INGEST_SPOOL_FSYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Record header: body length, CRC32 of the body, topic length
+RECORD_HEADER = struct.Struct('>IIH')
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT_FILE = 'checkpoint'
+LOCK_FILE = 'lock'
+MAX_RETRY_DELAY = 5.0
+
+
+def segment_name(number):
+    """File name of a spool segment"""
+    return f'{number:012d}{SEGMENT_SUFFIX}'
+
+
+class SegmentSpool:
+    """Append-only on-disk log of raw MQTT messages between the network thread and the database.
+
+    Messages are appended with buffered sequential writes to numbered segment
+    files. A drainer thread replays them in order through `handler`, then calls
+    `commit` to write what was handled to the database, and only then records its
+    position in a checkpoint file. After a crash the drainer resumes from the
+    checkpoint, so messages are delivered at least once. Segments the checkpoint
+    has moved past are deleted. The directory is locked while the spool is
+    open, so two processes never write and replay the same segments.
+    """
+
+    def __init__(self, directory, segment_mb=INGEST_SPOOL_SEGMENT_MB, max_mb=INGEST_SPOOL_MAX_MB,
+                 batch=INGEST_SPOOL_BATCH, flush_interval_ms=INGEST_SPOOL_FLUSH_MS, fsync=INGEST_SPOOL_FSYNC):
+        self.directory = directory
+        self._directory_lock = None
+        self.segment_bytes = segment_mb * 1024 * 1024
+        self.max_bytes = max_mb * 1024 * 1024
+        self.batch = batch
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync = fsync
+
+        self.handler = None
+        self.commit = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+
+        # Segment being written
+        self._segment = None
+        self._file = None
+        self._written = 0
+        # Bytes held by unconsumed segments and the drainer's committed position
+        self._disk_bytes = 0
+        self._position = (1, 0)
+
+        self.appended = 0
+        self.drained = 0
+        self.dropped = 0
+        self.corrupt = 0
+        self.failed_commits = 0
+        self.commit_latency = LatencyTracker()
+
+    def open(self):
+        """Lock the spool directory and start a fresh segment after any left from a previous run"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._directory_lock = FileLock(self._path(LOCK_FILE))
+        if not self._directory_lock.acquire():
+            raise RuntimeError(f"Ingest spool {self.directory} is in use by another process")
+        segments = self._segments()
+        self._position = self._load_checkpoint()
+        self._disk_bytes = sum(os.path.getsize(self._path(number)) for number in segments)
+        self._roll(max(segments[-1] + 1 if segments else 1, self._position[0]))
+        if self._disk_bytes:
+            logger.info(f"Ingest spool resuming with {self._disk_bytes} bytes in {len(segments)} segments")
+
+    def start(self, handler, commit):
+        """Start the drainer thread calling `handler(topic, payload)` per message and `commit()` per batch"""
+        self.handler = handler
+        self.commit = commit
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._drain, name='ingest-spool-drainer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the drainer after it has replayed everything spooled"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._directory_lock is not None:
+            self._directory_lock.release()
+
+    def append(self, topic, payload):
+        """Append a raw message, returning False if the spool is full"""
+        topic = topic.encode()
+        body = topic + payload
+        record = RECORD_HEADER.pack(len(body), zlib.crc32(body), len(topic)) + body
+
+        with self._lock:
+            if self._disk_bytes + len(record) > self.max_bytes:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(f"Ingest spool full, {self.dropped} messages dropped so far")
+                return False
+            if self._written >= self.segment_bytes:
+                self._roll(self._segment + 1)
+            self._file.write(record)
+            self._written += len(record)
+            self._disk_bytes += len(record)
+            self.appended += 1
+        return True
+
+    def _roll(self, number):
+        """Close the current segment and start writing the next one"""
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._segment = number
+        self._file = open(self._path(number), 'ab', buffering=1024 * 1024)
+        self._written = 0
+
+    def _sync(self):
+        """Push buffered records to the OS, and to disk when fsync is enabled"""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _path(self, name):
+        return os.path.join(self.directory, segment_name(name) if isinstance(name, int) else name)
+
+    def _segments(self):
+        """Numbers of the segment files on disk, oldest first"""
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _load_checkpoint(self):
+        """Return the (segment, offset) the drainer has committed up to"""
+        try:
+            with open(self._path(CHECKPOINT_FILE)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (OSError, ValueError):
+            segments = self._segments()
+            return (segments[0] if segments else 1), 0
+
+    def _save_checkpoint(self, segment, offset):
+        """Atomically record the drainer's position and delete the segments before it"""
+        temporary = self._path(CHECKPOINT_FILE + '.tmp')
+        with open(temporary, 'w') as f:
+            f.write(f'{segment} {offset}')
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, self._path(CHECKPOINT_FILE))
+        self._position = (segment, offset)
+
+        for number in self._segments():
+            if number >= segment:
+                break
+            path = self._path(number)
+            size = os.path.getsize(path)
+            os.remove(path)
+            with self._lock:
+                self._disk_bytes -= size
+
+    def _read(self, segment, offset):
+        """Read up to `batch` records from a position, returning them with the position after them"""
+        records = []
+        path = self._path(segment)
+        if not os.path.exists(path):
+            return records, segment, offset
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while len(records) < self.batch:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, checksum, topic_length = RECORD_HEADER.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    break
+                if zlib.crc32(body) != checksum:
+                    # Nothing after a damaged record can be trusted, move on to the next segment
+                    self.corrupt += 1
+                    logger.error(f"Ingest spool segment {segment} is corrupt at offset {offset}, skipping the rest")
+                    return records, segment + 1, 0
+                records.append((body[:topic_length].decode(), body[topic_length:]))
+                offset += RECORD_HEADER.size + length
+        return records, segment, offset
+
+    def _drain(self):
+        """Drainer thread loop"""
+        segment, offset = self._position
+        while True:
+            with self._lock:
+                self._sync()
+                writing = self._segment
+
+            records, next_segment, next_offset = self._read(segment, offset)
+            if not records:
+                if next_segment != segment or segment < writing:
+                    # Past a corrupt record or the end of an older segment, including
+                    # a torn write left by a crash
+                    segment, offset = max(next_segment, segment + 1), 0
+                    self._save_checkpoint(segment, offset)
+                    continue
+                if not self._running:
+                    break
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                continue
+
+            for topic, payload in records:
+                try:
+                    self.handler(topic, payload)
+                except Exception as e:
+                    logger.error(f"Error processing spooled MQTT message: {e}")
+
+            # Retry until the database takes the batch; the spool keeps absorbing messages meanwhile
+            delay = self.flush_interval
+            while True:
+                started = time.monotonic()
+                try:
+                    self.commit()
+                    self.commit_latency.record(time.monotonic() - started)
+                    break
+                except Exception as e:
+                    self.failed_commits += 1
+                    if not self._running:
+                        # Leave the batch uncommitted, it is replayed on the next start
+                        logger.error(f"Error writing spooled messages during shutdown: {e}")
+                        return
+                    logger.error(f"Error writing spooled messages, retrying in {delay:.2f}s: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+
+            segment, offset = next_segment, next_offset
+            self._save_checkpoint(segment, offset)
+            self.drained += len(records)
+
+    def backlog_bytes(self):
+        """Return the bytes spooled but not yet committed to the database"""
+        return max(0, self._disk_bytes - self._position[1])
+
+    def get_stats(self):
+        """Return counters, disk usage and commit latency"""
+        return {
+            'directory': self.directory,
+            'appended': self.appended,
+            'drained': self.drained,
+            'backlog_bytes': self.backlog_bytes(),
+            'dropped': self.dropped,
+            'corrupt_segments': self.corrupt,
+            'failed_commits': self.failed_commits,
+            'disk_bytes': self._disk_bytes,
+            'max_bytes': self.max_bytes,
+            'segment': self._segment,
+            'checkpoint': {'segment': self._position[0], 'offset': self._position[1]},
+            'commit_latency': self.commit_latency.to_dict()
+        }
+
+
+# Process-wide spool, enabled by setting INGEST_SPOOL_DIR
+ingest_spool = SegmentSpool(INGEST_SPOOL_DIR) if INGEST_SPOOL_DIR else None
@@ -0,0 +1,320 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from app.services.device_registry import device_registry
+from app.services.status_buffer import status_buffer
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Dashboard Statistics Configuration
+STATS_RECONCILE_SECONDS = int(os.getenv('STATS_RECONCILE_SECONDS', 300))
+
+# Readings are counted per hour, matching the 1h rollups they are reconciled from
+BUCKET = timedelta(hours=1)
+BUCKETS_KEPT = 24
+
+# Counter key for the totals across every user, shown to admins
+ALL_USERS = '*'
+
+
+def hour_start(timestamp):
+    """Return the start of the hour containing `timestamp`"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class UserCounters:
+    """Device, sensor and reading counts for one user, or for everyone"""
+
+    __slots__ = ('devices', 'statuses', 'types', 'sensors', 'readings')
+
+    def __init__(self):
+        self.devices = 0
+        self.statuses = Counter()
+        self.types = Counter()
+        self.sensors = 0
+        # Hour start -> readings with a timestamp in that hour
+        self.readings = Counter()
+
+
+class DashboardStats:
+    """Keeps the dashboard's counters in memory, per user and in total.
+
+    Device and sensor routes, status messages and reading writes in this
+    process update the counters as they happen, so the dashboard reads them
+    without a query. Everything is periodically rebuilt from the database,
+    which picks up changes made by other processes and corrects any drift.
+    Until the first rebuild the updates are ignored, so processes that never
+    serve the dashboard pay nothing for them.
+    """
+
+    def __init__(self, reconcile_seconds=STATS_RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self.app = None
+        self._thread = None
+        self._lock = threading.RLock()
+        self._loaded = False
+
+        # Device primary key -> (user_id, device_type, status)
+        self._devices = {}
+        # Sensor id -> device primary key, and device primary key -> sensor ids
+        self._sensors = {}
+        self._device_sensors = {}
+        self._counters = {}
+
+        self.reconciles = 0
+        self.last_reconcile = None
+
+    def init_app(self, app):
+        """Bind the stats to the Flask app and start the reconcile thread"""
+        self.app = app
+        if self._thread is None and self.reconcile_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name='dashboard-stats', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Reconcile thread loop, starting with the initial load"""
+        while True:
+            try:
+                with self.app.app_context():
+                    self.reconcile()
+            except Exception as e:
+                logger.error(f"Error reconciling dashboard statistics: {e}")
+            time.sleep(self.reconcile_seconds)
+
+    def _user(self, user_id):
+        counters = self._counters.get(user_id)
+        if counters is None:
+            counters = self._counters[user_id] = UserCounters()
+        return counters
+
+    def _scopes(self, user_id):
+        """Counters a change to one of `user_id`'s devices applies to"""
+        return (self._user(user_id), self._user(ALL_USERS))
+
+    # Rebuild
+
+    def reconcile(self, now=None):
+        """Rebuild every counter from the database; runs in an app context"""
+        from app.config.database import db
+        from app.models.device import Device, Sensor, SensorRollup
+
+        started = time.perf_counter()
+        since = hour_start(now or datetime.utcnow()) - BUCKET * (BUCKETS_KEPT - 1)
+
+        devices = db.session.query(Device.id, Device.device_id, Device.user_id, Device.device_type, Device.status).all()
+        sensors = db.session.query(Sensor.id, Sensor.device_id).all()
+        readings = db.session.query(
+            Device.user_id, SensorRollup.bucket, db.func.sum(SensorRollup.count)
+        ).join(Sensor, SensorRollup.sensor_id == Sensor.id).join(Device, Sensor.device_id == Device.id).filter(
+            SensorRollup.resolution == '1h', SensorRollup.bucket >= since
+        ).group_by(Device.user_id, SensorRollup.bucket).all()
+        db.session.commit()
+
+        device_map = {}
+        counters = {}
+
+        def scopes(user_id):
+            for key in (user_id, ALL_USERS):
+                if key not in counters:
+                    counters[key] = UserCounters()
+                yield counters[key]
+
+        for id, device_id, user_id, device_type, status in devices:
+            # Status updates not written yet are newer than the database
+            buffered = status_buffer.get(device_id)
+            if buffered:
+                status = buffered[0]
+            device_map[id] = (user_id, device_type, status)
+            for scope in scopes(user_id):
+                scope.devices += 1
+                scope.statuses[status] += 1
+                scope.types[device_type] += 1
+
+        sensor_map = {}
+        device_sensors = {}
+        for id, device_pk in sensors:
+            sensor_map[id] = device_pk
+            device_sensors.setdefault(device_pk, set()).add(id)
+            device = device_map.get(device_pk)
+            if device is not None:
+                for scope in scopes(device[0]):
+                    scope.sensors += 1
+
+        for user_id, bucket, count in readings:
+            for scope in scopes(user_id):
+                scope.readings[bucket] += int(count)
+
+        with self._lock:
+            self._devices, self._sensors, self._counters = device_map, sensor_map, counters
+            self._device_sensors = device_sensors
+            self._loaded = True
+            self.reconciles += 1
+            self.last_reconcile = {
+                'finished_at': datetime.utcnow().isoformat(),
+                'duration_ms': round((time.perf_counter() - started) * 1000.0, 3),
+                'devices': len(device_map),
+                'sensors': len(sensor_map)
+            }
+
+    # Updates
+
+    def track_device(self, device):
+        """Count a device that was created or changed"""
+        with self._lock:
+            if not self._loaded:
+                return
+            previous = self._devices.get(device.id)
+            if previous is not None:
+                self._remove_device(device.id, previous)
+            status = device.current_status()[0]
+            self._devices[device.id] = (device.user_id, device.device_type, status)
+            for scope in self._scopes(device.user_id):
+                scope.devices += 1
+                scope.statuses[status] += 1
+                scope.types[device.device_type] += 1
+            if previous is not None and previous[0] != device.user_id:
+                # The device's sensors move to the new owner
+                sensors = len(self._device_sensors.get(device.id, ()))
+                self._user(previous[0]).sensors -= sensors
+                self._user(device.user_id).sensors += sensors
+
+    def sensor_readings(self, sensor_ids, now=None):
+        """Count the readings of some sensors per hour from the 1h rollups, before they are deleted"""
+        from app.config.database import db
+        from app.models.device import SensorRollup
+
+        if not self._loaded or not sensor_ids:
+            return Counter()
+        since = hour_start(now or datetime.utcnow()) - BUCKET * (BUCKETS_KEPT - 1)
+        rows = db.session.query(SensorRollup.bucket, db.func.sum(SensorRollup.count)).filter(
+            SensorRollup.sensor_id.in_(sensor_ids),
+            SensorRollup.resolution == '1h',
+            SensorRollup.bucket >= since
+        ).group_by(SensorRollup.bucket).all()
+        return Counter({bucket: int(count) for bucket, count in rows})
+
+    def forget_device(self, device_pk, readings=None):
+        """Stop counting a deleted device, its sensors and the hourly `readings` from `sensor_readings`"""
+        with self._lock:
+            if not self._loaded:
+                return
+            previous = self._devices.pop(device_pk, None)
+            if previous is None:
+                return
+            self._remove_device(device_pk, previous)
+            sensor_ids = self._device_sensors.pop(device_pk, set())
+            for sensor_id in sensor_ids:
+                self._sensors.pop(sensor_id, None)
+            for scope in self._scopes(previous[0]):
+                scope.sensors -= len(sensor_ids)
+                if readings:
+                    scope.readings.subtract(readings)
+
+    def _remove_device(self, device_pk, previous):
+        user_id, device_type, status = previous
+        for scope in self._scopes(user_id):
+            scope.devices -= 1
+            scope.statuses[status] -= 1
+            scope.types[device_type] -= 1
+
+    def track_sensor(self, sensor_id, device_pk):
+        """Count a sensor that was created"""
+        with self._lock:
+            if not self._loaded or sensor_id in self._sensors:
+                return
+            self._sensors[sensor_id] = device_pk
+            self._device_sensors.setdefault(device_pk, set()).add(sensor_id)
+            device = self._devices.get(device_pk)
+            if device is not None:
+                for scope in self._scopes(device[0]):
+                    scope.sensors += 1
+
+    def set_status(self, device_id, status):
+        """Move a device between status counts, by its MQTT device_id"""
+        info = device_registry.get(device_id)
+        if info is None:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            previous = self._devices.get(info.id)
+            if previous is None or previous[2] == status:
+                return
+            user_id, device_type, old_status = previous
+            self._devices[info.id] = (user_id, device_type, status)
+            for scope in self._scopes(user_id):
+                scope.statuses[old_status] -= 1
+                scope.statuses[status] += 1
+
+    def add_readings(self, rows):
+        """Count committed readings given as dicts with sensor_id and timestamp"""
+        with self._lock:
+            if not self._loaded or not rows:
+                return
+            by_user = Counter()
+            for row in rows:
+                device = self._devices.get(self._sensors.get(row['sensor_id']))
+                if device is not None:
+                    by_user[device[0], hour_start(row['timestamp'])] += 1
+            for (user_id, bucket), count in by_user.items():
+                for scope in self._scopes(user_id):
+                    scope.readings[bucket] += count
+
+    # Reads
+
+    def get(self, user_id=None, now=None):
+        """Return the dashboard counters for a user, or for everyone when `user_id` is None"""
+        with self._lock:
+            if not self._loaded:
+                self.reconcile(now)
+            counters = self._counters.get(ALL_USERS if user_id is None else user_id) or UserCounters()
+
+            now = now or datetime.utcnow()
+            hours = [hour_start(now) - BUCKET * offset for offset in range(BUCKETS_KEPT - 1, -1, -1)]
+            readings = [counters.readings.get(hour, 0) for hour in hours]
+            # Forget hours that fell out of the window
+            for hour in [hour for hour in counters.readings if hour < hours[0]]:
+                del counters.readings[hour]
+
+            types = sorted((name, count) for name, count in counters.types.items() if count > 0)
+            return {
+                'device_count': {
+                    'total': counters.devices,
+                    'online': counters.statuses['online'],
+                    'offline': counters.statuses['offline']
+                },
+                'sensor_count': counters.sensors,
+                'reading_count': sum(readings),
+                'device_types': {
+                    'labels': [name for name, _ in types],
+                    'data': [count for _, count in types]
+                },
+                'readings_per_hour': {
+                    'labels': [hour.isoformat() for hour in hours],
+                    'data': readings
+                }
+            }
+
+    def get_stats(self):
+        """Return how often the counters were rebuilt and how long the last rebuild took"""
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'reconcile_seconds': self.reconcile_seconds,
+                'reconciles': self.reconciles,
+                'users': len(self._counters) - (ALL_USERS in self._counters),
+                'last_reconcile': self.last_reconcile
+            }
+
+
+# Process-wide dashboard counters, reconciled by the web app
+dashboard_stats = DashboardStats()
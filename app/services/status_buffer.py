@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from app.services.ingestion import parse_timestamp
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Status buffer Configuration
+STATUS_FLUSH_INTERVAL_MS = int(os.getenv('STATUS_FLUSH_INTERVAL_MS', 500))
+
+
+class StatusWriteBehind:
+    """Coalesces device status updates and writes them in one batched UPDATE.
+
+    Only the latest status and last_seen per device is kept between flushes, so a
+    device reporting many times per interval costs a single row update.
+    """
+
+    def __init__(self, flush_interval_ms=STATUS_FLUSH_INTERVAL_MS):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.app = None
+
+        # device_id -> (status, last_seen) not yet handed to the database
+        self._pending = {}
+        # Updates being written by the current flush, still visible to readers
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+        self.updates = 0
+        self.rows_written = 0
+        self.flushes = 0
+
+    def init_app(self, app):
+        """Bind the buffer to the Flask app and start the flush thread"""
+        self.app = app
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='status-write-behind', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread after writing pending updates"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def update(self, device_id, status, last_seen=None):
+        """Record the latest status for a device"""
+        last_seen = parse_timestamp(last_seen) or datetime.utcnow()
+        with self._lock:
+            self._pending[device_id] = (status, last_seen)
+            self.updates += 1
+
+    def get(self, device_id):
+        """Return the buffered (status, last_seen) for a device, or None"""
+        with self._lock:
+            return self._pending.get(device_id) or self._inflight.get(device_id)
+
+    def flush(self):
+        """Write buffered status updates to the database and return the row count"""
+        if self.app is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                batch = self._inflight
+
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+            except Exception:
+                with self._lock:
+                    # Keep newer updates that arrived during the failed flush
+                    for device_id, value in batch.items():
+                        self._pending.setdefault(device_id, value)
+                    self._inflight = {}
+                raise
+
+            with self._lock:
+                self._inflight = {}
+            self.rows_written += len(batch)
+            self.flushes += 1
+            return len(batch)
+
+    def _write(self, batch):
+        """Apply a batch of status updates with one executemany UPDATE"""
+        from sqlalchemy import bindparam
+        from app.config.database import db
+        from app.models.device import Device
+
+        statement = Device.__table__.update().where(
+            Device.__table__.c.device_id == bindparam('b_device_id')
+        ).values(
+            status=bindparam('b_status'),
+            last_seen=bindparam('b_last_seen')
+        )
+        rows = [
+            {'b_device_id': device_id, 'b_status': status, 'b_last_seen': last_seen}
+            for device_id, (status, last_seen) in batch.items()
+        ]
+
+        try:
+            db.session.execute(statement, rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _run(self):
+        """Flush thread loop"""
+        while self._running:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing device status batch: {e}")
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error writing final device status batch: {e}")
+
+    def get_stats(self):
+        """Return counters describing how much the buffer coalesced"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'updates': self.updates,
+            'rows_written': self.rows_written,
+            'flushes': self.flushes,
+            'pending': pending
+        }
+
+
+# Process-wide status buffer used by the MQTT client
+status_buffer = StatusWriteBehind()
@@ -44,6 +44,7 @@ function initWebSocket() {
         // Connection established
         socket.on('connect', function() {
             console.log('WebSocket connected');
+            subscribeDeviceRooms(socket);
         });
         
         // Handle device status updates
@@ -61,6 +62,14 @@ function initWebSocket() {
             handleDeviceResponse(data.device_id, data.data);
         });
         
+        // Handle coalesced frames carrying several device events
+        socket.on('device_batch', function(batch) {
+            dispatchDeviceBatch(batch, {
+                device_status: data => updateDeviceStatus(data.device_id, data.data),
+                device_telemetry: data => updateDeviceTelemetry(data.device_id, data.data)
+            });
+        });
+        
         // Connection lost
         socket.on('disconnect', function() {
             console.log('WebSocket disconnected');
@@ -68,6 +77,38 @@ function initWebSocket() {
     }
 }
 
+/**
+ * Join the Socket.IO rooms this page needs. The server only sends device
+ * events to subscribed rooms, and rooms are lost on reconnect, so call this
+ * from every 'connect' handler.
+ * @param {object} socket - The Socket.IO client
+ */
+function subscribeDeviceRooms(socket) {
+    const controlForm = document.querySelector('.device-control-form[data-device-id]');
+    
+    if (controlForm) {
+        // Device control page only needs its own device
+        socket.emit('subscribe_device', { device_id: controlForm.dataset.deviceId });
+    } else if (document.querySelector('.device-card[data-device-id], #deviceTypeChart')) {
+        // Device lists and the dashboard follow all of the user's devices
+        socket.emit('subscribe_devices');
+    }
+}
+
+/**
+ * Dispatch the events of a coalesced 'device_batch' frame to per-event handlers
+ * @param {object} batch - Frame of the form {events: [{event, device_id, data}]}
+ * @param {object} handlers - Map of event name to handler taking {device_id, data}
+ */
+function dispatchDeviceBatch(batch, handlers) {
+    (batch.events || []).forEach(item => {
+        const handler = handlers[item.event];
+        if (handler) {
+            handler({ device_id: item.device_id, data: item.data });
+        }
+    });
+}
+
 /**
  * Update device status indicators in UI
  * @param {string} deviceId - The device ID
@@ -315,7 +356,8 @@ function initSensorCharts() {
                 window.sensorCharts[sensor.id] = new Chart(ctx, {
                     type: 'line',
                     data: {
-                        labels: sensor.data.labels,
+                        // Timestamps are epoch milliseconds
+                        labels: sensor.data.timestamps.map(ms => new Date(ms).toLocaleString()),
                         datasets: [{
                             label: `${sensor.name} (${sensor.unit || ''})`,
                             data: sensor.data.values,
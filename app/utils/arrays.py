@@ -0,0 +1,38 @@
+import numpy as np
+from sqlalchemy import String, type_coerce
+
+# dtype of timestamp columns, which are returned as int64 microseconds since the epoch
+TIMESTAMP = 'datetime64[us]'
+
+
+def raw_timestamp(column):
+    """Select a timestamp column as the driver returns it, skipping SQLAlchemy's per-row datetime parsing.
+
+    SQLite returns ISO strings and PostgreSQL datetimes; numpy parses either
+    a whole column at a time in rows_to_arrays.
+    """
+    return type_coerce(column, String)
+
+
+def rows_to_arrays(rows, dtypes):
+    """Transpose result tuples into one numpy array per column, with TIMESTAMP columns as int64 microseconds"""
+    arrays = []
+    for index, dtype in enumerate(dtypes):
+        if dtype == TIMESTAMP:
+            array = np.array([row[index] for row in rows], dtype=TIMESTAMP).view(np.int64)
+        else:
+            array = np.fromiter((row[index] for row in rows), dtype=dtype, count=len(rows))
+        arrays.append(array)
+    return arrays
+
+
+def split_by_key(keys, *arrays):
+    """Split arrays sorted by `keys` into {key: (array slices)}, one entry per distinct key"""
+    if not len(keys):
+        return {}
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    ends = np.append(starts[1:], len(keys))
+    return {
+        int(keys[start]): tuple(array[start:end] for array in arrays)
+        for start, end in zip(starts.tolist(), ends.tolist())
+    }
@@ -0,0 +1,98 @@
+import json
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+# Use orjson when it is installed, otherwise fall back to the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# MessagePack is optional and only needed by devices that use the binary format
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_LIBRARY = 'orjson' if orjson is not None else 'json'
+
+# Wire formats a device can negotiate through its metadata or topic suffix
+PAYLOAD_FORMATS = ('json', 'msgpack')
+
+
+def _default(obj):
+    """Serialize values the JSON libraries do not handle natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def loads(data):
+    """Decode JSON from bytes or str without an intermediate decode() copy"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson refuses the NaN and Infinity literals the standard library accepts,
+            # so leave it to the caller to reject those values one at a time
+            return json.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encode an object as UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode()
+
+
+def _require_msgpack():
+    """Raise a clear error when the binary format is used without msgpack installed"""
+    if msgpack is None:
+        raise ValueError("The msgpack payload format requires the 'msgpack' package")
+
+
+def sniff_format(data):
+    """Guess the wire format of a raw payload from its first byte"""
+    stripped = data.lstrip()
+    if not stripped or stripped[:1] in (b'{', b'['):
+        return 'json'
+    return 'msgpack'
+
+
+def encode_payload(obj, fmt='json'):
+    """Encode an MQTT payload in the given wire format"""
+    if fmt == 'msgpack':
+        _require_msgpack()
+        return msgpack.packb(obj, default=_default, use_bin_type=True)
+    return dumps(obj)
+
+
+def decode_payload(data, fmt=None):
+    """Decode an MQTT payload, detecting the wire format when it is not given"""
+    if fmt is None:
+        fmt = sniff_format(data)
+    if fmt == 'msgpack':
+        _require_msgpack()
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by the codec, used by jsonify() and request.get_json()"""
+
+    def dumps(self, obj, **kwargs):
+        # Pretty printing and other options are only supported by the stdlib path
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
@@ -0,0 +1,56 @@
+import os
+import threading
+
+# flock is only available on Unix; elsewhere every process gets the lock
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    """An exclusive lock on a file, held by at most one process at a time.
+
+    The lock is taken without waiting and kept until release() or until the
+    process exits, when the operating system releases it. The holder's PID is
+    written to the file to show which process has it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        """Whether this process holds the lock"""
+        return self._file is not None
+
+    def acquire(self):
+        """Take the lock unless another process holds it, returning whether this process holds it"""
+        with self._lock:
+            if self._file is not None:
+                return True
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            lock_file = open(self.path, 'a+', encoding='ascii')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return False
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(f'{os.getpid()}\n')
+            lock_file.flush()
+            self._file = lock_file
+            return True
+
+    def release(self):
+        """Release the lock if this process holds it"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
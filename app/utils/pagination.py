@@ -0,0 +1,69 @@
+import base64
+import binascii
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_
+
+from app.utils import codec
+
+# Load environment variables
+load_dotenv()
+
+# Pagination Configuration
+DEVICE_PAGE_SIZE = int(os.getenv('DEVICE_PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 1000))
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode the (timestamp, id) key of the last row of a page as an opaque cursor"""
+    data = codec.dumps([timestamp.isoformat(), row_id])
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into its (timestamp, id) key, raising ValueError when it is malformed"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, row_id = codec.loads(data)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def page_size(value, default):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    if value is None:
+        return default
+    return max(1, min(value, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, timestamp_column, id_column, cursor, limit, descending=False):
+    """Return one page of `query` ordered by (timestamp, id) and the cursor of the next page, or None.
+
+    The page starts right after the row the cursor was taken from, found
+    through an index on the two columns, so every page costs the same no
+    matter how deep into the results it is.
+    """
+    if cursor is not None:
+        timestamp, row_id = cursor
+        if descending:
+            query = query.filter(timestamp_column <= timestamp, or_(
+                timestamp_column < timestamp, and_(timestamp_column == timestamp, id_column < row_id)
+            ))
+        else:
+            query = query.filter(timestamp_column >= timestamp, or_(
+                timestamp_column > timestamp, and_(timestamp_column == timestamp, id_column > row_id)
+            ))
+    order = (timestamp_column.desc(), id_column.desc()) if descending else (timestamp_column, id_column)
+
+    # One extra row tells whether there is a next page
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+JSON codec benchmark
+
+Compares the standard library json module with the codec in app.utils.codec
+on the two hot paths: decoding MQTT telemetry payloads and encoding API
+responses for device lists.
+
+Run from the project root:
+    python -m benchmarks.bench_codec --messages 100000 --devices 10000
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+from app.utils import codec
+
+
+def telemetry_payload(i):
+    """Build a raw telemetry message like the device simulator publishes"""
+    return json.dumps({
+        'timestamp': datetime.utcnow().isoformat(),
+        'readings': {
+            'temperature': 21.5 + (i % 10) * 0.1,
+            'humidity': 40 + i % 7,
+            'pressure': 1013.25,
+            'battery_level': 99.5
+        }
+    }).encode()
+
+
+def device_dict(i):
+    """Build a dictionary shaped like Device.to_dict()"""
+    now = datetime.utcnow().isoformat()
+    return {
+        'id': i,
+        'device_id': f'device-{i:06d}',
+        'name': f'Device {i}',
+        'device_type': 'sensor',
+        'description': 'Simulated device',
+        'status': 'online',
+        'location': '52.52,13.40',
+        'ip_address': '10.0.0.1',
+        'mac_address': '00:11:22:33:44:55',
+        'firmware_version': '1.0.0',
+        'last_seen': now,
+        'created_at': now,
+        'updated_at': now,
+        'config': {'reporting_interval': 60},
+        'metadata': {'vendor': 'acme'},
+        'user_id': 1
+    }
+
+
+def timed(func, repeat):
+    """Run func `repeat` times and return the best wall time in seconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """Run the benchmark and print a comparison table"""
+    parser = argparse.ArgumentParser(description='JSON codec benchmark')
+    parser.add_argument('--messages', type=int, default=100000, help='Telemetry messages to decode')
+    parser.add_argument('--devices', type=int, default=10000, help='Devices in the encoded list response')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions, the best run is reported')
+    args = parser.parse_args()
+
+    messages = [telemetry_payload(i) for i in range(args.messages)]
+    devices = [device_dict(i) for i in range(args.devices)]
+
+    results = [
+        ('decode telemetry', 'json.loads(payload.decode())',
+         timed(lambda: [json.loads(m.decode()) for m in messages], args.repeat)),
+        ('decode telemetry', f'codec.loads ({codec.JSON_LIBRARY})',
+         timed(lambda: [codec.loads(m) for m in messages], args.repeat)),
+        ('encode device list', 'json.dumps(...).encode()',
+         timed(lambda: json.dumps(devices).encode(), args.repeat)),
+        ('encode device list', f'codec.dumps ({codec.JSON_LIBRARY})',
+         timed(lambda: codec.dumps(devices), args.repeat)),
+    ]
+
+    print(f"{'case':<20} {'implementation':<32} {'total ms':>10} {'per item us':>12}")
+    for case, name, elapsed in results:
+        count = args.messages if case.startswith('decode') else args.devices
+        print(f"{case:<20} {name:<32} {elapsed * 1000:>10.1f} {elapsed / count * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
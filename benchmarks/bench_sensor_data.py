@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Sensor chart data benchmark
+
+Compares two ways of building the dashboard's sensor chart data for one
+device:
+
+- per sensor: the previous api_sensor_data, which picked a resolution and
+  read readings or rollups with separate queries for every sensor, loaded
+  ORM objects and formatted a strftime label per point
+- grouped: what api_sensor_data does now, one query per resolution for all
+  of the device's sensors returning tuples, with numpy arrays and epoch
+  millisecond timestamps
+
+Both are timed for the automatic resolution (rollups once the readings do
+not fit the point budget) and for raw readings, and the grouped reads also
+with raw readings downsampled to the point budget by LTTB and min/max, as
+api_sensor_data does. Times include encoding the response.
+
+Run from the project root:
+    python -m benchmarks.bench_sensor_data --sensors 20 --readings 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import event
+
+from app.config.database import create_db_app, db
+from app.models.device import Device, Sensor, SensorReading, SensorRollup
+from app.models.user import User
+from app.services.downsampling import downsample
+from app.services.recent_readings import recent_readings
+from app.services.rollups import (ROLLUP_MAX_POINTS, apply_rollups, choose_resolution, choose_resolutions,
+                                  rollup_columns, rollup_query)
+from app.utils import codec
+
+NO_DATA = (np.empty(0, np.int64),) + (np.empty(0, np.float64),) * 3
+
+
+def populate(sensors, readings, hours):
+    """Create a device with `sensors` sensors holding `readings` readings each, spread over the last `hours`"""
+    user = User(username='bench', email='bench@example.com', password='bench')
+    db.session.add(user)
+    db.session.commit()
+    device = Device(device_id='bench-device', name='Bench device', device_type='sensor', user_id=user.id)
+    db.session.add(device)
+    db.session.commit()
+
+    end = datetime.utcnow()
+    step = timedelta(seconds=hours * 3600 / readings)
+    start = end - step * readings
+    for number in range(sensors):
+        sensor = Sensor(sensor_id=f'bench-device:s{number}', name=f'Sensor {number}',
+                        sensor_type='temperature', device_id=device.id, unit='C')
+        db.session.add(sensor)
+        db.session.flush()
+        rows = [
+            {'sensor_id': sensor.id, 'value': 20.0 + (i % 100) * 0.1, 'timestamp': start + step * i}
+            for i in range(readings)
+        ]
+        db.session.execute(SensorReading.__table__.insert(), rows)
+        apply_rollups((row['sensor_id'], row['value'], row['timestamp']) for row in rows)
+        db.session.commit()
+    return device.id
+
+
+def per_sensor(device_id, start, requested, max_points):
+    """The previous implementation: queries and ORM objects per sensor, a label string per point"""
+    sensor_data = []
+    for sensor in Sensor.query.filter_by(device_id=device_id).all():
+        resolution = requested
+        if resolution == 'auto':
+            resolution = choose_resolution(sensor.id, start, max_points=max_points)
+
+        if resolution == 'raw':
+            readings = recent_readings.readings(sensor.id, start, descending=False)
+            data = {
+                'labels': [reading.timestamp.strftime('%Y-%m-%d %H:%M:%S') for reading in readings],
+                'values': [reading.value for reading in readings]
+            }
+        else:
+            rollups = rollup_query(sensor.id, resolution, start).order_by(SensorRollup.bucket.asc()).all()
+            data = {
+                'labels': [rollup.bucket.strftime('%Y-%m-%d %H:%M:%S') for rollup in rollups],
+                'values': [rollup.sum_value / rollup.count for rollup in rollups],
+                'min': [rollup.min_value for rollup in rollups],
+                'max': [rollup.max_value for rollup in rollups]
+            }
+
+        sensor_data.append({'id': sensor.id, 'name': sensor.name, 'type': sensor.sensor_type,
+                            'unit': sensor.unit, 'resolution': resolution, 'data': data})
+    return codec.dumps(sensor_data)
+
+
+def grouped(device_id, start, requested, max_points, method=None):
+    """The current implementation: one query per resolution for all sensors, numpy arrays, epoch timestamps.
+
+    With a downsampling `method`, series longer than `max_points` are downsampled.
+    """
+    sensors = db.session.query(Sensor.id, Sensor.name, Sensor.sensor_type, Sensor.unit).filter(
+        Sensor.device_id == device_id
+    ).order_by(Sensor.id).all()
+    sensor_ids = [sensor.id for sensor in sensors]
+
+    if requested == 'auto':
+        resolutions = choose_resolutions(sensor_ids, start, max_points=max_points)
+    else:
+        resolutions = dict.fromkeys(sensor_ids, requested)
+
+    columns = {}
+    for resolution in set(resolutions.values()):
+        resolution_ids = [sensor_id for sensor_id in sensor_ids if resolutions[sensor_id] == resolution]
+        if resolution == 'raw':
+            columns[resolution] = recent_readings.columns(resolution_ids, start)
+        else:
+            columns[resolution] = rollup_columns(resolution_ids, resolution, start)
+
+    sensor_data = []
+    for sensor in sensors:
+        resolution = resolutions[sensor.id]
+        arrays = columns[resolution].get(sensor.id, NO_DATA)
+        if method is not None and len(arrays[0]) > max_points:
+            keep = downsample(arrays[0], arrays[1], max_points, method)
+            arrays = tuple(array[keep] for array in arrays)
+        data = {'timestamps': (arrays[0] // 1000).tolist(), 'values': arrays[1].tolist()}
+        if resolution != 'raw':
+            data['min'] = arrays[2].tolist()
+            data['max'] = arrays[3].tolist()
+        sensor_data.append({'id': sensor.id, 'name': sensor.name, 'type': sensor.sensor_type,
+                            'unit': sensor.unit, 'resolution': resolution, 'data': data})
+    return codec.dumps(sensor_data)
+
+
+def timed(func, repeat):
+    """Run func `repeat` times with a fresh session each time; return the best wall time, queries run and output"""
+    queries = []
+
+    def count_query(*args):
+        queries.append(args[2])
+
+    event.listen(db.engine, 'before_cursor_execute', count_query)
+    best = None
+    try:
+        for _ in range(repeat):
+            db.session.remove()
+            del queries[:]
+            started = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_query)
+    return best, len(queries), output
+
+
+def main():
+    """Run the benchmark and print a comparison table"""
+    parser = argparse.ArgumentParser(description='Sensor chart data benchmark')
+    parser.add_argument('--sensors', type=int, default=20, help='Sensors on the device')
+    parser.add_argument('--readings', type=int, default=100000, help='Readings per sensor')
+    parser.add_argument('--hours', type=int, default=24, help='Hours the readings are spread over, and charted')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions, the best run is reported')
+    parser.add_argument('--database', help='Database URI to fill, a temporary SQLite file by default')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URI'] = args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_db_app('bench_sensor_data')
+    with app.app_context():
+        print(f"Writing {args.sensors} x {args.readings} readings ...")
+        device_id = populate(args.sensors, args.readings, args.hours)
+        start = datetime.utcnow() - timedelta(hours=args.hours)
+
+        print(f"{'resolution':<12} {'implementation':<18} {'queries':>8} {'total ms':>10} {'response KB':>12}")
+        points = ROLLUP_MAX_POINTS
+        cases = [
+            ('auto', 'per sensor', lambda: per_sensor(device_id, start, 'auto', points)),
+            ('auto', 'grouped', lambda: grouped(device_id, start, 'auto', points)),
+            ('raw', 'per sensor', lambda: per_sensor(device_id, start, 'raw', points)),
+            ('raw', 'grouped', lambda: grouped(device_id, start, 'raw', points)),
+            ('raw', 'grouped + lttb', lambda: grouped(device_id, start, 'raw', points, 'lttb')),
+            ('raw', 'grouped + minmax', lambda: grouped(device_id, start, 'raw', points, 'minmax')),
+        ]
+        for requested, name, func in cases:
+            elapsed, queries, output = timed(func, args.repeat)
+            print(f"{requested:<12} {name:<18} {queries:>8} {elapsed * 1000:>10.1f} {len(output) / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Shared subscription check
+
+Starts an in-process stand-in for the MQTT broker, runs several consumer
+processes subscribed exactly like ingestion workers (shared group, unique
+client IDs) plus one direct subscriber like a web app running with
+MQTT_INGEST=false, then publishes telemetry and checks that:
+
+- every message reached exactly one member of the shared group
+- the load was spread over all members
+- the direct subscriber received every message
+
+Run from the project root:
+    python -m benchmarks.shared_subscriptions --workers 4 --messages 20000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from app.config.mqtt_client import subscription_topics, unique_client_id
+from app.utils import codec
+
+# MQTT 3.1.1 control packet types
+CONNECT, PUBLISH, SUBSCRIBE, UNSUBSCRIBE, PINGREQ, DISCONNECT = 1, 3, 8, 10, 12, 14
+
+
+def topic_matches(topic_filter, topic):
+    """Check an MQTT topic against a subscription filter with + and # wildcards"""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts) or (part != '+' and part != topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_packet(first_byte, body):
+    """Frame a packet body with its fixed header"""
+    header = bytearray([first_byte])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+class StubBroker:
+    """Minimal in-process MQTT 3.1.1 broker that understands $share/<group>/ subscriptions.
+
+    Shared subscriptions are served round robin among the group's members, like
+    Mosquitto does. Everything is delivered at QoS 0 and there are no retained
+    messages, persistent sessions or wills; it is only meant for local checks.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.published = 0
+        # topic filter -> set of writers
+        self._subscribers = {}
+        # (group, topic filter) -> [writers, next member index]
+        self._groups = {}
+        self._loop = asyncio.new_event_loop()
+
+    def start(self):
+        """Start serving on a background thread and return the bound port"""
+        threading.Thread(target=self._loop.run_forever, name='stub-broker', daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+        return self.port
+
+    def stop(self):
+        """Stop the event loop"""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def _client(self, reader, writer):
+        """Handle one client connection"""
+        try:
+            while True:
+                first_byte = (await reader.readexactly(1))[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7f) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+
+                packet_type = first_byte >> 4
+                if packet_type == CONNECT:
+                    writer.write(b'\x20\x02\x00\x00')
+                elif packet_type == PUBLISH:
+                    self._publish(first_byte, body, writer)
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(body, writer)
+                elif packet_type == UNSUBSCRIBE:
+                    self._unsubscribe(body, writer)
+                elif packet_type == PINGREQ:
+                    writer.write(b'\xd0\x00')
+                elif packet_type == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._remove(writer)
+            writer.close()
+
+    def _read_filters(self, body, with_qos):
+        """Yield the topic filters of a SUBSCRIBE (`with_qos`) or UNSUBSCRIBE body"""
+        position = 2
+        while position < len(body):
+            length = int.from_bytes(body[position:position + 2], 'big')
+            position += 2 + length
+            yield body[position - length:position].decode()
+            if with_qos:
+                position += 1
+
+    def _subscribe(self, body, writer):
+        granted = bytearray()
+        for topic_filter in self._read_filters(body, with_qos=True):
+            if topic_filter.startswith('$share/'):
+                _, group, topic_filter = topic_filter.split('/', 2)
+                members = self._groups.setdefault((group, topic_filter), [[], 0])[0]
+                if writer not in members:
+                    members.append(writer)
+            else:
+                self._subscribers.setdefault(topic_filter, set()).add(writer)
+            granted.append(0)
+        writer.write(encode_packet(0x90, body[:2] + bytes(granted)))
+
+    def _unsubscribe(self, body, writer):
+        for topic_filter in self._read_filters(body, with_qos=False):
+            if topic_filter.startswith('$share/'):
+                _, group, topic_filter = topic_filter.split('/', 2)
+                members = self._groups.get((group, topic_filter), [[], 0])[0]
+                if writer in members:
+                    members.remove(writer)
+            else:
+                self._subscribers.get(topic_filter, set()).discard(writer)
+        writer.write(encode_packet(0xb0, body[:2]))
+
+    def _remove(self, writer):
+        for writers in self._subscribers.values():
+            writers.discard(writer)
+        for members, _ in self._groups.values():
+            if writer in members:
+                members.remove(writer)
+
+    def _publish(self, first_byte, body, writer):
+        length = int.from_bytes(body[:2], 'big')
+        topic = body[2:2 + length].decode()
+        position = 2 + length
+        if (first_byte >> 1) & 0x03:
+            writer.write(b'\x40\x02' + body[position:position + 2])
+            position += 2
+        self.published += 1
+
+        frame = encode_packet(0x30, body[:2 + length] + body[position:])
+        targets = set()
+        for topic_filter, writers in self._subscribers.items():
+            if topic_matches(topic_filter, topic):
+                targets |= writers
+        for (_, topic_filter), entry in self._groups.items():
+            members, index = entry
+            if members and topic_matches(topic_filter, topic):
+                targets.add(members[index % len(members)])
+                entry[1] = index + 1
+        for target in targets:
+            target.write(frame)
+
+
+def consume(role, port, topics, ready, received, results, stop):
+    """Consumer process: subscribe, count messages until told to stop, report what arrived"""
+    client_id = unique_client_id()
+    sequences = []
+    acknowledged = []
+
+    def on_connect(client, userdata, flags, rc):
+        for topic in topics:
+            client.subscribe(topic)
+
+    def on_subscribe(client, userdata, mid, granted_qos):
+        acknowledged.append(mid)
+        if len(acknowledged) == len(topics):
+            ready.put(client_id)
+
+    def on_message(client, userdata, msg):
+        sequences.append(codec.loads(msg.payload)['seq'])
+        with received.get_lock():
+            received.value += 1
+
+    client = mqtt.Client(client_id=client_id)
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_message = on_message
+    client.connect('127.0.0.1', port)
+    client.loop_start()
+    stop.wait()
+    client.disconnect()
+    client.loop_stop()
+    results.put((role, client_id, sequences))
+
+
+def main():
+    """Run the check and print how messages were distributed"""
+    parser = argparse.ArgumentParser(description='Shared subscription check')
+    parser.add_argument('--workers', type=int, default=4, help='Ingestion worker processes in the shared group')
+    parser.add_argument('--messages', type=int, default=20000, help='Telemetry messages to publish')
+    parser.add_argument('--devices', type=int, default=100, help='Distinct devices publishing')
+    parser.add_argument('--group', default='ingest', help='Shared subscription group')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for delivery')
+    args = parser.parse_args()
+
+    broker = StubBroker()
+    port = broker.start()
+
+    context = multiprocessing.get_context('spawn')
+    ready, results, stop = context.Queue(), context.Queue(), context.Event()
+    shared_received, direct_received = context.Value('i', 0), context.Value('i', 0)
+
+    shared_topics = subscription_topics(args.group, ingest=True, responses=False)
+    direct_topics = subscription_topics(args.group, ingest=False, responses=False)
+    consumers = [
+        context.Process(target=consume, args=('shared', port, shared_topics, ready, shared_received, results, stop))
+        for _ in range(args.workers)
+    ]
+    consumers.append(
+        context.Process(target=consume, args=('direct', port, direct_topics, ready, direct_received, results, stop))
+    )
+    for consumer in consumers:
+        consumer.start()
+    for _ in consumers:
+        ready.get(timeout=args.timeout)
+
+    publisher = mqtt.Client(client_id=unique_client_id('shared-check-publisher'))
+    publisher.connect('127.0.0.1', port)
+    publisher.loop_start()
+
+    started = time.monotonic()
+    for seq in range(args.messages):
+        payload = codec.dumps({'seq': seq, 'readings': {'temperature': 21.5, 'humidity': 40}})
+        publisher.publish(f'devices/device-{seq % args.devices:04d}/telemetry', payload)
+
+    deadline = started + args.timeout
+    while time.monotonic() < deadline:
+        if shared_received.value >= args.messages and direct_received.value >= args.messages:
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - started
+    # Give duplicates, if any, a moment to arrive before counting
+    time.sleep(0.2)
+
+    stop.set()
+    reports = [results.get(timeout=args.timeout) for _ in consumers]
+    for consumer in consumers:
+        consumer.join()
+    publisher.disconnect()
+    publisher.loop_stop()
+    broker.stop()
+
+    direct_client_id, direct_sequences = next(
+        (client_id, sequences) for role, client_id, sequences in reports if role == 'direct'
+    )
+    reports = [(client_id, sequences) for role, client_id, sequences in reports if role == 'shared']
+    shared = [seq for _, sequences in reports for seq in sequences]
+
+    duplicates = len(shared) - len(set(shared))
+    missing = args.messages - len(set(shared))
+    print(f"{'client id':<48} {'messages':>10}")
+    for client_id, sequences in sorted(reports):
+        print(f"{client_id:<48} {len(sequences):>10}")
+    print(f"{direct_client_id + ' (direct)':<48} {len(direct_sequences):>10}")
+    print(f"published {args.messages} messages in {elapsed * 1000:.1f} ms "
+          f"({args.messages / elapsed:.0f} msg/s), duplicates={duplicates} missing={missing}")
+
+    failures = []
+    if duplicates or missing:
+        failures.append('shared group did not receive every message exactly once')
+    if any(not sequences for _, sequences in reports):
+        failures.append('a shared group member received no messages')
+    if len(direct_sequences) != args.messages:
+        failures.append('direct subscriber did not receive every message')
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
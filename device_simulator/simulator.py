@@ -4,6 +4,11 @@ IoT Device Simulator for testing the IoT Device Controller
 
 This script simulates one or more IoT devices connecting to the MQTT broker,
 receiving commands, and publishing telemetry data.
+
+Devices publish JSON by default. With --format msgpack they publish compact
+MessagePack payloads with integer epoch-millisecond timestamps on topics
+suffixed with the format (e.g. devices/<id>/telemetry/msgpack), and report the
+bytes and encoding time per message when they disconnect.
 """
 
 import json
@@ -18,6 +23,12 @@ from uuid import uuid4
 
 import paho.mqtt.client as mqtt
 
+# MessagePack is only needed when simulating devices with --format msgpack
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -62,7 +73,8 @@ DEVICE_TYPES = {
 class IoTDevice:
     """Simulated IoT device that connects to MQTT and responds to commands"""
     
-    def __init__(self, device_id, device_type, name, broker_host='localhost', broker_port=1883, username=None, password=None):
+    def __init__(self, device_id, device_type, name, broker_host='localhost', broker_port=1883, username=None, password=None,
+                 payload_format='json'):
         self.device_id = device_id
         self.device_type = device_type
         self.name = name
@@ -70,6 +82,17 @@ class IoTDevice:
         if device_type not in DEVICE_TYPES:
             raise ValueError(f"Unknown device type: {device_type}")
         
+        if payload_format not in ('json', 'msgpack'):
+            raise ValueError(f"Unknown payload format: {payload_format}")
+        if payload_format == 'msgpack' and msgpack is None:
+            raise ValueError("The msgpack payload format requires the 'msgpack' package")
+        self.payload_format = payload_format
+        
+        # Payload size and encoding cost counters
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.encode_seconds = 0.0
+        
         self.capabilities = DEVICE_TYPES[device_type]
         self.state = self._init_state()
         
@@ -94,12 +117,15 @@ class IoTDevice:
         
         # Flag to control the device loop
         self.running = False
+        
+        # ID of the command being handled, echoed back in its response
+        self._command_id = None
     
     def _init_state(self):
         """Initialize device state based on device type"""
         state = {
             'status': 'online',
-            'last_seen': datetime.utcnow().isoformat()
+            'last_seen': self._timestamp()
         }
         
         if self.device_type == 'light':
@@ -151,11 +177,44 @@ class IoTDevice:
         
         # Send offline status
         self.state['status'] = 'offline'
-        self.state['last_seen'] = datetime.utcnow().isoformat()
+        self.state['last_seen'] = self._timestamp()
         self.publish_status()
         
         self.client.loop_stop()
         self.client.disconnect()
+        
+        if self.messages_sent:
+            logger.info(
+                f"Device {self.device_id} sent {self.messages_sent} {self.payload_format} messages, "
+                f"{self.bytes_sent / self.messages_sent:.1f} bytes and "
+                f"{self.encode_seconds / self.messages_sent * 1e6:.1f} us encoding per message"
+            )
+    
+    def _timestamp(self):
+        """Current time as ISO string for JSON or epoch milliseconds for compact formats"""
+        if self.payload_format == 'json':
+            return datetime.utcnow().isoformat()
+        return int(time.time() * 1000)
+    
+    def _topic(self, message_type):
+        """Topic for an outgoing message, suffixed with the payload format unless JSON"""
+        topic = f"devices/{self.device_id}/{message_type}"
+        if self.payload_format != 'json':
+            topic = f"{topic}/{self.payload_format}"
+        return topic
+    
+    def _publish(self, message_type, payload):
+        """Encode and publish a message, recording its size and encoding time"""
+        started = time.perf_counter()
+        if self.payload_format == 'msgpack':
+            data = msgpack.packb(payload, use_bin_type=True)
+        else:
+            data = json.dumps(payload).encode()
+        self.encode_seconds += time.perf_counter() - started
+        self.messages_sent += 1
+        self.bytes_sent += len(data)
+        
+        self.client.publish(self._topic(message_type), data)
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback for when the client connects to the broker"""
@@ -190,7 +249,10 @@ class IoTDevice:
         """Callback for when a message is received from the broker"""
         try:
             topic = msg.topic
-            payload = json.loads(msg.payload.decode())
+            if msg.payload[:1] in (b'{', b'[') or msgpack is None:
+                payload = json.loads(msg.payload.decode())
+            else:
+                payload = msgpack.unpackb(msg.payload, raw=False)
             logger.info(f"Received message on {topic}: {payload}")
             
             # Handle command
@@ -203,6 +265,7 @@ class IoTDevice:
         """Handle a command received from the broker"""
         command = payload.get('command')
         params = payload.get('params', {})
+        self._command_id = payload.get('command_id')
         
         if command not in self.capabilities['commands']:
             logger.warning(f"Received unsupported command: {command}")
@@ -300,32 +363,29 @@ class IoTDevice:
     
     def _publish_response(self, command, success, message):
         """Publish a response to a command"""
-        response_topic = f"devices/{self.device_id}/response"
         payload = {
+            'command_id': self._command_id,
             'command': command,
             'success': success,
             'message': message,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': self._timestamp()
         }
         
-        self.client.publish(response_topic, json.dumps(payload))
+        self._publish('response', payload)
         logger.info(f"Published response: {payload}")
     
     def publish_status(self):
         """Publish device status"""
-        status_topic = f"devices/{self.device_id}/status"
-        self.state['last_seen'] = datetime.utcnow().isoformat()
+        self.state['last_seen'] = self._timestamp()
         
-        self.client.publish(status_topic, json.dumps(self.state))
+        self._publish('status', self.state)
         logger.info(f"Published status for {self.device_id}")
     
     def publish_telemetry(self):
         """Publish telemetry data"""
-        telemetry_topic = f"devices/{self.device_id}/telemetry"
-        
         # Prepare telemetry data
         telemetry = {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': self._timestamp(),
             'readings': {}
         }
         
@@ -357,7 +417,7 @@ class IoTDevice:
                 'battery_level': self.state['battery_level']
             }
         
-        self.client.publish(telemetry_topic, json.dumps(telemetry))
+        self._publish('telemetry', telemetry)
         logger.info(f"Published telemetry for {self.device_id}")
     
     def update_simulated_values(self):
@@ -418,7 +478,7 @@ class IoTDevice:
             # Sleep to avoid high CPU usage
             time.sleep(1)
 
-def create_device(device_type, broker_host, broker_port, mqtt_username=None, mqtt_password=None):
+def create_device(device_type, broker_host, broker_port, mqtt_username=None, mqtt_password=None, payload_format='json'):
     """Create a new simulated device"""
     device_id = str(uuid4())
     name = f"{device_type.capitalize()} {device_id[:6]}"
@@ -430,7 +490,8 @@ def create_device(device_type, broker_host, broker_port, mqtt_username=None, mqt
         broker_host=broker_host,
         broker_port=broker_port,
         username=mqtt_username,
-        password=mqtt_password
+        password=mqtt_password,
+        payload_format=payload_format
     )
     
     return device
@@ -445,6 +506,8 @@ def main():
     parser.add_argument('--devices', type=int, default=1, help='Number of devices to simulate')
     parser.add_argument('--types', type=str, default='light,thermostat,switch,sensor', 
                         help='Comma-separated list of device types to simulate')
+    parser.add_argument('--format', type=str, default='json', choices=['json', 'msgpack'],
+                        help='Payload format published by the devices')
     args = parser.parse_args()
     
     # Parse device types
@@ -460,7 +523,8 @@ def main():
                 broker_host=args.broker,
                 broker_port=args.port,
                 mqtt_username=args.username,
-                mqtt_password=args.password
+                mqtt_password=args.password,
+                payload_format=args.format
             )
             
             success = device.connect()
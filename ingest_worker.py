@@ -0,0 +1,90 @@
+"""
+Standalone MQTT ingestion worker.
+
+Joins the MQTT_SHARED_GROUP shared subscription with a unique client ID and
+writes status and telemetry to the database, so ingestion can be spread over
+several processes running next to the web app. The broker hands each message
+to exactly one member of the group.
+
+Usage:
+    python ingest_worker.py --group ingest --processes 4
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.config.database import create_db_app
+from app.config.mqtt_client import MQTT_SHARED_GROUP, init_mqtt, stop_mqtt, unique_client_id
+from app.services.device_registry import device_registry
+from app.services.spool import ingest_spool
+
+# Worker Configuration
+DEVICE_REGISTRY_REFRESH_SECONDS = int(os.getenv('DEVICE_REGISTRY_REFRESH_SECONDS', 30))
+
+
+def run_worker(group, refresh_interval, index=None):
+    """Run one ingestion worker until it receives SIGINT or SIGTERM.
+
+    `index` numbers the worker among those started by --processes.
+    """
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s [ingest {os.getpid()}] %(levelname)s %(message)s')
+
+    if ingest_spool is not None and index is not None:
+        # A spool can only be replayed by one process, so each worker keeps its own
+        ingest_spool.directory = os.path.join(ingest_spool.directory, f'worker-{index}')
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    app = create_db_app(__name__)
+    init_mqtt(app, ingest=True, shared_group=group, client_id=unique_client_id(), responses=False)
+    device_registry.start_refresh(app, refresh_interval)
+    logging.info(f"Ingestion worker joined shared group '{group}'")
+
+    stopping.wait()
+    stop_mqtt()
+    logging.info("Ingestion worker stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MQTT ingestion worker')
+    parser.add_argument('--group', default=MQTT_SHARED_GROUP or 'ingest',
+                        help='Shared subscription group (default: MQTT_SHARED_GROUP or "ingest")')
+    parser.add_argument('--processes', type=int, default=1, help='Number of worker processes to run')
+    parser.add_argument('--refresh', type=int, default=DEVICE_REGISTRY_REFRESH_SECONDS,
+                        help='Seconds between device registry reloads (0 disables them)')
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.group, args.refresh)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.group, args.refresh, index), name=f'ingest-{index}')
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def terminate(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    # Ctrl+C reaches the children directly, a SIGTERM to the parent is passed on
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
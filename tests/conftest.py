@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from flask_login import FlaskLoginClient, LoginManager
+
+# Keep the project root on sys.path, so tests can import app and benchmarks when run with `pytest tests/`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.database import db, init_db
+from app.services.device_registry import device_registry
+from app.utils.codec import FastJSONProvider
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A Flask app with the device routes on a fresh SQLite database"""
+    from app.controllers.device_controller import device_bp
+    from app.models.user import User
+
+    app = Flask('tests')
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'test'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.test_client_class = FlaskLoginClient
+    app.json = FastJSONProvider(app)
+    init_db(app)
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return db.session.get(User, int(user_id))
+
+    app.register_blueprint(device_bp)
+
+    # Forget devices registered by earlier tests
+    device_registry.warm(app)
+
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def user(app):
+    from app.models.user import User
+
+    user = User('owner', 'owner@example.com', 'password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def device(app, user):
+    from app.models.device import Device, Sensor
+
+    device = Device('device-01', 'Device 1', 'sensor', user_id=user.id)
+    db.session.add(device)
+    db.session.flush()
+    db.session.add(Sensor('device-01:temperature', 'Temperature', 'temperature', device_id=device.id))
+    db.session.commit()
+    device_registry.register(device)
+    return device
+
+
+@pytest.fixture
+def client(app, user):
+    """A test client logged in as the device owner"""
+    return app.test_client(user=user)
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.config.database import db
+from app.models.device import Sensor, SensorReading
+from app.services import archive
+from app.services.archive import ArchiveSegment, ReadingArchive, to_micros
+
+MAY = datetime(2024, 5, 1)
+JUNE = datetime(2024, 6, 1)
+
+
+def write(sensor, readings):
+    db.session.add_all(SensorReading(value=value, sensor_id=sensor.id, timestamp=timestamp)
+                       for timestamp, value in readings)
+    db.session.commit()
+
+
+@pytest.fixture
+def reading_archive(app, tmp_path):
+    reading_archive = ReadingArchive(directory=str(tmp_path), after_days=30, interval=0, delete_chunk=2)
+    reading_archive.init_app(app)
+    return reading_archive
+
+
+def test_segment_lookups_go_through_the_block_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'BLOCK_SIZE', 4)
+    timestamps = np.array([to_micros(MAY + timedelta(minutes=i // 2)) for i in range(50)], dtype=np.int64)
+    path = str(tmp_path / '202405.readings')
+    ArchiveSegment.write(path, timestamps, np.arange(50, dtype=np.float64), np.arange(50, dtype=np.int64))
+
+    segment = ArchiveSegment(path)
+
+    assert segment.count == 50 and len(segment.index) == 13
+    # Readings sharing a timestamp are all inside the bounds
+    assert segment.bounds(MAY + timedelta(minutes=3), MAY + timedelta(minutes=10)) == (6, 22)
+    assert segment.bounds(MAY + timedelta(days=1)) == (50, 50)
+
+
+def test_run_archives_whole_months_and_reads_merge_them(reading_archive, device):
+    sensor = Sensor.query.one()
+    write(sensor, [(MAY + timedelta(days=day), float(day)) for day in range(5)] + [(JUNE + timedelta(days=20), 9.0)])
+
+    result = reading_archive.run_once(now=JUNE + timedelta(days=35))
+
+    assert (result['archived'], result['segments']) == (5, 1)
+    assert [reading.value for reading in SensorReading.query.all()] == [9.0]
+    assert reading_archive.count(sensor.id) == 5
+    assert reading_archive.oldest(sensor.id) == MAY
+    readings = reading_archive.readings(sensor.id, limit=3)
+    assert [reading.value for reading in readings] == [9.0, 4.0, 3.0]
+    columns = reading_archive.columns([sensor.id])[sensor.id]
+    assert columns[1].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 9.0]
+
+
+def test_late_readings_are_merged_into_the_segment(reading_archive, device):
+    sensor = Sensor.query.one()
+    write(sensor, [(MAY + timedelta(days=2), 2.0)])
+    reading_archive.run_once(now=JUNE + timedelta(days=35))
+
+    write(sensor, [(MAY + timedelta(days=1), 1.0)])
+    reading_archive.run_once(now=JUNE + timedelta(days=35))
+
+    assert reading_archive.read(sensor.id)[1].tolist() == [1.0, 2.0]
+    assert SensorReading.query.count() == 0
+
+
+def test_readings_left_by_an_interrupted_run_are_returned_once(reading_archive, device):
+    sensor = Sensor.query.one()
+    write(sensor, [(MAY + timedelta(days=day), float(day)) for day in range(3)])
+    reading_archive.run_once(now=JUNE + timedelta(days=35))
+    # The rows are back in the database as if their delete never ran
+    write(sensor, [(MAY + timedelta(days=day), float(day)) for day in range(3)])
+    for reading, record in zip(SensorReading.query.order_by(SensorReading.timestamp), reading_archive.stream(sensor.id)):
+        reading.id = record[0]
+    db.session.commit()
+
+    assert [reading.value for reading in reading_archive.readings(sensor.id)] == [2.0, 1.0, 0.0]
+    assert reading_archive.columns([sensor.id])[sensor.id][1].tolist() == [0.0, 1.0, 2.0]
+
+
+def test_purge_removes_months_that_ended_before_the_cutoff(reading_archive, device):
+    sensor = Sensor.query.one()
+    write(sensor, [(MAY + timedelta(days=3), 1.0), (JUNE + timedelta(days=3), 2.0)])
+    reading_archive.run_once(now=JUNE + timedelta(days=65))
+
+    assert reading_archive.purge(sensor.id, JUNE + timedelta(days=10)) == 1
+    assert reading_archive.read(sensor.id)[1].tolist() == [2.0]
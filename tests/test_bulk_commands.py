@@ -0,0 +1,54 @@
+import pytest
+
+from app.controllers import device_controller
+from app.services.bulk_commands import BULK_COMMAND_RATE
+from app.services.commands import CommandTracker
+
+BULK_URL = '/device/api/devices/bulk-control'
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Record the arguments of bulk runs instead of publishing"""
+    runs = []
+
+    def run_bulk_command(targets, command, params, publish, **options):
+        runs.append(dict(options, targets=targets))
+        yield {'type': 'summary'}
+
+    monkeypatch.setattr(device_controller, 'run_bulk_command', run_bulk_command)
+    return runs
+
+
+def test_bulk_control_caps_the_rate_and_parses_wait(client, device, runs):
+    response = client.post(BULK_URL, json={
+        'command': 'power', 'filter': {'device_type': 'sensor'}, 'rate': BULK_COMMAND_RATE * 10, 'wait': 'false'
+    })
+
+    assert response.status_code == 200
+    response.get_data()
+    assert runs[0]['rate'] == BULK_COMMAND_RATE
+    assert runs[0]['wait'] is False
+    assert runs[0]['targets'] == [(device.id, 'device-01')]
+
+
+@pytest.mark.parametrize('body', [
+    {'command': 'power', 'filter': ['sensor']},
+    {'command': 'power', 'filter': {'device_type': 'sensor'}, 'rate': 0},
+    {'command': 'power', 'filter': {'device_type': 'sensor'}, 'rate': -5},
+    {'command': 'power', 'filter': {'device_type': 'sensor'}, 'timeout': 'nan'},
+    ['power'],
+])
+def test_bulk_control_rejects_invalid_requests(client, device, runs, body):
+    assert client.post(BULK_URL, json=body).status_code == 400
+    assert runs == []
+
+
+def test_latency_is_tracked_for_a_bounded_number_of_commands():
+    tracker = CommandTracker(latency_types=2)
+    for command in ('power', 'dim', 'a', 'b', 'c'):
+        pending = tracker.create('device-01', command)
+        tracker.resolve('device-01', {'command_id': pending.command_id})
+
+    assert sorted(tracker.get_stats()['by_command']) == ['dim', 'other', 'power']
+    assert tracker.get_stats()['by_command']['other']['count'] == 3
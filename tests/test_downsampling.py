@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from app.services import downsampling
+from app.services.downsampling import chart_points, downsample, lttb, minmax
+
+
+def series(count, seed=1):
+    rng = np.random.default_rng(seed)
+    timestamps = np.cumsum(rng.integers(1, 5000000, count)).astype(np.int64)
+    return timestamps, rng.normal(20.0, 3.0, count)
+
+
+def reference_lttb(x, y, max_points):
+    """Largest-Triangle-Three-Buckets written point by point"""
+    count = len(y)
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    selected = [0]
+    for bucket in range(max_points - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            following = range(edges[bucket + 1], edges[bucket + 2])
+            next_x = sum(x[i] for i in following) / len(following)
+            next_y = sum(y[i] for i in following) / len(following)
+        else:
+            next_x, next_y = x[-1], y[-1]
+        previous = selected[-1]
+        areas = [abs((x[previous] - next_x) * (y[i] - y[previous]) - (x[previous] - x[i]) * (next_y - y[previous]))
+                 for i in range(low, high)]
+        selected.append(low + int(np.argmax(areas)))
+    return selected + [count - 1]
+
+
+def test_lttb_matches_the_point_by_point_algorithm():
+    timestamps, values = series(1000)
+
+    kept = lttb(timestamps, values, 50)
+
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    assert kept.tolist() == reference_lttb(x, values, 50)
+
+
+def test_lttb_keeps_the_ends_and_a_spike():
+    timestamps = np.arange(1000, dtype=np.int64) * 1000000
+    values = np.zeros(1000)
+    values[437] = 100.0
+
+    kept = lttb(timestamps, values, 20)
+
+    assert len(kept) == 20
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 437 in kept
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    timestamps, values = series(5000, seed=7)
+
+    kept = minmax(timestamps, values, 100)
+
+    assert len(kept) <= 100
+    assert np.all(np.diff(kept) > 0)
+    assert int(np.argmin(values)) in kept and int(np.argmax(values)) in kept
+    # Every point kept is its bucket's minimum or maximum
+    buckets = (timestamps - timestamps[0]) * 50 // (int(timestamps[-1] - timestamps[0]) + 1)
+    for index in kept:
+        bucket = values[buckets == buckets[index]]
+        assert values[index] in (bucket.min(), bucket.max())
+
+
+@pytest.mark.parametrize('method', downsampling.DOWNSAMPLING_METHODS)
+def test_downsample_returns_short_series_whole(method):
+    timestamps, values = series(10)
+
+    assert downsample(timestamps, values, 10, method).tolist() == list(range(10))
+
+
+@pytest.mark.parametrize('method', downsampling.DOWNSAMPLING_METHODS)
+def test_downsample_handles_tiny_budgets(method):
+    timestamps, values = series(100)
+
+    assert downsample(timestamps, values, 1, method).tolist() == [0]
+    assert len(downsample(timestamps, values, 2, method)) <= 2
+
+
+def test_chart_points_are_clamped(monkeypatch):
+    monkeypatch.setattr(downsampling, 'CHART_MAX_POINTS', 500)
+
+    assert chart_points(0) == 1
+    assert chart_points(200) == 200
+    assert chart_points(10 ** 6) == 500
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.models.device import SensorReading
+from app.services.ingestion import TelemetryIngestor, parse_timestamp, reading_value
+
+TIMESTAMP = datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def ingestor(app):
+    # Flushed by the test rather than a writer thread
+    ingestor = TelemetryIngestor(batch_size=1000)
+    ingestor.app = app
+    return ingestor
+
+
+def test_parse_timestamp_converts_offsets_to_naive_utc():
+    assert parse_timestamp('2024-05-01T14:00:00+02:00') == TIMESTAMP
+    assert parse_timestamp('2024-05-01T12:00:00Z') == TIMESTAMP
+    assert parse_timestamp(datetime(2024, 5, 1, 7, 0, tzinfo=timezone(timedelta(hours=-5)))) == TIMESTAMP
+    assert parse_timestamp('2024-05-01T12:00:00') == TIMESTAMP
+    assert parse_timestamp(TIMESTAMP.replace(tzinfo=timezone.utc).timestamp() * 1000) == TIMESTAMP
+    assert parse_timestamp('yesterday') is None
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), float('-inf'), 10 ** 400, None, [1], 'dim'])
+def test_reading_value_rejects_what_cannot_be_stored(value):
+    assert reading_value(value) is None
+
+
+def test_reading_value_converts_numbers_and_states():
+    assert reading_value(3) == 3.0
+    assert reading_value(True) == 1.0
+    assert reading_value('OFF') == 0.0
+
+
+def test_flush_writes_submitted_readings(ingestor, device):
+    submitted = ingestor.submit('device-01', {
+        'timestamp': '2024-05-01T12:00:00Z',
+        'readings': {'temperature': 21.5, 'humidity': float('nan')}
+    })
+
+    assert submitted == 1
+    assert ingestor.flush() == 1
+    reading = SensorReading.query.one()
+    assert (reading.value, reading.timestamp) == (21.5, TIMESTAMP)
+
+
+def test_flush_drops_only_the_rows_the_database_rejects(ingestor, device):
+    ingestor.submit('device-01', {'timestamp': TIMESTAMP.isoformat(), 'readings': {'temperature': 20.0}})
+    # A value that got past validation and violates the NOT NULL column
+    ingestor._pending.append(('device-01', 'temperature', None, TIMESTAMP))
+    ingestor.submit('device-01', {'timestamp': TIMESTAMP.isoformat(), 'readings': {'temperature': 22.0}})
+
+    assert ingestor.flush() == 2
+    assert ingestor.pending() == 0
+    assert ingestor.stats.rejected == 1
+    assert sorted(reading.value for reading in SensorReading.query.all()) == [20.0, 22.0]
+    # Nothing left behind to fail the next flush
+    assert ingestor.flush() == 0
+
+
+def test_flush_requeues_the_batch_after_a_transient_error(ingestor, device, monkeypatch):
+    ingestor.submit('device-01', {'timestamp': TIMESTAMP.isoformat(), 'readings': {'temperature': 20.0}})
+
+    def locked(batch):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(ingestor, '_write', locked)
+    with pytest.raises(OperationalError):
+        ingestor.flush()
+    assert ingestor.pending() == 1
+    assert ingestor.stats.failed_flushes == 1
+
+    monkeypatch.undo()
+    assert ingestor.flush() == 1
+    assert SensorReading.query.count() == 1
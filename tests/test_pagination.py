@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config.database import db
+from app.models.device import Device, Sensor, SensorReading
+from app.utils import pagination
+from app.utils.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, page_size
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def pages(client, url, **params):
+    """Follow next-page cursors from `url`, returning every page's JSON body"""
+    bodies = []
+    while True:
+        response = client.get(url, query_string=params)
+        assert response.status_code == 200
+        bodies.append(response.get_json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return bodies
+        params['cursor'] = cursor
+
+
+@pytest.fixture
+def readings(device):
+    """Seven readings, three of them sharing a timestamp"""
+    sensor = Sensor.query.one()
+    timestamps = [START, START + timedelta(seconds=1), START + timedelta(seconds=1), START + timedelta(seconds=1),
+                  START + timedelta(seconds=2), START + timedelta(seconds=3), START + timedelta(seconds=4)]
+    db.session.add_all(SensorReading(value=float(i), sensor_id=sensor.id, timestamp=timestamp)
+                       for i, timestamp in enumerate(timestamps))
+    db.session.commit()
+    return sensor
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(START, 42)) == (START, 42)
+    for cursor in ('not a cursor', encode_cursor(START, 42)[:-3], '!!'):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_page_size_is_clamped():
+    assert page_size(None, 100) == 100
+    assert page_size(0, 100) == 1
+    assert page_size(10 ** 9, 100) == pagination.MAX_PAGE_SIZE
+
+
+def test_readings_limit_is_capped(client, readings, monkeypatch):
+    monkeypatch.setattr(pagination, 'MAX_PAGE_SIZE', 4)
+
+    response = client.get(f'/device/api/sensors/{readings.id}/readings', query_string={'limit': 1000})
+
+    assert len(response.get_json()) == 4
+    assert response.headers.get(NEXT_CURSOR_HEADER)
+
+
+def test_reading_pages_cover_tied_timestamps_once(client, readings):
+    bodies = pages(client, f'/device/api/sensors/{readings.id}/readings', limit=2)
+
+    assert [len(body) for body in bodies] == [2, 2, 2, 1]
+    values = [reading['value'] for body in bodies for reading in body]
+    # Newest first, and readings sharing a timestamp by descending id
+    assert values == [6.0, 5.0, 4.0, 3.0, 2.0, 1.0, 0.0]
+
+
+def test_device_pages_cover_devices_created_together(client, user):
+    for i in range(5):
+        device = Device(f'device-{i:02d}', f'Device {i}', 'light', user_id=user.id)
+        device.created_at = START
+        db.session.add(device)
+    db.session.commit()
+
+    bodies = pages(client, '/device/api/devices', limit=2, fields='device_id')
+
+    assert [device['device_id'] for body in bodies for device in body] == [f'device-{i:02d}' for i in range(5)]
+
+
+def test_invalid_cursor_is_rejected(client, readings):
+    response = client.get(f'/device/api/sensors/{readings.id}/readings', query_string={'cursor': 'garbage'})
+
+    assert response.status_code == 400
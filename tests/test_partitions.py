@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect
+
+from app.config.database import db
+from app.models.device import Sensor
+from app.services.partitions import ReadingPartitions
+
+DAY = datetime(2024, 5, 1)
+
+
+@pytest.fixture
+def partitions(app):
+    return ReadingPartitions('day', refresh=0)
+
+
+def insert(partitions, sensor, days):
+    partitions.insert([{'sensor_id': sensor.id, 'value': float(day), 'timestamp': DAY + timedelta(days=day, hours=6)}
+                       for day in days])
+    db.session.commit()
+
+
+def partition_tables():
+    return sorted(name for name in inspect(db.engine).get_table_names() if name.startswith('sensor_readings_p'))
+
+
+def test_readings_go_to_one_table_per_day(partitions, device):
+    sensor = Sensor.query.one()
+    insert(partitions, sensor, [0, 1, 2])
+
+    assert partition_tables() == ['sensor_readings_p20240501', 'sensor_readings_p20240502', 'sensor_readings_p20240503']
+    # Range reads only touch the overlapping partitions
+    assert len(partitions.tables(DAY + timedelta(days=1), DAY + timedelta(days=1, hours=12))) == 1
+    Reading = partitions.readings(DAY + timedelta(days=1), DAY + timedelta(days=3))
+    assert sorted(value for value, in db.session.query(Reading.value)) == [1.0, 2.0]
+    # Ids stay unique across partitions
+    assert len({row.id for row in db.session.query(partitions.readings().id)}) == 3
+
+
+def test_drop_before_removes_expired_partitions(partitions, device):
+    sensor = Sensor.query.one()
+    insert(partitions, sensor, [0, 1, 2])
+
+    assert partitions.drop_before(DAY + timedelta(days=2)) == ['sensor_readings_p20240501', 'sensor_readings_p20240502']
+    assert partition_tables() == ['sensor_readings_p20240503']
+    assert [value for value, in db.session.query(partitions.readings().value)] == [2.0]
+
+
+def test_writer_recreates_a_partition_another_process_dropped(partitions, device):
+    sensor = Sensor.query.one()
+    insert(partitions, sensor, [0])
+    # A second manager still lists the partition after the first one dropped it
+    other = ReadingPartitions('day', refresh=3600)
+    other.load()
+    partitions.drop_before(DAY + timedelta(days=1))
+
+    insert(other, sensor, [0])
+
+    assert partition_tables() == ['sensor_readings_p20240501']
+    assert [value for value, in db.session.query(partitions.readings().value)] == [0.0]
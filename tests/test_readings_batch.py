@@ -0,0 +1,61 @@
+import json
+
+from app.models.device import Sensor, SensorReading
+
+BATCH_URL = '/device/api/readings/batch'
+
+
+def post_batch(client, items):
+    # Python's encoder writes NaN and Infinity literals, as some device firmware does
+    return client.post(BATCH_URL, data=json.dumps({'readings': items}), content_type='application/json')
+
+
+def test_batch_rejects_invalid_items_individually(client, device):
+    sensor = Sensor.query.one()
+    response = post_batch(client, [
+        {'sensor_id': sensor.id, 'value': 21.5},
+        {'sensor_id': sensor.id, 'value': float('nan')},
+        {'sensor_id': sensor.id, 'value': float('inf')},
+        {'sensor_id': sensor.id},
+        {'sensor_id': str(sensor.id), 'value': 1},
+        {'sensor_id': sensor.id + 100, 'value': 1},
+        {'sensor_id': sensor.id, 'value': 1, 'timestamp': 'yesterday'},
+        {'sensor_id': sensor.id, 'value': 'on', 'timestamp': '2024-05-01T14:00:00+02:00'},
+    ])
+
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['accepted'] == 2
+    assert [(error['index'], error['error']) for error in body['errors']] == [
+        (1, 'Invalid value'),
+        (2, 'Invalid value'),
+        (3, 'Missing required field: sensor_id or value'),
+        (4, 'Invalid sensor_id'),
+        (5, 'Sensor not found'),
+        (6, 'Invalid timestamp'),
+    ]
+    assert sorted(reading.value for reading in SensorReading.query.all()) == [1.0, 21.5]
+
+
+def test_batch_without_valid_items_is_rejected(client, device):
+    sensor = Sensor.query.one()
+    response = post_batch(client, [{'sensor_id': sensor.id, 'value': float('-inf')}])
+
+    assert response.status_code == 400
+    assert response.get_json()['rejected'] == 1
+    assert SensorReading.query.count() == 0
+
+
+def test_batch_keeps_the_order_of_untimed_readings(client, device):
+    sensor = Sensor.query.one()
+    post_batch(client, [{'sensor_id': sensor.id, 'value': value} for value in range(5)])
+
+    readings = SensorReading.query.order_by(SensorReading.timestamp).all()
+    assert [reading.value for reading in readings] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert len({reading.timestamp for reading in readings}) == 5
+
+
+def test_batch_requires_a_list(client, device):
+    response = client.post(BATCH_URL, json={'readings': {'sensor_id': 1}})
+
+    assert response.status_code == 400
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+from flask_socketio import SocketIO
+
+from app.services.realtime import (ALL_DEVICES_ROOM, EmissionScheduler, device_room, subscribe_device,
+                                   subscribe_devices, unsubscribe_device, unsubscribe_devices, user_room)
+
+
+class RecordingSocketIO:
+    """Stands in for the Socket.IO server, recording what is emitted to which room"""
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, namespace=None, to=None):
+        self.emitted.append((to, event, data))
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = EmissionScheduler(max_fps=4, telemetry_batch=2)
+    # Flushed by the test rather than a background task
+    scheduler.socketio = RecordingSocketIO()
+    return scheduler
+
+
+def test_flush_sends_one_frame_per_room(scheduler, device):
+    scheduler.schedule('device_status', 'device-01', {'status': 'online'})
+    scheduler.schedule('device_status', 'device-01', {'status': 'offline'})
+    for seq in range(3):
+        scheduler.schedule('device_telemetry', 'device-01', {'seq': seq})
+    scheduler.schedule('device_status', 'unknown-device', {'status': 'online'})
+
+    assert scheduler.flush() == 4
+    frames = {room: (event, data) for room, event, data in scheduler.socketio.emitted}
+    assert len(frames) == len(scheduler.socketio.emitted)
+
+    owner_frame = frames[user_room(device.user_id)]
+    assert owner_frame[0] == 'device_batch'
+    assert [(update['event'], update['data']) for update in owner_frame[1]['events']] == [
+        ('device_status', {'status': 'offline'}),
+        ('device_telemetry', {'seq': 1}),
+        ('device_telemetry', {'seq': 2}),
+    ]
+    assert frames[device_room('device-01')] == owner_frame
+    assert frames[device_room('unknown-device')] == (
+        'device_status', {'device_id': 'unknown-device', 'data': {'status': 'online'}}
+    )
+    # The room for all devices gets both devices in its single frame
+    assert len(frames[ALL_DEVICES_ROOM][1]['events']) == 4
+    assert scheduler.get_stats()['superseded'] == 2
+
+
+def test_flush_without_pending_events_sends_nothing(scheduler):
+    assert scheduler.flush() == 0
+    assert scheduler.socketio.emitted == []
+
+
+@pytest.fixture
+def socketio_client(app, device):
+    """A Socket.IO test client whose handlers subscribe on behalf of the device owner"""
+    socketio = SocketIO(app)
+    owner = SimpleNamespace(id=device.user_id, is_admin=False)
+    socketio.on_event('subscribe_device', lambda data: subscribe_device(owner, data['device_id']))
+    socketio.on_event('unsubscribe_device', lambda data: unsubscribe_device(data['device_id']))
+    socketio.on_event('subscribe_devices', lambda: subscribe_devices(owner))
+    socketio.on_event('unsubscribe_devices', lambda: unsubscribe_devices(owner))
+
+    scheduler = EmissionScheduler(max_fps=4)
+    scheduler.socketio = socketio
+    client = socketio.test_client(app)
+    return scheduler, client
+
+
+def received(scheduler, client):
+    scheduler.schedule('device_status', 'device-01', {'status': 'online'})
+    scheduler.flush()
+    return [message['name'] for message in client.get_received()]
+
+
+def test_client_in_device_and_devices_rooms_receives_each_frame_once(socketio_client):
+    scheduler, client = socketio_client
+
+    client.emit('subscribe_device', {'device_id': 'device-01'})
+    assert received(scheduler, client) == ['device_status']
+
+    client.emit('subscribe_devices')
+    assert received(scheduler, client) == ['device_status']
+
+    # Subscribing to the device again while in the devices room joins nothing more
+    client.emit('subscribe_device', {'device_id': 'device-01'})
+    assert received(scheduler, client) == ['device_status']
+
+    # The single-device subscription is back in effect after leaving the devices room
+    client.emit('unsubscribe_devices')
+    assert received(scheduler, client) == ['device_status']
+
+    client.emit('unsubscribe_device', {'device_id': 'device-01'})
+    assert received(scheduler, client) == []
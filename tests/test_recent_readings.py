@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config.database import db
+from app.models.device import Sensor, SensorReading
+from app.services.recent_readings import RecentReadings, recent_readings
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def written(device):
+    """Five readings a minute apart, written to the database"""
+    sensor = Sensor.query.one()
+    readings = [SensorReading(value=float(i), sensor_id=sensor.id, timestamp=START + timedelta(minutes=i))
+                for i in range(5)]
+    db.session.add_all(readings)
+    db.session.commit()
+    return sensor, [{'id': reading.id, 'sensor_id': sensor.id, 'value': reading.value,
+                     'timestamp': reading.timestamp} for reading in readings]
+
+
+def test_buffer_is_opt_in():
+    # Several web workers each write readings, so no process turns it on by itself
+    assert not recent_readings.enabled
+
+
+def test_ring_answers_what_it_holds(written):
+    sensor, rows = written
+    buffer = RecentReadings(per_sensor=3, max_mb=1)
+    buffer.enable()
+    # The ring only vouches for readings written after the first batch it sees
+    buffer.extend(rows[:1])
+    buffer.extend(rows[1:])
+
+    latest = buffer.readings(sensor.id, limit=2)
+    assert [reading.value for reading in latest] == [4.0, 3.0]
+    covered = buffer.readings(sensor.id, start=START + timedelta(minutes=3))
+    assert [reading.value for reading in covered] == [4.0, 3.0]
+    assert buffer.hits == 2
+
+
+def test_ring_falls_back_to_the_database_before_its_floor(written):
+    sensor, rows = written
+    buffer = RecentReadings(per_sensor=3, max_mb=1)
+    buffer.enable()
+    buffer.extend(rows[:1])
+    buffer.extend(rows[1:])
+
+    assert [reading.value for reading in buffer.readings(sensor.id)] == [4.0, 3.0, 2.0, 1.0, 0.0]
+    ascending = buffer.readings(sensor.id, start=START, descending=False)
+    assert [reading.value for reading in ascending] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert buffer.partial_hits == 2
+
+
+def test_disabled_buffer_reads_the_database(written):
+    sensor, rows = written
+    buffer = RecentReadings(per_sensor=3, max_mb=1)
+    buffer.extend(rows)
+
+    assert [reading.value for reading in buffer.readings(sensor.id, limit=2)] == [4.0, 3.0]
+    assert buffer.get_stats()['sensors'] == 0
+    assert buffer.misses == 1
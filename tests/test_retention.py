@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config.database import db
+from app.models.device import RetentionPolicy, Sensor, SensorReading, SensorRollup
+from app.services.retention import RetentionPurger, resolve_retention
+from app.services.rollups import apply_rollups, backfill_window, retained_since
+
+DAY = datetime(2024, 5, 1)
+
+
+def write(sensor, readings, rollups=True):
+    """Store (timestamp, value) readings for a sensor, with their rollups unless told otherwise"""
+    db.session.add_all(SensorReading(value=value, sensor_id=sensor.id, timestamp=timestamp)
+                       for timestamp, value in readings)
+    if rollups:
+        apply_rollups((sensor.id, value, timestamp) for timestamp, value in readings)
+    db.session.commit()
+
+
+def rollup(sensor, resolution, bucket):
+    return db.session.get(SensorRollup, (sensor.id, resolution, bucket))
+
+
+@pytest.fixture
+def purger(app):
+    purger = RetentionPurger(interval=0, chunk_size=2, chunk_pause_ms=0)
+    purger.init_app(app)
+    return purger
+
+
+def test_most_specific_policy_wins():
+    policies = {
+        (1, None): RetentionPolicy(device_id=1, raw_days=7),
+        (None, 'temperature'): RetentionPolicy(sensor_type='temperature', raw_days=30, rollup_1m_days=60),
+    }
+
+    assert resolve_retention(policies, 1, 'temperature')['raw'] == 7
+    assert resolve_retention(policies, 2, 'temperature')['1m'] == 60
+    assert resolve_retention(policies, 2, 'humidity')['raw'] == 0
+
+
+def test_purge_deletes_expired_readings_in_chunks(purger, device):
+    sensor = Sensor.query.one()
+    # More readings share the oldest timestamp than fit in one chunk
+    write(sensor, [(DAY, float(i)) for i in range(5)] + [(DAY + timedelta(days=2), 9.0)])
+    db.session.add(RetentionPolicy(device_id=device.id, raw_days=1, rollup_1m_days=1))
+    db.session.commit()
+
+    result = purger.run_once(now=DAY + timedelta(days=2, hours=12))
+
+    assert result['purged']['raw'] == 5
+    assert result['purged']['1m'] == 1
+    assert purger.chunks == 4
+    assert [reading.value for reading in SensorReading.query.all()] == [9.0]
+    # Rollups without a retention period are kept
+    assert rollup(sensor, '1d', DAY).count == 5
+
+
+def test_backfill_keeps_rollups_of_purged_readings(purger, device):
+    sensor = Sensor.query.one()
+    write(sensor, [
+        (DAY + timedelta(hours=10, seconds=30), 1.0),
+        (DAY + timedelta(hours=10, seconds=45), 2.0),
+        (DAY + timedelta(hours=12), 3.0),
+        (DAY + timedelta(days=1, hours=6), 4.0),
+    ])
+    db.session.add(RetentionPolicy(device_id=device.id, raw_days=1))
+    db.session.commit()
+    purger.run_once(now=DAY + timedelta(days=1, hours=11))
+    assert SensorReading.query.count() == 2
+
+    retained = retained_since()
+    assert retained == {sensor.id: DAY + timedelta(hours=12)}
+    for _ in range(2):
+        backfill_window(DAY, DAY + timedelta(days=1), retained=retained)
+        backfill_window(DAY + timedelta(days=1), DAY + timedelta(days=2))
+
+    # Buckets holding purged readings keep what they summarized
+    assert rollup(sensor, '1d', DAY).count == 3
+    assert rollup(sensor, '1h', DAY + timedelta(hours=10)).sum_value == 3.0
+    # Buckets after the oldest stored reading are rebuilt, once however often the backfill runs
+    assert rollup(sensor, '1h', DAY + timedelta(hours=12)).count == 1
+    assert rollup(sensor, '1d', DAY + timedelta(days=1)).count == 1
+
+
+def test_backfill_adds_rollups_for_readings_stored_without_them(device):
+    sensor = Sensor.query.one()
+    write(sensor, [(DAY + timedelta(hours=8, minutes=13, seconds=27), 1.0), (DAY + timedelta(hours=9), 5.0)],
+          rollups=False)
+
+    assert backfill_window(DAY, DAY + timedelta(days=1)) == 2
+
+    day = rollup(sensor, '1d', DAY)
+    assert (day.count, day.min_value, day.max_value, day.last_value) == (2, 1.0, 5.0, 5.0)
+    assert rollup(sensor, '1m', DAY + timedelta(hours=8, minutes=13)).count == 1
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.config.database import db
+from app.models.device import Sensor, SensorRollup
+from app.services.rollups import aggregate, apply_rollups, rollup_resolution
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def test_aggregate_builds_minute_hour_and_day_buckets():
+    buckets = aggregate([
+        (1, 5.0, START + timedelta(seconds=10)),
+        (1, 2.0, START + timedelta(seconds=50)),
+        (1, 7.0, START + timedelta(minutes=1)),
+    ])
+
+    assert buckets[(1, '1m', START)] == [2, 2.0, 5.0, 7.0, 2.0, START + timedelta(seconds=50)]
+    assert buckets[(1, '1h', START)] == [3, 2.0, 7.0, 14.0, 7.0, START + timedelta(minutes=1)]
+    assert buckets[(1, '1d', START.replace(hour=0))][0] == 3
+
+
+def test_apply_rollups_merges_into_existing_buckets(device):
+    sensor = Sensor.query.one()
+    apply_rollups([(sensor.id, 4.0, START + timedelta(seconds=30)), (sensor.id, 6.0, START + timedelta(seconds=40))])
+    db.session.commit()
+    # A late reading updates the aggregates but not the last value
+    apply_rollups([(sensor.id, 1.0, START + timedelta(seconds=5))])
+    db.session.commit()
+
+    minute = db.session.get(SensorRollup, (sensor.id, '1m', START))
+    assert (minute.count, minute.min_value, minute.max_value, minute.sum_value) == (3, 1.0, 6.0, 11.0)
+    assert (minute.last_value, minute.last_timestamp) == (6.0, START + timedelta(seconds=40))
+    assert SensorRollup.query.filter_by(sensor_id=sensor.id).count() == 3
+
+
+def test_rollup_resolution_fits_the_point_budget():
+    assert rollup_resolution(START, START + timedelta(hours=2), max_points=1000) == '1m'
+    assert rollup_resolution(START, START + timedelta(days=30), max_points=1000) == '1h'
+    assert rollup_resolution(START, START + timedelta(days=3650), max_points=1000) == '1d'
+
+
+def test_deleting_a_device_deletes_rollups_without_loading_them(app, client, device):
+    sensor = Sensor.query.one()
+    apply_rollups((sensor.id, float(i), START + timedelta(minutes=i)) for i in range(120))
+    db.session.commit()
+    db.session.expire_all()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert client.delete(f'/device/api/devices/{device.id}').status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert SensorRollup.query.count() == 0
+    assert not [statement for statement in statements
+                if statement.lstrip().upper().startswith('SELECT') and 'sensor_rollups' in statement]
@@ -0,0 +1,91 @@
+"""
+Shared subscription delivery, checked against the in-process stand-in broker
+from benchmarks/shared_subscriptions.py
+"""
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from app.config.mqtt_client import subscription_topics, unique_client_id
+from app.utils import codec
+from benchmarks.shared_subscriptions import StubBroker
+
+WORKERS = 3
+MESSAGES = 300
+TIMEOUT = 10.0
+
+
+@pytest.fixture
+def broker():
+    broker = StubBroker()
+    broker.start()
+    yield broker
+    broker.stop()
+
+
+def subscriber(port, topics):
+    """Connect a client subscribed to `topics`, returning it and the list of sequence numbers it receives"""
+    sequences = []
+    subscribed = threading.Event()
+    acknowledged = []
+
+    def on_connect(client, userdata, flags, rc):
+        for topic in topics:
+            client.subscribe(topic)
+
+    def on_subscribe(client, userdata, mid, granted_qos):
+        acknowledged.append(mid)
+        if len(acknowledged) == len(topics):
+            subscribed.set()
+
+    def on_message(client, userdata, msg):
+        sequences.append(codec.loads(msg.payload)['seq'])
+
+    client = mqtt.Client(client_id=unique_client_id())
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_message = on_message
+    client.connect('127.0.0.1', port)
+    client.loop_start()
+    assert subscribed.wait(TIMEOUT), 'subscription was not acknowledged'
+    return client, sequences
+
+
+def publish(port, count):
+    """Publish `count` telemetry messages numbered from 0"""
+    publisher = mqtt.Client(client_id=unique_client_id('shared-test-publisher'))
+    publisher.connect('127.0.0.1', port)
+    publisher.loop_start()
+    for seq in range(count):
+        payload = codec.dumps({'seq': seq, 'readings': {'temperature': 21.5}})
+        publisher.publish(f'devices/device-{seq % 10:02d}/telemetry', payload)
+    return publisher
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline and not condition():
+        time.sleep(0.02)
+
+
+def test_shared_group_splits_messages_without_duplicates(broker):
+    members = [subscriber(broker.port, subscription_topics('ingest', ingest=True, responses=False))
+               for _ in range(WORKERS)]
+    direct_client, direct = subscriber(broker.port, subscription_topics('ingest', ingest=False, responses=False))
+
+    publisher = publish(broker.port, MESSAGES)
+    wait_for(lambda: sum(len(sequences) for _, sequences in members) >= MESSAGES and len(direct) >= MESSAGES)
+    # Give duplicates, if any, a moment to arrive
+    time.sleep(0.2)
+
+    publisher.loop_stop()
+    direct_client.loop_stop()
+    for client, _ in members:
+        client.loop_stop()
+
+    received = [seq for _, sequences in members for seq in sequences]
+    assert sorted(received) == list(range(MESSAGES))
+    assert all(sequences for _, sequences in members)
+    assert sorted(direct) == list(range(MESSAGES))
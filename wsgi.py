@@ -14,6 +14,8 @@ from app.controllers.auth_controller import auth_bp
 from app.controllers.device_controller import device_bp
 from app.controllers.dashboard_controller import dashboard_bp
 from app.config.database import init_db, db
+from app.utils.codec import FastJSONProvider
+from app.services.realtime import SOCKETIO_MESSAGE_QUEUE
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -21,8 +23,12 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev_key_change_in_production
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///iot_controller.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Serve API responses through the fast JSON codec
+app.json = FastJSONProvider(app)
+
 # Initialize extensions
-socketio = SocketIO(app)
+# The message queue lets a separate ingestion service emit to this app's clients
+socketio = SocketIO(app, message_queue=SOCKETIO_MESSAGE_QUEUE or None)
 init_db(app)
 
 # Initialize login manager
@@ -54,7 +60,12 @@ def internal_server_error(e):
     return render_template('errors/500.html'), 500
 
 # MQTT connection and event handlers
-from app.config.mqtt_client import mqtt_client, handle_mqtt_message
+from app.config.mqtt_client import handle_mqtt_message, init_mqtt
+init_mqtt(app, socketio)
+from app.services.stats import dashboard_stats
+dashboard_stats.init_app(app)
+from app.services.realtime import (can_access_device, subscribe_device, subscribe_devices, unsubscribe_device,
+                                   unsubscribe_devices)
 
 # Socket.IO event handlers
 @socketio.on('connect')
@@ -67,6 +78,42 @@ def handle_disconnect():
     if current_user.is_authenticated:
         print(f"User {current_user.username} disconnected")
 
+@socketio.on('subscribe_device')
+def handle_subscribe_device(data):
+    """Receive events for a single device"""
+    if not current_user.is_authenticated:
+        return {'error': 'Unauthorized'}
+    
+    device_id = (data or {}).get('device_id')
+    if not can_access_device(current_user, device_id):
+        return {'error': 'Unauthorized'}
+    
+    subscribe_device(current_user, device_id)
+    return {'message': f'Subscribed to device {device_id}'}
+
+@socketio.on('unsubscribe_device')
+def handle_unsubscribe_device(data):
+    """Stop receiving events for a single device"""
+    device_id = (data or {}).get('device_id')
+    unsubscribe_device(device_id)
+    return {'message': f'Unsubscribed from device {device_id}'}
+
+@socketio.on('subscribe_devices')
+def handle_subscribe_devices():
+    """Receive events for every device the user can see"""
+    if not current_user.is_authenticated:
+        return {'error': 'Unauthorized'}
+    
+    subscribe_devices(current_user)
+    return {'message': 'Subscribed to devices'}
+
+@socketio.on('unsubscribe_devices')
+def handle_unsubscribe_devices():
+    """Stop receiving events for the user's devices"""
+    if current_user.is_authenticated:
+        unsubscribe_devices(current_user)
+    return {'message': 'Unsubscribed from devices'}
+
 # Run the application
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=True) 
\ No newline at end of file